@@ -22,6 +22,13 @@ PLOT_COUNTERCLOCKWIZE_COLOR					= 'g'
 PROC_RESULTS_POLL_PERIOD					= 1			# Second
 PROC_MAX_RESULTS_POLLS						= 60/PROC_RESULTS_POLL_PERIOD		# Max polling time to get one new result before timeout
 PROCESSES_CENTROID_QUEUE_TIMEOUT 			= 10 		# nb seconds max wait to retrieve an image from the queue
+PROCESSES_FRAME_JOB							= "FRAME_JOB"	# Identifies a centroid queue entry referencing a shared memory frame
+PROCESSES_TASK_JOB							= "TASK_JOB"	# Identifies a centroid queue entry running a function, as the per slot model computations
+PROC_FRAME_BUFFER_NB_FRAMES					= 8				# Number of shared memory frames between the cameras and the centroid processes
+PROC_FRAME_BUFFER_TIMEOUT					= 10			# nb seconds max wait to get a free shared memory frame
+PROC_TASK_TIMEOUT							= 600			# nb seconds max wait for the result of a computation task run by the centroid processes
+PROC_RESULT_TABLE_CAPACITY					= 2**18			# Initial number of rows of the shared result table, it is grown for the runs with more centroid results
+PROC_RESULT_TABLE_NAME_LENGTH				= 64			# Max length of the name of the shared memory segment of the result table
 
 CALIB_ALPHA_INDEX							= 0
 CALIB_BETA_INDEX							= 1
@@ -29,8 +36,15 @@ CALIB_CHECK_PROCESSES_COMPLETION_INTERVAL	= 1		# [s]
 CALIB_MAX_ITER_FOR_OUTLIERS_DETECTION		= 5
 CALIB_CALC_MIN_ZSCORE_OUTLIER				= 5 	# Number of standard deviation for considering a point as outlier
 CALIB_CALC_MIN_ERROR_OUTLIER 				= 20 	# [um] minimal eccentricity needed to even check the Z score before flagging a point as outiler
+CALIB_ONLINE_MIN_POINTS						= 10 	# Number of centroids needed before fitting a circle of the online model
+CALIB_ONLINE_MIN_REPETITIONS				= 2 	# Number of repetitions before the online model of a slot can be considered converged
+CALIB_ONLINE_CONVERGENCE_TOLERANCE			= 2 	# [um] max change of the online model between two repetitions to consider it converged
+CALIB_ONLINE_FAILURE_MARGIN					= 3 	# Factor of the requirements above which the online model flags a slot as failing
+CALIB_ONLINE_MAX_MISSING_RATE				= 0.2 	# Max ratio of centroids not found before the online model flags a slot as failing
 POS_SHIPPING_ANGLE_ALPHA					= 30 	# [°]
 POS_SHIPPING_ANGLE_BETA 					= 30 	# [°]
+POS_STATUS_POLLING_ENABLE					= True 	# Wait for the end of the moves by polling the positioners status
+POS_STATUS_POLLING_PERIOD					= 0.005 	# [s]
 
 MM_IMG_ID_BITS_FOR_CENTROID_TYPE			= 1
 MM_IMG_ID_BITS_FOR_DIRECTION				= 1
@@ -39,12 +53,15 @@ MM_IMG_ID_BITS_FOR_STEP						= 16
 MM_IMG_ID_BITS_FOR_REPETITION				= 8
 MM_IMG_ID_BITS_FOR_STARTING_POINT			= 8
 MM_IMG_ID_BITS_FOR_BENCH_SLOT				= 8
+MM_IMG_ID_NB_FIELDS							= 7				# benchSlot, repetition, startingPoint, axis, step, direction, centroidType
 MM_IMG_ID_XY_IDENTIFIER						= 0
 MM_IMG_ID_TILT_IDENTIFIER					= 1
 MM_IMG_ID_CLOCKWIZE_DIR_IDENTIFIER			= 1
 MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER	= 0
 MM_MODEL_FIT_OPT_TOLERANCE					= 1e-5
 MM_MODEL_FIT_OPT_MAX_F_EV	 				= 10000
+MM_CIRCLE_FIT_NEWTON_ITERATIONS				= 20			# Maximal Newton iterations of the algebraic circle fit
+MM_CIRCLE_FIT_NEWTON_TOLERANCE				= 1e-12			# Relative step of the Newton iterations at convergence
 
 PLOT_FUNC_ID								= 0
 PLOT_TITLE_ID								= 1
@@ -157,6 +174,28 @@ CC_COMPUTATION_PIXEL_TOLERANCE_XY 			= 1			# pixel precision required to conside
 CC_COMPUTATION_PIXEL_TOLERANCE_TILT 		= 5			# pixel precision required to consider crop didn't move. minimum is 1.
 CC_OPTIMIZER_TOLERANCE_XY					= 1e-30
 CC_OPTIMIZER_TOLERANCE_TILT					= 1e-10
+CC_SPOT_FIT_FIXED_EXPONENT					= None			# super-gaussian exponent n of the spot fits, None to fit it
+CC_SPOT_FIT_WARM_START						= True			# seed the fit of a slot with its previous solution
+CC_SPOT_FIT_MAX_EVALUATIONS					= 1000			# maximal number of model evaluations of a single spot fit
+CC_CENTROID_MODE_FIT						= 'fit'			# full super-gaussian fit of every spot
+CC_CENTROID_MODE_CENTER_OF_MASS				= 'centerOfMass'	# windowed center of mass, full fit on fallback
+CC_CENTROID_MODE_QUADRATIC_PEAK				= 'quadraticPeak'	# quadratic peak interpolation, full fit on fallback
+CC_CENTROID_DEFAULT_MODE					= CC_CENTROID_MODE_FIT
+CC_FAST_CENTROID_ITERATIONS					= 3				# number of recentering of the center of mass window
+CC_FAST_CENTROID_WINDOW_SIGMA				= 3				# half size of the center of mass window, in spot widths
+CC_FAST_CENTROID_WIDTH_TOLERANCE			= 0.2			# maximal relative change of the estimated width since the last full fit of the slot
+CC_FAST_CENTROID_MAX_RESIDUAL				= 0.02			# maximal RMS residual of the fast estimate, relative to the saturation level
+CC_PREDICTION_WINDOW_ENABLE					= True			# detect the spots in a window around their predicted position when it is known
+CC_PREDICTION_WINDOW_INITIAL_SIZE			= 64			# size of the first detection window, in pixels
+CC_PREDICTION_WINDOW_GROWTH					= 2				# growth factor of the detection window when no spot is found in it
+CC_MULTI_SPOT_EXTRACTION_ENABLE				= True			# extract the spots searched in the whole frame in one labeling pass
+CC_BATCH_LM_MAX_ITERATIONS					= 100			# maximal number of Levenberg-Marquardt iterations of the batch centroid fit
+CC_BATCH_LM_INITIAL_DAMPING					= 1e-3			# initial Levenberg-Marquardt damping of each spot
+CC_BATCH_LM_DAMPING_DECREASE				= 0.1			# damping factor applied after an accepted step
+CC_BATCH_LM_DAMPING_INCREASE				= 10			# damping factor applied after a rejected step
+CC_BATCH_LM_MAX_DAMPING						= 1e10			# a spot is considered converged above this damping
+CC_BATCH_LM_PARAMETER_TOLERANCE				= 1.49012e-8	# relative step size under which a spot is considered converged (leastsq xtol)
+CC_BATCH_LM_REGULARIZATION					= 1e-12			# added to the normal equations diagonal to keep them invertible
 
 PC_IMAGE_TIMEOUT							= 500					# [ms]
 PC_CONNECT_ANY_CAMERA_ID					= 'any'					
@@ -165,7 +204,16 @@ PC_CAMERA_TYPE_TILT							= 'Tilt'				# Name of the XY test setup
 PC_CAMERA_XY_NB_IMAGES_PER_POINT			= 1						# Number of images taken for the XY bench (small centroids)
 PC_CAMERA_TILT_NB_IMAGES_PER_POINT			= 4						# Number of images taken for the Tilt bench (big centroids)
 PC_CAMERA_MAX_INTENSITY_RAW					= 2**8-1				# Maximal raw intensity of the camera
+PC_CAMERA_ACCUMULATOR_TYPE					= np.uint32		# Integer type in which the grabbed images are summed
 PC_CAMERA_PIXEL_FORMAT						= 'Mono8'				# Number if bits per pixel setting of the camera
+PC_CAMERA_SYNTHETIC_WIDTH					= 5472					# [px] sensor size of the synthetic cameras
+PC_CAMERA_SYNTHETIC_HEIGHT					= 3648					# [px]
+PC_CAMERA_SYNTHETIC_FRAME_RATE				= 17					# [Hz] maximal frame rate of the synthetic cameras
+PC_CAMERA_SYNTHETIC_SCALE_FACTOR			= 0.01					# [mm/px] scale of the synthetic cameras without distortion file
+PC_CAMERA_SYNTHETIC_SPOT_WIDTH				= 4						# [px] standard deviation of the synthetic spots
+PC_CAMERA_SYNTHETIC_SPOT_EXTENT				= 5						# Synthetic spots are rendered up to this number of spot widths from their center
+PC_CAMERA_SYNTHETIC_BIAS					= 2						# Raw intensity of the synthetic images background
+PC_CAMERA_SYNTHETIC_READ_NOISE				= 1						# Standard deviation of the synthetic images read noise, in raw intensity
 PC_CAMERA_GET_EXPOSURE_NB_OK				= 2						# Number of images with correct exposure level required
 PC_CAMERA_GET_EXPOSURE_INTENSITY_TOLERANCE	= 0.05					# Allowable range near the target exposure in %
 PC_CAMERA_GET_EXPOSURE_EXPOSURE_MIN			= 35					# Minimal exposure time of the camera in [us]
@@ -184,6 +232,8 @@ PC_FILE_DISTORTION_PARAMETERS_NAME			= 'cam_parameters'
 PC_FILE_DISTORTION_XCORR_NAME				= 'x_corr'
 PC_FILE_DISTORTION_YCORR_NAME				= 'y_corr'
 PC_FILE_DISTORTION_SCALE_FACTOR_NAME		= 'scale_factor'
+PC_FILE_DISTORTION_CACHE_EXTENSION			= '.npy'		# Memory mappable float32 copy of the distortion grids, written next to the .mat file
+PC_DISTORTION_WINDOW_CACHE_SIZE				= 32			# Number of ROI windows of the distortion grids kept in memory, at least one per bench slot
 PC_CAMERA_XY_DEFAULT_EXPOSURE				= 1500
 PC_CAMERA_XY_MAX_EXPOSURE					= 10000					#If this level of exposure is reached, the region is considered to have no centroid
 PC_CAMERA_XY_DEFAULT_GAIN					= 0.0
@@ -202,6 +252,20 @@ PM_IDENTIFICATION_MINIMAL_DISPLACEMENT		= 0.05
 
 CANCOM_CONNECT_ANY_ID						= 'any'
 CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY		= 2000
+CANCOM_REPLY_TIMEOUT						= 0.1			# [s] maximal silence of the CAN line while replies are awaited
+CANCOM_READER_TIMEOUT						= 0.05			# [s] maximal blocking time of the serial reads of the CAN reader thread
+CANCOM_RX_QUEUE_SIZE						= 1024			# maximal number of received CAN frames kept for later reading
+CANCOM_ASK_ID_TIME							= 0.5			# [s] time during which the positioners answers to the ID request are collected
+CANCOM_SIMULATOR_SERIAL_NUMBER				= 'SIMU'		# serial number of the simulated CAN-USB transceiver
+CANCOM_SIMULATOR_LATENCY					= 0.0005		# [s] reply time of the simulated positioners
+CANCOM_SIMULATOR_FRAME_TIME					= 0.00013		# [s] transmission time of a CAN frame at 1Mb/s
+BENCHMARK_FORMAT_VERSION					= 1				# version of the machine-readable benchmark results
+BENCHMARK_SLOT_COUNTS						= [1, 7, 19]	# default numbers of bench slots to benchmark
+BENCHMARK_STEP_COUNTS						= [20]			# default numbers of steps (calibration) or targets (test) per run
+BENCHMARK_MOTION_TIME_SCALE					= 0.05			# duration of the simulated moves relative to the real ones
+BENCHMARK_CAMERA_ID							= 1				# serial number of the benchmark synthetic camera
+TRACE_ENABLE								= False			# record the spans of the hot path from the start of the processes
+TRACE_BUFFER_CAPACITY						= 2**20			# number of spans kept per process, the oldest are dropped
 CALIBRATION_MOTOR_MAXIMAL_ERROR	 			= 20 					#[°]
 			
 CONFIG_LOAD_LATEST_RESULT					= 'latest'
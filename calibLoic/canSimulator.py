@@ -0,0 +1,266 @@
+#cython: language_level=3
+import numpy as np
+import struct
+import threading
+import heapq
+import time
+import classCanCom as com
+import classPositioners as pos
+import DEFINES
+
+class SimulatedPositioner:
+	"""Firmware state of a simulated positioner. The motion of each axis is a piecewise linear function of
+	time given by its knots."""
+	__slots__ = (	'ID',\
+					'physics',\
+					'motionTimeScale',\
+					'speed',\
+					'current',\
+					'offset',\
+					'knots',\
+					'datumEnd',\
+					'datumInitialized')
+
+	def __init__(self, ID, motionTimeScale = 1):
+		self.ID					= ID
+		self.physics			= pos.PositionerPhysics()
+		self.motionTimeScale	= motionTimeScale
+		self.speed				= [self.physics.maxRpmAlpha, self.physics.maxRpmBeta]	# [RPM]
+		self.current			= [0, 0]
+		self.offset				= [0, 0]
+		self.knots				= [([0.], [0.]), ([0.], [0.])]	#(times, positions) of the alpha and beta axes
+		self.datumEnd			= 0
+		self.datumInitialized	= False
+
+	def get_position(self, tNow):
+		return [int(round(np.interp(tNow, times, positions))) for (times, positions) in self.knots]
+
+	def is_moving(self, tNow, axis):
+		return tNow < self.knots[axis][0][-1]
+
+	def get_status(self, tNow):
+		STREG = com.StatusRegistery
+		status = STREG.SYSTEM_INITIALIZATION
+		if not self.is_moving(tNow, 0):
+			status |= STREG.ALPHA_DISPLACEMENT_COMPLETED
+		if not self.is_moving(tNow, 1):
+			status |= STREG.BETA_DISPLACEMENT_COMPLETED
+		if not self.is_moving(tNow, 0) and not self.is_moving(tNow, 1):
+			status |= STREG.DISPLACEMENT_COMPLETED
+		if tNow < self.datumEnd:
+			status |= STREG.DATUM_INITIALIZATION
+		elif self.datumInitialized:
+			status |= STREG.DATUM_INITIALIZED|STREG.DATUM_ALPHA_INITIALIZED|STREG.DATUM_BETA_INITIALIZED
+		return status
+
+	def goto(self, tNow, targets):
+		#Starts a move at the set speed. Returns the duration of the move of each axis [s]
+		durations = []
+		for axis, (target, speed, reductionRatio) in enumerate(zip(targets, self.speed, (self.physics.alphaReductionRatio, self.physics.betaReductionRatio))):
+			start = self.get_position(tNow)[axis]
+			duration = self.motionTimeScale*abs(target-start)/self.physics.incrementsPerRotation*reductionRatio*60/max(speed, 1)
+			duration = np.ceil(duration*DEFINES.CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY)/DEFINES.CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY
+			self.knots[axis] = ([tNow, tNow+duration], [start, target])
+			durations.append(duration)
+		return durations
+
+	def stop(self, tNow):
+		self.knots = [([tNow], [position]) for position in self.get_position(tNow)]
+
+	def set_position(self, tNow, positions):
+		self.knots = [([tNow], [position]) for position in positions]
+
+	def process(self, tNow, command, data):
+		#Executes a command. Returns the response code and the data of the reply
+		RX = com.RX_Options
+		try:
+			if command == RX.GET_ID:
+				return RX.COMMAND_ACCEPTED, struct.pack('<I', self.ID)
+
+			elif command == RX.GET_STATUS:
+				return RX.COMMAND_ACCEPTED, struct.pack('<I', self.get_status(tNow))
+
+			elif command == RX.GOTO_POSITION_ABSOLUTE:
+				if self.is_moving(tNow, 0) or self.is_moving(tNow, 1):
+					return RX.ALREADY_IN_MOTION, b''
+				durations = self.goto(tNow, struct.unpack('<ii', data))
+				return RX.COMMAND_ACCEPTED, struct.pack('<II', *[int(round(duration*DEFINES.CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY)) for duration in durations])
+
+			elif command in (RX.GET_ACTUAL_POSITION, RX.GET_MOTOR_HALL_POS):
+				return RX.COMMAND_ACCEPTED, struct.pack('<ii', *self.get_position(tNow))
+
+			elif command == RX.SET_ACTUAL_POSITION:
+				self.set_position(tNow, struct.unpack('<ii', data))
+
+			elif command == RX.GET_OFFSET:
+				return RX.COMMAND_ACCEPTED, struct.pack('<ii', *self.offset)
+
+			elif command == RX.SET_OFFSET:
+				self.offset = list(struct.unpack('<ii', data))
+
+			elif command == RX.SET_SPEED:
+				self.speed = list(struct.unpack('<II', data))
+
+			elif command == RX.SET_CURRENT:
+				self.current = list(struct.unpack('<II', data))
+
+			elif command == RX.INIT_DATUM:
+				#The datums are found at the origin of both axes
+				self.datumEnd = tNow+max(self.goto(tNow, (0, 0)))
+				self.datumInitialized = True
+
+			elif command == RX.STOP_TRAJECTORY:
+				self.stop(tNow)
+
+			elif command == RX.GET_MOTOR_CALIBRATION_ERROR:
+				return RX.COMMAND_ACCEPTED, struct.pack('<ii', 0, 0)
+
+			elif command in (RX.START_MOTOR_CALIBRATION, RX.START_DATUM_CALIBRATION, RX.START_COGGING_CALIBRATION):
+				pass
+
+			else:
+				return RX.UNKNOWN_COMMAND, b''
+
+		except struct.error:
+			return RX.INCORRECT_AMOUNT_OF_DATA, b''
+
+		return RX.COMMAND_ACCEPTED, b''
+
+class SimulatedSerial:
+	"""Replaces the serial.Serial handle of a CAN-USB transceiver. It answers the SLCAN commands as the transceiver,
+	and the CAN frames as the simulated positioners, after a latency and with the transmission time of each frame on
+	the bus. Replies can be dropped or rejected at random, and some positioners can be silent.
+	The options are the keyword arguments, which can be given by the 'canUSBSimulator' entry of the test bench file."""
+	__slots__ = (	'positioners',\
+					'serialNo',\
+					'latency',\
+					'frameTime',\
+					'dropRate',\
+					'rejectRate',\
+					'silentIDs',\
+					'random',\
+					'condition',\
+					'pending',\
+					'received',\
+					'busFree',\
+					'sequence',\
+					'isOpen',\
+					'timeout',\
+					'baudrate',\
+					'bytesize')
+
+	def __init__(	self, IDs = None, nbPositioners = 1, serialNo = DEFINES.CANCOM_SIMULATOR_SERIAL_NUMBER, latency = DEFINES.CANCOM_SIMULATOR_LATENCY,\
+					frameTime = DEFINES.CANCOM_SIMULATOR_FRAME_TIME, motionTimeScale = 1, dropRate = 0, rejectRate = 0, silentIDs = (), seed = None):
+		if IDs is None:
+			IDs = range(1, nbPositioners+1)
+		self.positioners	= dict([(ID, SimulatedPositioner(ID, motionTimeScale)) for ID in IDs])
+		self.serialNo		= serialNo
+		self.latency		= latency
+		self.frameTime		= frameTime
+		self.dropRate		= dropRate
+		self.rejectRate		= rejectRate
+		self.silentIDs		= set(silentIDs)
+		self.random			= np.random.default_rng(seed)
+		self.condition		= threading.Condition()
+		self.pending		= []		#heap of the (delivery time, sequence, bytes) of the answers not yet received
+		self.received		= bytearray()
+		self.busFree		= 0
+		self.sequence		= 0
+		self.isOpen			= True
+		self.timeout		= None
+		self.baudrate		= com.CAN_Options.CAN_BAUDRATE
+		self.bytesize		= 8
+
+	def _deliver(self, tNow):
+		while len(self.pending) > 0 and self.pending[0][0] <= tNow:
+			self.received += heapq.heappop(self.pending)[2]
+
+	def _answer(self, tDelivery, answer):
+		heapq.heappush(self.pending, (tDelivery, self.sequence, answer))
+		self.sequence += 1
+
+	def _process(self, tNow, line):
+		#Answers one SLCAN line
+		if line in (b'C', b'O') or line[0:1] == b'S':
+			self._answer(tNow, b'\r')
+		elif line == b'N':
+			self._answer(tNow, b'N'+self.serialNo.encode()+b'\r')
+		elif line[0:1] == b'T' and len(line) >= 10:
+			#The transceiver acknowledges the transmission
+			self._answer(tNow, b'Z\r')
+			arbitrationID = int(line[1:9], 16)
+			ID = arbitrationID>>com.CAN_Options.CAN_ID_BIT_SHIFT
+			command = (arbitrationID>>com.CAN_Options.CAN_CMD_BIT_SHIFT)&com.CAN_Options.CAN_CMD_MASK
+			data = bytes.fromhex(line[10:].decode())
+
+			if ID == com.CAN_Options.CAN_BROADCAST_ID:
+				receivers = list(self.positioners.values())
+			else:
+				receivers = [self.positioners[ID]] if ID in self.positioners else []
+
+			for positioner in receivers:
+				(responseCode, replyData) = positioner.process(tNow, command, data)
+				if positioner.ID in self.silentIDs or self.random.random() < self.dropRate:
+					continue
+				if self.random.random() < self.rejectRate:
+					(responseCode, replyData) = (com.RX_Options.INVALID_COMMAND, b'')
+
+				#The replies share the bus
+				self.busFree = max(self.busFree, tNow+self.latency)+self.frameTime
+				replyID = (command<<com.CAN_Options.CAN_CMD_BIT_SHIFT)+(positioner.ID<<com.CAN_Options.CAN_ID_BIT_SHIFT)+responseCode
+				self._answer(self.busFree, f'T{replyID:08X}{len(replyData):d}{replyData.hex().upper()}\r'.encode())
+		else:
+			#Unknown SLCAN command
+			self._answer(tNow, b'\x07')
+
+	def write(self, data):
+		with self.condition:
+			tNow = time.perf_counter()
+			for line in bytes(data).split(b'\r')[:-1]:
+				self._process(tNow, line)
+			self.condition.notify_all()
+		return len(data)
+
+	def read(self, size = 1):
+		#Blocks until size bytes are received or the timeout is reached
+		with self.condition:
+			tEnd = None if self.timeout is None else time.perf_counter()+self.timeout
+			while True:
+				tNow = time.perf_counter()
+				self._deliver(tNow)
+				if len(self.received) >= size or (tEnd is not None and tNow >= tEnd):
+					break
+				tWait = [t-tNow for t in (tEnd, self.pending[0][0] if len(self.pending) > 0 else None) if t is not None]
+				self.condition.wait(min(tWait) if len(tWait) > 0 else None)
+
+			data = bytes(self.received[:size])
+			del self.received[:size]
+		return data
+
+	def readline(self, size = -1):
+		with self.condition:
+			self._deliver(time.perf_counter())
+			end = self.received.find(b'\r')
+		if end >= 0 and (size < 0 or end < size):
+			return self.read(end+1)
+		return self.read(max(size, 1))
+
+	def inWaiting(self):
+		with self.condition:
+			self._deliver(time.perf_counter())
+			return len(self.received)
+
+	@property
+	def in_waiting(self):
+		return self.inWaiting()
+
+	def reset_input_buffer(self):
+		with self.condition:
+			self._deliver(time.perf_counter())
+			self.received.clear()
+
+	def reset_output_buffer(self):
+		pass
+
+	def close(self):
+		self.isOpen = False
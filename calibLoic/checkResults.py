@@ -0,0 +1,258 @@
+#cython: language_level=3
+import argparse
+import copy
+import sys
+import warnings
+import numpy as np
+import classCalibration as calib
+import classTest as test
+import processManager as proc
+import miscmath as mm
+
+#The vectorized numpy functions may round the last bit differently from their scalar calls
+RELATIVE_TOLERANCE = 1e-12
+ABSOLUTE_TOLERANCE = 1e-15
+
+def reference_calc_slot(slotResults):
+	#Loop implementation of the test results computation, as it was before classTest.calc_slot was vectorized
+	nbRepetitions, nbTargets, maxNbMoves, nbDims = slotResults.targets.shape
+	modelError 		= np.full((nbRepetitions, nbTargets, maxNbMoves, 7), np.nan) #Total, X, Y, AcrossAlpha, AlongAlpha, Acrossbeta, AlongBeta
+	repeatability 	= np.full((nbTargets, 7), np.nan) #Total, X, Y, AcrossAlpha, AlongAlpha, Acrossbeta, AlongBeta
+	totalNbPoints  	= nbTargets*nbRepetitions
+
+	centerX 	= slotResults.slotsCenters[0]
+	centerY 	= slotResults.slotsCenters[1]
+	for target in range(0,nbTargets):
+		for repetition in range(0,nbRepetitions):
+			for move in range(0, maxNbMoves):
+				modelError[repetition,target,move,0] = slotResults.targetsErrors[repetition,target,move,2]
+				modelError[repetition,target,move,1] = slotResults.targetsErrors[repetition,target,move,0]
+				modelError[repetition,target,move,2] = slotResults.targetsErrors[repetition,target,move,1]
+				mesX 		= slotResults.sortedCentroidsXY[repetition, target, move, 0]
+				mesY 		= slotResults.sortedCentroidsXY[repetition, target, move, 1]
+				errX 		= modelError[repetition, target, move, 1]
+				errY 		= modelError[repetition, target, move, 2]
+
+				angleCenterToMes 	= np.arctan2(mesX-centerX, mesY-centerY)
+				angleBetaEnd 		= np.mod((slotResults.realAngles[repetition, target, move, 0]+slotResults.realAngles[repetition, target, move, 1]), 2*np.pi)
+				angleMesToErr 		= np.arctan2(errX, errY)
+
+				projectionAngleAlpha = np.mod(angleMesToErr-angleCenterToMes, 2*np.pi)
+				projectionAngleBeta = np.mod(angleMesToErr-angleBetaEnd, 2*np.pi)
+
+				modelError[repetition, target, move, 3] = -modelError[repetition, target, move, 0]*np.cos(projectionAngleAlpha)
+				modelError[repetition, target, move, 4] = -modelError[repetition, target, move, 0]*np.sin(projectionAngleAlpha)
+				if (angleMesToErr-slotResults.realAngles[repetition, target, move, 0]) < 0 and (angleMesToErr-slotResults.realAngles[repetition, target, move, 0]) > -np.pi:
+					modelError[repetition, target, move, 3] = -modelError[repetition, target, move, 3]
+
+				modelError[repetition, target, move, 5] = -modelError[repetition, target, move, 0]*np.cos(projectionAngleBeta)
+				modelError[repetition, target, move, 6] = -modelError[repetition, target, move, 0]*np.sin(projectionAngleBeta)
+
+		#each repetition overwrites the repeatability of the target, the last one is kept
+		if nbRepetitions > 1:
+			move = 0
+			meanPointX = np.nanmean(slotResults.sortedCentroidsXY[:, target, move, 0])
+			meanPointY = np.nanmean(slotResults.sortedCentroidsXY[:, target, move, 1])
+
+			for repetition in range(0,nbRepetitions):
+				mesX 		= slotResults.sortedCentroidsXY[repetition, target, move, 0]
+				mesY 		= slotResults.sortedCentroidsXY[repetition, target, move, 1]
+
+				repeatabilityX = meanPointX-mesX
+				repeatabilityY = meanPointY-mesY
+				repeatabilityTotal = np.sqrt(repeatabilityX**2+repeatabilityY**2)
+
+				repeatability[target, 0] = repeatabilityTotal
+				repeatability[target, 1] = repeatabilityX
+				repeatability[target, 2] = repeatabilityY
+
+				angleCenterToMes 	= np.arctan2(mesX-centerX, mesY-centerY)
+				angleBetaEnd 		= np.mod((slotResults.realAngles[repetition, target, move, 0]+slotResults.realAngles[repetition, target, move, 1]), 2*np.pi)
+				angleMesToErr 		= np.arctan2(repeatabilityX, repeatabilityY)
+
+				projectionAngleAlpha = np.mod(angleMesToErr-angleCenterToMes, 2*np.pi)
+				projectionAngleBeta = np.mod(angleMesToErr-angleBetaEnd, 2*np.pi)
+
+				repeatability[target, 3] = -repeatability[target, 0]*np.cos(projectionAngleAlpha)
+				repeatability[target, 4] = -repeatability[target, 0]*np.sin(projectionAngleAlpha)
+				if (angleMesToErr-slotResults.realAngles[repetition, target, move, 0]) < 0 and (angleMesToErr-slotResults.realAngles[repetition, target, move, 0]) > -np.pi:
+					repeatability[target, 3] = -repeatability[target, 3]
+
+				repeatability[target, 5] = -repeatability[target, 0]*np.cos(projectionAngleBeta)
+				repeatability[target, 6] = -repeatability[target, 0]*np.sin(projectionAngleBeta)
+
+	completedTargets = 0
+	targetConvergeance = []
+	for move in range(0, maxNbMoves):
+		for repetition in range(0, nbRepetitions):
+			for target in range(0, nbTargets):
+				if 1000*modelError[repetition,target,move,0] <= slotResults.testParameters.desiredTargetError:
+					completedTargets += 1
+		targetConvergeance.append(completedTargets/totalNbPoints*100)
+
+	slotResults.mesRMSError1stMove.append(			1000*mm.nanrms(np.ravel(modelError[:,:,0,0])))
+	slotResults.mesRMSRepeatability1stMove.append(	1000*mm.nanrms(np.ravel(repeatability[:,0])))
+	slotResults.mesTargetConvergeance.append(		targetConvergeance)
+	slotResults.mesMaxNbMoves.append(				np.max(np.ravel(slotResults.nbCorrections[:,:]))+1)
+	slotResults.modelError							= modelError
+	slotResults.repeatability						= repeatability
+	slotResults.calcDone							= True
+
+	return slotResults
+
+def make_test_results(nbRepetitions, nbTargets, maxNbMoves, seed, nanRatio):
+	#Random test results of one slot. nanRatio of the points of each array are missing
+	rng = np.random.default_rng(seed)
+	slotResults = test.Results()
+	slotResults.targets				= rng.random((nbRepetitions, nbTargets, maxNbMoves, 2))
+	slotResults.targetsErrors		= rng.normal(0, 0.01, (nbRepetitions, nbTargets, maxNbMoves, 3))
+	slotResults.targetsErrors[...,2] = np.abs(slotResults.targetsErrors[...,2])
+	slotResults.sortedCentroidsXY	= rng.normal(50, 5, (nbRepetitions, nbTargets, maxNbMoves, 8))
+	slotResults.realAngles			= rng.uniform(-1, 7, (nbRepetitions, nbTargets, maxNbMoves, 2))
+	for values in (slotResults.targetsErrors, slotResults.sortedCentroidsXY, slotResults.realAngles):
+		values[rng.random(values.shape[0:3]) < nanRatio] = np.nan
+	slotResults.slotsCenters		= np.array([50., 50.])
+	slotResults.nbCorrections		= rng.integers(0, maxNbMoves, (nbRepetitions, nbTargets))
+	slotResults.testParameters.desiredTargetError = 5
+	slotResults.runDone				= True
+	slotResults.calcDone			= False
+	return slotResults
+
+def make_calibration_results(nbSlots, nbRepetitions, nbStartingPoints, nbSteps, seed):
+	#Random calibration results of positioners with a non-linearity, noise and outliers
+	rng = np.random.default_rng(seed)
+	stepCommands = np.deg2rad(np.linspace(-2, 362, nbSteps))
+	startingCommands = np.deg2rad(np.linspace(0, 180, nbStartingPoints))
+	calibResults = []
+	for slot in range(0, nbSlots):
+		slotResults = calib.Results()
+		slotResults.calibrationParameters.axesToTest = [0, 1]
+		command = np.zeros((nbStartingPoints, 2, nbSteps, 2, 2)) #startingPoint, axis, step, direction, (alpha, beta)
+		command[:,0,:,:,0] = stepCommands[np.newaxis,:,np.newaxis]
+		command[:,0,:,:,1] = startingCommands[:,np.newaxis,np.newaxis]
+		command[:,1,:,:,0] = startingCommands[:,np.newaxis,np.newaxis]
+		command[:,1,:,:,1] = stepCommands[np.newaxis,:,np.newaxis]
+
+		#the directions are offset by a small hysteresis
+		alpha = command[...,0]+0.01*np.sin(3*command[...,0])+np.array([0, 0.002])+rng.uniform(0.2, 0.4)
+		beta = command[...,1]+0.01*np.sin(3*command[...,1])+np.array([0, 0.002])-rng.uniform(0.1, 0.3)
+		(x, y) = mm.get_endpoint(10+slot, 20, rng.uniform(2, 2.1), rng.uniform(2.35, 2.45), alpha, beta)
+		centroids = np.zeros((nbRepetitions,)+x.shape+(8,))
+		centroids[...,0] = x+rng.normal(0, 0.002, centroids.shape[0:-1])
+		centroids[...,1] = y+rng.normal(0, 0.002, centroids.shape[0:-1])
+		centroids[...,2:7] = rng.random(centroids.shape[0:-1]+(5,))
+		centroids[...,7] = 1
+		points = centroids.reshape(-1, 8)
+		points[rng.choice(len(points), 5, replace = False), 0] += rng.uniform(0.2, 0.5, 5)
+		points[rng.choice(len(points), 5, replace = False), 0:7] = np.nan
+
+		slotResults.sortedCentroidsXY = centroids
+		slotResults.sortedTargetCommand = command
+		slotResults.positionerID = slot
+		slotResults.slotID = slot
+		slotResults.runDone = True
+		calibResults.append(slotResults)
+	return calibResults
+
+def compare(reference, value, name):
+	#Returns the names of the values that differ. The floats are compared up to the rounding, NaNs compare equal,
+	#the objects are compared on their slots
+	if isinstance(reference, np.ndarray) or isinstance(value, np.ndarray):
+		reference = np.asarray(reference)
+		value = np.asarray(value)
+		if not reference.shape == value.shape or not reference.dtype == value.dtype:
+			return [name]
+		if np.issubdtype(reference.dtype, np.inexact):
+			return [] if np.all(np.isclose(reference, value, rtol = RELATIVE_TOLERANCE, atol = ABSOLUTE_TOLERANCE, equal_nan = True)) else [name]
+		return [] if np.array_equal(reference, value) else [name]
+	if not type(reference) == type(value):
+		return [name]
+	if isinstance(reference, (list, tuple)):
+		if not len(reference) == len(value):
+			return [name]
+		return sum([compare(r, v, f'{name}[{i}]') for (i, (r, v)) in enumerate(zip(reference, value))], [])
+	if isinstance(reference, dict):
+		if not reference.keys() == value.keys():
+			return [name]
+		return sum([compare(reference[key], value[key], f'{name}[{key!r}]') for key in reference], [])
+	if hasattr(reference, '__slots__'):
+		slots = [slot for cls in type(reference).__mro__ for slot in getattr(cls, '__slots__', ())]
+		return sum([compare(getattr(reference, slot, None), getattr(value, slot, None), f'{name}.{slot}') for slot in slots], [])
+	if isinstance(reference, (float, np.floating)):
+		return [] if np.isclose(reference, value, rtol = RELATIVE_TOLERANCE, atol = ABSOLUTE_TOLERANCE, equal_nan = True) else [name]
+	return [] if reference == value else [name]
+
+def check_test_calc():
+	#The vectorized classTest.calc_slot gives the outputs of the loop implementation
+	differences = []
+	cases = [	(3, 20, 4, 0, 0.1),\
+				(1, 10, 3, 1, 0.2),\
+				(2, 15, 1, 2, 0),\
+				(4, 8, 5, 3, 0.5),\
+				(3, 5, 3, 4, 1)]	#nbRepetitions, nbTargets, maxNbMoves, seed, nanRatio
+	for (nbRepetitions, nbTargets, maxNbMoves, seed, nanRatio) in cases:
+		case = f'{nbRepetitions} repetitions, {nbTargets} targets, {maxNbMoves} moves, {100*nanRatio:.0f}% NaN'
+		reference = make_test_results(nbRepetitions, nbTargets, maxNbMoves, seed, nanRatio)
+		value = copy.deepcopy(reference)
+		reference_calc_slot(reference)
+		test.calc_slot(value)
+		differences += [f'{case}: {name}' for name in compare(reference, value, 'Results')]
+
+		#the repeatability is the deviation of the last repetition from the mean of the first moves
+		if nbRepetitions > 1:
+			lastDeviation = np.nanmean(value.sortedCentroidsXY[:,:,0,0:2], axis = 0)-value.sortedCentroidsXY[-1,:,0,0:2]
+			if compare(lastDeviation, value.repeatability[:,1:3], 'repeatability'):
+				differences.append(f'{case}: repeatability is not the one of the last repetition')
+		elif not np.all(np.isnan(value.repeatability)):
+			differences.append(f'{case}: repeatability of a single repetition is not NaN')
+
+	return differences
+
+def run_parallel(compute, results):
+	#Computes results on the centroid processes
+	processManager = proc.ProcessManager()
+	processManager.start_centroid_processes()
+	try:
+		compute(results, processManager = processManager)
+	finally:
+		processManager.stop_centroid_processes()
+
+def check_calibration_model_parallel():
+	#The slots models computed by the centroid processes are merged back identical to the sequential ones
+	reference = make_calibration_results(3, 2, 2, 40, 5)
+	value = copy.deepcopy(reference)
+	calib.compute_model(reference)
+	run_parallel(calib.compute_model, value)
+	return [f'slot {slot}: {name}' for slot in range(0, len(reference)) for name in compare(reference[slot], value[slot], 'Results')]
+
+def check_test_calc_parallel():
+	#The test results computed by the centroid processes are merged back identical to the sequential ones
+	reference = [make_test_results(3, 20, 4, seed, 0.1) for seed in range(0, 3)]
+	value = copy.deepcopy(reference)
+	test.calc(reference)
+	run_parallel(test.calc, value)
+	return [f'slot {slot}: {name}' for slot in range(0, len(reference)) for name in compare(reference[slot], value[slot], 'Results')]
+
+CHECKS = {	'test-calc':			check_test_calc,\
+			'calibration-parallel':	check_calibration_model_parallel,\
+			'test-parallel':		check_test_calc_parallel}
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = 'Compare the optimized results computations with their reference implementation on synthetic results')
+	parser.add_argument('--checks', nargs = '+', choices = list(CHECKS.keys()), default = list(CHECKS.keys()))
+	args = parser.parse_args(argv)
+
+	failed = False
+	for check in args.checks:
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore', category = RuntimeWarning)
+			differences = CHECKS[check]()
+		print(f'{check:<20} {"identical" if len(differences) < 1 else "DIFFERENT"}')
+		for difference in differences:
+			print(f'\t{difference}')
+		failed |= len(differences) > 0
+
+	return 1 if failed else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -14,6 +14,8 @@ import classConfig
 import classPositioners
 import gc
 import errors
+import tracing
+import onlineCalibration
 
 class Parameters():
 	__slots__ = (	'approachDistance',\
@@ -33,7 +35,12 @@ class Parameters():
 					'storeHallPositions',\
 					'resetOffsetAfterCalib',\
 					'includeTiltRun',\
-					'bigCentroidRatio')
+					'bigCentroidRatio',\
+					'onlineModelEnable',\
+					'earlyStopEnable',\
+					'adaptiveSamplingEnable',\
+					'adaptiveCoarseStepsRatio',\
+					'adaptiveTolerance')
 
 	def __init__(self):
 		self.approachDistance					= 0.5		# [deg]
@@ -59,6 +66,15 @@ class Parameters():
 		self.includeTiltRun						= False
 		self.bigCentroidRatio					= 10		# Each x-th point will grab a big centroid
 
+		#Online model parameters
+		self.onlineModelEnable					= False		# Estimate the model during the run and log its quality
+		self.earlyStopEnable					= False		# Stop imaging the failing positioners and stop the repetitions once the models converged
+
+		#Adaptive sampling parameters
+		self.adaptiveSamplingEnable				= False		# Start on a coarse subset of the steps and add steps where the non-linearity requires them
+		self.adaptiveCoarseStepsRatio			= 8			# Each x-th step is in the coarse subset
+		self.adaptiveTolerance					= 5			# [um] max interpolation error of the non-linearity between the measured steps
+
 	def load(self,fileName):
 		#Load all the data in the file, exculding the fileInfos
 		try:
@@ -159,6 +175,8 @@ class Results():
 					'mesMaxAlignmentError',\
 					'mesMaxRoundnessError',\
 					'valuesToRemove',\
+					'runCentroidMode',\
+					'centroidFallbackRate',\
 					'runDone',\
 					'completionTime',\
 					'calcDone')
@@ -205,6 +223,9 @@ class Results():
 
 		self.valuesToRemove				= []
 
+		self.runCentroidMode			= DEFINES.CC_CENTROID_DEFAULT_MODE
+		self.centroidFallbackRate		= 0 #fraction of the centroids for which the fast centroid mode required the full fit
+
 		self.runDone 					= False
 		self.completionTime 			= 'N/A'
 		self.calcDone 					= False
@@ -290,13 +311,11 @@ class Results():
 			json.dump(variablesToSave, outFile, separators = (',\n',': '))
 
 def run(testBench, calibrationParameters, calibResults, config, processManager):
+	grabbedFrame = None #frame grabbed from the camera and not yet handed to the centroid processes
 	try:
 		if len(calibResults) is not testBench.nbSlots:
 			raise errors.Error("Calibration result container has the wrong length") from None
 
-		#clear any remaining result in the centroid results container
-		processManager.clear_centroids_results()
-
 		#Extract data from program parameters and do necessary conversions
 		if calibrationParameters.hysteresisEnable:
 			nbDirections = 2
@@ -353,9 +372,17 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 			totalPtsDigits = int(np.log10(totalNbPoints)+1) #get the number of digits to display
 
 		if calibrationParameters.includeTiltRun:
-			sortedCentroidsTilt = np.zeros((nbStartingPoints,max(axesToTest)+1,nbSteps,nbDirections,8))
+			sortedCentroidsTilt = np.zeros((testBench.nbSlots,nbRepetitions,nbStartingPoints,max(axesToTest)+1,nbSteps,nbDirections,8))
 		else:
 			sortedCentroidsTilt = []
+
+		#clear any remaining result in the centroid results container and size it for this run. The tilt centroids
+		#are only reserved if they are taken
+		if calibrationParameters.includeTiltRun:
+			nbCentroidTypes = 2
+		else:
+			nbCentroidTypes = 1
+		processManager.clear_centroids_results((testBench.nbSlots,nbRepetitions,nbStartingPoints,max(axesToTest)+1,nbSteps,nbDirections,nbCentroidTypes))
 		
 
 		#Setup the ROI if it is not dynamic
@@ -372,14 +399,28 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 		tStart = time.time()
 		currentPoint = 1
 		allImgIDs = []
+		pendingFrame = None #frame of the previous step, handed to the centroid processes during the next move
+
+		#the model is estimated from the centroids as they arrive, to spot the failing positioners and the converged models
+		if calibrationParameters.onlineModelEnable or calibrationParameters.earlyStopEnable or calibrationParameters.adaptiveSamplingEnable:
+			onlineModel = onlineCalibration.OnlineModel(testBench.nbSlots, nbStartingPoints, axesToTest, nbSteps, nbDirections, sortedTargetCommand, [positioner.requirements for positioner in testBench.positioners])
+		else:
+			onlineModel = None
+
+		#the steps are then only imaged where they are needed to interpolate the non-linearity
+		if calibrationParameters.adaptiveSamplingEnable:
+			sampling = onlineCalibration.AdaptiveSampling(stepCoord, axesToTest, onlineModel, calibrationParameters.adaptiveCoarseStepsRatio, calibrationParameters.adaptiveTolerance)
+			totalNbPoints = nbRepetitions*nbStartingPoints*nbDirections*sampling.get_nb_selected()
+		else:
+			sampling = None
+		skippedSlots = []
+		nbRepetitionsDone = 0
 
 		for repetition in range(0,nbRepetitions):
 			for startingPoint in range(0,nbStartingPoints):
 				for axis in axesToTest:
 					for direction in range(0,nbDirections):
 						for step in range(0,nbSteps):
-							t0 = time.perf_counter()
-							
 							if direction == DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER:
 								stepIndex = step
 								approachMove = approachDistance
@@ -387,6 +428,10 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 								stepIndex = nbSteps-step-1
 								approachMove = -approachDistance
 
+							if sampling is not None and not sampling.selected[axis,stepIndex]:
+								continue
+							stepSpan = tracing.span('calibration step', 'calibration', repetition = repetition, startingPoint = startingPoint, axis = axis, direction = direction, step = step).start()
+
 							#create motor commands for the step
 							if axis == DEFINES.CALIB_ALPHA_INDEX:
 								sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_ALPHA_INDEX] = stepCoord[DEFINES.CALIB_ALPHA_INDEX][stepIndex]
@@ -414,138 +459,156 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 									currentAlpha = calibrationParameters.cruiseCurrentAlpha
 								else:
 									approachAngleAlpha = startingCoord[DEFINES.CALIB_ALPHA_INDEX][startingPoint]
-							
-							t1 = time.perf_counter()
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,	f'T init : {t1-t0:6.5f} s',removeMsgHeader = False)
-							
+
 							#Change current
 							if not (calibrationParameters.waitCurrentAlpha == currentAlpha and calibrationParameters.waitCurrentBeta == currentBeta):
 								testBench.set_current_all_positioners(currentAlpha, currentBeta)
 								
 							#goto the approach distance
-							testBench.move_all_positioners(approachAngleAlpha, approachAngleBeta)
+							testBench.move_all_positioners(approachAngleAlpha, approachAngleBeta, wait = False)
+
+							#While the positioners move, hand the previous step over to the centroid processes and do the bookkeeping of the steps done
+							if pendingFrame is not None:
+								processManager.centroidQueuePutFrame(*pendingFrame, block = True)
+								pendingFrame = None
+								grabbedFrame = None
+							if onlineModel is not None:
+								onlineModel.update(processManager)
+
+							#print ETA
+							if currentPoint > 1:
+								completion = (currentPoint-1)/totalNbPoints
+								(tRemaining, days, hours, minutes, seconds) = mm.get_ETA(tStart,completion)
+								completion *= 100
+								strETA = time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(time.time()+tRemaining))
+								log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,0,f'ETA: {strETA} (point {currentPoint:>{totalPtsDigits}}/{totalNbPoints:>{totalPtsDigits}} ({completion:6.2f}%), {days:02d}d {hours:02d}h{minutes:02d}m{seconds:04.1f}s remaining)',overwritable = True)
+
+							#goto the target point. The soft ROI spots of the step are computed while the positioners reach it
+							testBench.move_all_positioners(sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_ALPHA_INDEX], sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_BETA_INDEX], wait = False)
 
-							#goto the target point
-							testBench.move_all_positioners(sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_ALPHA_INDEX], sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_BETA_INDEX])
-							
-							#Change current
-							if not (currentAlpha == calibrationParameters.waitCurrentAlpha and currentBeta == calibrationParameters.waitCurrentBeta):
-								testBench.set_current_all_positioners(calibrationParameters.waitCurrentAlpha, calibrationParameters.waitCurrentBeta)
-								
-							#take the image
 							alpha_angle = mm.deg2rad(sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_ALPHA_INDEX])
 							beta_angle = mm.deg2rad(sortedTargetCommand[startingPoint,axis,stepIndex,direction,DEFINES.CALIB_BETA_INDEX])
 
-							t2 = time.perf_counter()
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,	f'T com  : {t2-t1:6.5f} s',removeMsgHeader = True)
-							
+							spotsSpan = tracing.span('calibration spots', 'calibration').start()
+							frameSpots = []
 							if testBench.cameraXY.parameters.softROIrequired:
-								completeImage = testBench.cameraXY.getImage()
-							
-							t6 = time.perf_counter()
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,	f'T img  : {t6-t2:6.5f} s',removeMsgHeader = True)
-							
-							for positioner in testBench.positioners:
-								
-								imageID = mm.generate_img_ID(positioner.benchSlot, repetition, startingPoint, axis, stepIndex, direction, DEFINES.MM_IMG_ID_XY_IDENTIFIER)
-
-								if positioner.calibrated:
-									# print(positioner.model.lengthBeta)
-									(targetX,targetY) = mm.get_endpoint(	positioner.model.centerX,positioner.model.centerY,\
-																			positioner.model.lengthAlpha,positioner.model.lengthBeta,\
-																			alpha_angle+positioner.model.offsetAlpha,beta_angle+positioner.model.offsetBeta)
-									(targetX,targetY) = (	int(targetX/testBench.cameraXY.parameters.scaleFactor),\
-															int(targetY/testBench.cameraXY.parameters.scaleFactor))
-									ROI[0] = targetX
-									ROI[1] = targetY
-									ROI[2] = DEFINES.PC_CAMERA_XY_CALIB_CROP
-									ROI[3] = DEFINES.PC_CAMERA_XY_CALIB_CROP
-									ROI[4] = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-									
-									if testBench.cameraXY.parameters.softROIrequired:
-										#Do a software crop of the approximated model area
-										# print(f'\tComputing image {i:>2}/{testBench.nbSlots:2}')
-										(image, offsetX, offsetY) = mm.cropImage(completeImage,ROI,testBench.cameraXY.parameters.maxX,testBench.cameraXY.parameters.maxY)
-										validityCenter = (positioner.model.centerX/testBench.cameraXY.parameters.scaleFactor,positioner.model.centerY/testBench.cameraXY.parameters.scaleFactor)
-										validityRadius = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-										
-										# t100 = time.perf_counter()
-										processManager.centroidQueuePut((image, offsetX, offsetY, imageID, validityCenter, validityRadius), block = True)
-										# print(f'{time.perf_counter()-t100:5.4f}')
-										# (image,addedOffsetX,addedOffsetY) = mm.computeValidSoftROI(image, testBench.cameraXY.parameters.maxX, testBench.cameraXY.parameters.maxY, validityCenter, validityRadius)
-										# offsetX += addedOffsetX
-										# offsetY += addedOffsetY
-										# testBench.cameraXY.parameters.ROIoffsetX = offsetX
-										# testBench.cameraXY.parameters.ROIoffsetY = offsetY
-										# result = cc.compute_centroid(image,testBench.cameraXY.parameters,imageID)
-										# processManager.resultList.append(result)
-
-										allImgIDs.append(imageID)
-									else:
-										#Do a hardware crop of the approximated model area and compute the centroid
-										# print(f'\tTaking image {i:>2}/{testBench.nbSlots:2}')
-										testBench.cameraXY.setROI(ROI)
-										testBench.cameraXY.setExposure(testBench.slotsExposures[positioner.benchSlot])
-										testBench.cameraXY.getImage(processManager.centroidQueue,imageID)
-										
-										allImgIDs.append(imageID)
+								for positioner in testBench.positioners:
+									if positioner.benchSlot in skippedSlots:
+										continue
 
-								elif testBench.cameraXY.parameters.softROIrequired:
-									# print(f'\tComputing image {i:>2}/{testBench.nbSlots:2}')
-									#Send whole image to queue and ask for soft ROI
+									imageID = mm.generate_img_ID(positioner.benchSlot, repetition, startingPoint, axis, stepIndex, direction, DEFINES.MM_IMG_ID_XY_IDENTIFIER)
 									validityCenter = (positioner.model.centerX/testBench.cameraXY.parameters.scaleFactor,positioner.model.centerY/testBench.cameraXY.parameters.scaleFactor)
 									validityRadius = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-									
-									# t100 = time.perf_counter()
-									processManager.centroidQueuePut((completeImage, 0, 0, imageID, validityCenter, validityRadius), block = True)
-									# print(f'{time.perf_counter()-t100:5.4f}')
-									# (image,offsetX,offsetY) = mm.computeValidSoftROI(completeImage, testBench.cameraXY.parameters.maxX, testBench.cameraXY.parameters.maxY, validityCenter, validityRadius)
-									# testBench.cameraXY.parameters.ROIoffsetX = offsetX
-									# testBench.cameraXY.parameters.ROIoffsetY = offsetY
-									# result = cc.compute_centroid(image,testBench.cameraXY.parameters,imageID)
-									# processManager.resultList.append(result)
+
+									if positioner.calibrated:
+										#Do a software crop of the approximated model area
+										(targetX,targetY) = mm.get_endpoint(	positioner.model.centerX,positioner.model.centerY,\
+																				positioner.model.lengthAlpha,positioner.model.lengthBeta,\
+																				alpha_angle+positioner.model.offsetAlpha,beta_angle+positioner.model.offsetBeta)
+										ROI[0] = int(targetX/testBench.cameraXY.parameters.scaleFactor)
+										ROI[1] = int(targetY/testBench.cameraXY.parameters.scaleFactor)
+										ROI[2] = DEFINES.PC_CAMERA_XY_CALIB_CROP
+										ROI[3] = DEFINES.PC_CAMERA_XY_CALIB_CROP
+										frameSpots.append((imageID, tuple(ROI[0:4]), validityCenter, validityRadius))
+									else:
+										#Send whole image to queue and ask for soft ROI
+										frameSpots.append((imageID, None, validityCenter, validityRadius))
 
 									allImgIDs.append(imageID)
-								else:
-									#Do a hardware crop of the positioner whole workspace and compute the centroid
-									ROI[0] = positioner.model.centerX/testBench.cameraXY.parameters.scaleFactor
-									ROI[1] = positioner.model.centerY/testBench.cameraXY.parameters.scaleFactor
-									ROI[2] = 2*(positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-									ROI[3] = 2*(positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-									ROI[4] = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
+							spotsSpan.stop()
 
-									testBench.cameraXY.setROI(ROI)
-									testBench.cameraXY.getImage(processManager.centroidQueue,imageID)
+							#Change current
+							if not (currentAlpha == calibrationParameters.waitCurrentAlpha and currentBeta == calibrationParameters.waitCurrentBeta):
+								testBench.set_current_all_positioners(calibrationParameters.waitCurrentAlpha, calibrationParameters.waitCurrentBeta)
+
+							#take the images once the positioners are at the target. The frame is handed to the centroid processes during the next move
+							testBench.wait_all_positioners()
+							if testBench.cameraXY.parameters.softROIrequired:
+								(frameIndex, completeImage) = testBench.cameraXY.grabFrame(processManager)
+								grabbedFrame = frameIndex
+								pendingFrame = (frameIndex, completeImage, testBench.cameraXY.parameters.ROIoffsetX, testBench.cameraXY.parameters.ROIoffsetY, frameSpots)
+
+							for positioner in testBench.positioners:
+								if positioner.benchSlot in skippedSlots:
+									continue
+
+								if not testBench.cameraXY.parameters.softROIrequired:
+									imageID = mm.generate_img_ID(positioner.benchSlot, repetition, startingPoint, axis, stepIndex, direction, DEFINES.MM_IMG_ID_XY_IDENTIFIER)
+									if positioner.calibrated:
+										#Do a hardware crop of the approximated model area and compute the centroid
+										(targetX,targetY) = mm.get_endpoint(	positioner.model.centerX,positioner.model.centerY,\
+																				positioner.model.lengthAlpha,positioner.model.lengthBeta,\
+																				alpha_angle+positioner.model.offsetAlpha,beta_angle+positioner.model.offsetBeta)
+										ROI[0] = int(targetX/testBench.cameraXY.parameters.scaleFactor)
+										ROI[1] = int(targetY/testBench.cameraXY.parameters.scaleFactor)
+										ROI[2] = DEFINES.PC_CAMERA_XY_CALIB_CROP
+										ROI[3] = DEFINES.PC_CAMERA_XY_CALIB_CROP
+										ROI[4] = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
+
+										testBench.cameraXY.setROI(ROI)
+										testBench.cameraXY.setExposure(testBench.slotsExposures[positioner.benchSlot])
+										testBench.cameraXY.getImage(processManager,imageID)
+									else:
+										#Do a hardware crop of the positioner whole workspace and compute the centroid
+										ROI[0] = positioner.model.centerX/testBench.cameraXY.parameters.scaleFactor
+										ROI[1] = positioner.model.centerY/testBench.cameraXY.parameters.scaleFactor
+										ROI[2] = 2*(positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
+										ROI[3] = 2*(positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
+										ROI[4] = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
+
+										testBench.cameraXY.setROI(ROI)
+										testBench.cameraXY.getImage(processManager,imageID)
 
 									allImgIDs.append(imageID)
 
 								if calibrationParameters.includeTiltRun and ((currentPoint-1)%calibrationParameters.bigCentroidRatio is 0):
 									imageID = mm.generate_img_ID(positioner.benchSlot, repetition, startingPoint, axis, stepIndex, direction, DEFINES.MM_IMG_ID_TILT_IDENTIFIER)
-									testBench.cameraTilt.getImage(processManager.centroidQueue,imageID)
+									testBench.cameraTilt.getImage(processManager,imageID)
 									allImgIDs.append(imageID)
-									
-							t3 = time.perf_counter()
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,	f'T proc : {t3-t6:6.5f} s',removeMsgHeader = True)
-							
+
+							#the Hall positions are those of the imaged point, they cannot be read while the positioners move
 							if calibrationParameters.storeHallPositions:
 								for positioner in testBench.positioners:
+									if positioner.benchSlot in skippedSlots:
+										continue
 									tempVal = positioner.get_hall_position(testBench.canUSB)
 									sortedHallMeasures[positioner.benchSlot,repetition,startingPoint,axis,stepIndex,direction,:] = tempVal
-							
-							t4 = time.perf_counter()
-							
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,	f'T hall : {t4-t3:6.5f} s',removeMsgHeader = True)
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,	f'T tot  : {t4-t0:6.5f} s',removeMsgHeader = True)
+							stepSpan.stop()
 
-							#print ETA
-							completion = currentPoint/totalNbPoints
-							(tRemaining, days, hours, minutes, seconds) = mm.get_ETA(tStart,completion)
-							completion *= 100
-							strETA = time.strftime("%a, %d %b %Y %H:%M:%S", time.localtime(time.time()+tRemaining))
-							log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,0,f'ETA: {strETA} (point {currentPoint:>{totalPtsDigits}}/{totalNbPoints:>{totalPtsDigits}} ({completion:6.2f}%), {days:02d}d {hours:02d}h{minutes:02d}m{seconds:04.1f}s remaining)',overwritable = True)
-							
 							currentPoint += 1
 
+					#check the models once the axis circle is done
+					if onlineModel is not None:
+						onlineModel.update(processManager)
+						for slot in onlineModel.check_failures():
+							quality = onlineModel.get_quality(slot)
+							log.message(DEFINES.LOG_MESSAGE_PRIORITY_WARNING,1,f'Positioner #{testBench.positioners[slot].ID} (Slot #{testBench.slotIDs[slot]}) is failing (circle residual: {quality["circleResidual"]:.1f} um, non-linearity: {quality["maxNonLinearity"]:.3f} deg, missing centroids: {100*quality["missingRate"]:.1f}%)')
+							if calibrationParameters.earlyStopEnable:
+								skippedSlots.append(slot)
+
+					#the steps added are imaged from the next sweep of the axis on
+					if sampling is not None:
+						nbAddedSteps = sampling.refine(axis)
+						if nbAddedSteps > 0:
+							totalNbPoints = nbRepetitions*nbStartingPoints*nbDirections*sampling.get_nb_selected()
+							log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,1,f'Added {nbAddedSteps} steps to the axis {axis} sweeps ({int(np.sum(sampling.selected[axis]))}/{nbSteps} steps)')
+
+			nbRepetitionsDone += 1
+			if onlineModel is not None:
+				onlineModel.end_repetition()
+				for slot in range(0, testBench.nbSlots):
+					quality = onlineModel.get_quality(slot)
+					log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,1,f'Repetition {repetition+1}/{nbRepetitions}, slot #{testBench.slotIDs[slot]}: alpha length {quality["alphaLength"]:.4f} mm, beta length {quality["betaLength"]:.4f} mm, repeatability {quality["repeatability"]:.1f} um, change {quality["change"]:.2f} um')
+
+				if calibrationParameters.earlyStopEnable and repetition < nbRepetitions-1 and np.all(onlineModel.converged | onlineModel.failing):
+					log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,0,f'The models converged after {nbRepetitionsDone}/{nbRepetitions} repetitions, stopping the run')
+					break
+
+		if pendingFrame is not None:
+			processManager.centroidQueuePutFrame(*pendingFrame, block = True)
+			pendingFrame = None
+			grabbedFrame = None
+
 		#Change current
 		if not (calibrationParameters.cruiseCurrentAlpha == calibrationParameters.waitCurrentAlpha and calibrationParameters.cruiseCurrentBeta == calibrationParameters.waitCurrentBeta):
 			testBench.set_current_all_positioners(calibrationParameters.cruiseCurrentAlpha, calibrationParameters.cruiseCurrentBeta)
@@ -559,9 +622,10 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 		previousLength = 0
 		poll = 0
 		totalNbCentroids = testBench.nbSlots*totalNbPoints
+		if nbRepetitionsDone < nbRepetitions or len(skippedSlots) > 0 or sampling is not None:
+			totalNbCentroids = len(allImgIDs)
 		while poll < int(DEFINES.PROC_MAX_RESULTS_POLLS):
 			lenCentroids = processManager.get_centroid_results_length()
-			centroids = processManager.get_centroids_result(end = lenCentroids)
 
 			if lenCentroids >= totalNbCentroids:
 				log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG,0,'Done')
@@ -573,31 +637,53 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 
 			time.sleep(DEFINES.PROC_RESULTS_POLL_PERIOD)
 
-		if not len(centroids) >= totalNbCentroids:
+		#the results are read in place, indexed by their image ID
+		(tableCentroids, tableCompleted) = processManager.get_centroids_table()
+
+		if not lenCentroids >= totalNbCentroids:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,f'Calculation timed out.')
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,f'Still lacking {totalNbCentroids-previousLength} results')
-			missingResults = list(set(centroids[:][7])^set(allImgIDs))
-			for imgId in missingResults:
-				log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,1,f'Missing image ID {imgId:064}')
+			for imgId in allImgIDs:
+				if not tableCompleted[mm.get_img_ID(imgId)]:
+					log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,1,f'Missing image ID {imgId:064}')
 			# raise errors.Error("Missing calibration results")
 
-		processManager.clear_centroids_results()
-
 		#sort the results
-		for i in range(0,len(centroids)):
-			image_ID = np.int64(centroids[i][7])
-			(benchSlot, repetition, startingPoint, axis, step, direction, centroidType) = mm.get_img_ID(image_ID)
+		completed = tableCompleted[...,DEFINES.MM_IMG_ID_XY_IDENTIFIER]
+		sortedCentroidsXY[completed] = tableCentroids[...,DEFINES.MM_IMG_ID_XY_IDENTIFIER,:][completed]
+		if calibrationParameters.includeTiltRun:
+			completed = tableCompleted[...,DEFINES.MM_IMG_ID_TILT_IDENTIFIER]
+			sortedCentroidsTilt[completed] = tableCentroids[...,DEFINES.MM_IMG_ID_TILT_IDENTIFIER,:][completed]
+
+		#the images not taken (skipped positioners, steps left out by the adaptive sampling) are left out of the model,
+		#and the repetitions after an early stop were not done
+		if len(skippedSlots) > 0 or sampling is not None:
+			imaged = np.full(tableCompleted.shape, False)
+			imaged[mm.get_img_ID(np.asarray(allImgIDs, dtype = np.int64))] = True
+			sortedCentroidsXY[~imaged[...,DEFINES.MM_IMG_ID_XY_IDENTIFIER]] = np.nan
+			del imaged
+		sortedCentroidsXY = sortedCentroidsXY[:,0:nbRepetitionsDone]
+		sortedHallMeasures = sortedHallMeasures[:,0:nbRepetitionsDone]
+		if calibrationParameters.includeTiltRun:
+			sortedCentroidsTilt = sortedCentroidsTilt[:,0:nbRepetitionsDone]
 
-			if centroidType == DEFINES.MM_IMG_ID_XY_IDENTIFIER:
-				sortedCentroidsXY[benchSlot, repetition, startingPoint, axis, step, direction] = centroids[i]
-			elif centroidType == DEFINES.MM_IMG_ID_TILT_IDENTIFIER:
-				sortedCentroidsTilt[benchSlot, repetition, startingPoint, axis, step, direction] = centroids[i]
+		#fraction of the centroids of each slot that required the full fit
+		tableFallbacks = processManager.get_centroids_fallbacks()
+		fallbackRates = np.zeros(testBench.nbSlots)
+		for slot in range(0, testBench.nbSlots):
+			if np.any(tableCompleted[slot]):
+				fallbackRates[slot] = np.mean(tableFallbacks[slot][tableCompleted[slot]])
+		del tableCentroids, tableCompleted, tableFallbacks, completed
+
+		processManager.clear_centroids_results()
 
 		# store the results
 		for slot in range(0, testBench.nbSlots):
 			calibResults[slot].sortedTargetCommand 		= mm.deg2rad(sortedTargetCommand)
 			calibResults[slot].sortedCentroidsXY 		= sortedCentroidsXY[slot]
 			calibResults[slot].sortedHallMeasures 		= sortedHallMeasures[slot]
+			calibResults[slot].runCentroidMode 			= processManager.centroidMode
+			calibResults[slot].centroidFallbackRate 	= float(fallbackRates[slot])
 			calibResults[slot].testBenchName 			= testBench.benchName
 			calibResults[slot].positionerID 			= int(testBench.positioners[slot].ID)
 			calibResults[slot].slotID 					= int(testBench.slotIDs[slot])
@@ -615,421 +701,418 @@ def run(testBench, calibrationParameters, calibResults, config, processManager):
 	except errors.Error as e:
 		log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 		raise errors.CalibrationError("Calibration run failed")
+	finally:
+		#a frame which never reached the centroid processes would leak its buffer slot
+		if grabbedFrame is not None:
+			processManager.release_frame(grabbedFrame)
 	
-def compute_model(calibResults, testBench = None):
-
+@tracing.traced(category = 'model')
+def compute_model(calibResults, processManager = None):
+	#The slots are independent. If processManager is given, they are computed by its centroid processes
 	nbSlots = len(calibResults)
+	slotsToCompute = [slot for slot in range(0,nbSlots) if calibResults[slot].runDone and not calibResults[slot].calcDone]
+	tasksArgs = [(calibResults[slot], slot, nbSlots) for slot in slotsToCompute]
+
+	if processManager is None:
+		slotsResults = [compute_slot_model(*args) for args in tasksArgs]
+	else:
+		slotsResults = processManager.run_tasks(compute_slot_model, tasksArgs)
+
+	#merge the results computed by the other processes
+	for (slot, slotResults) in zip(slotsToCompute, slotsResults):
+		if slotResults is not calibResults[slot]:
+			for name in Results.__slots__:
+				setattr(calibResults[slot], name, getattr(slotResults, name))
+
+@tracing.traced(category = 'model')
+def compute_slot_model(slotResults, slot, nbSlots):
+	axesToTest 			= slotResults.calibrationParameters.axesToTest
+	sortedCentroidsXY 	= slotResults.sortedCentroidsXY
+	commandedAngle 		= slotResults.sortedTargetCommand
+	nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,nbCentroidsData = sortedCentroidsXY.shape
+
+	valuesToRemove 			= np.isnan(sortedCentroidsXY[:,:,:,:,:,0])
+
+	fittedCircles 			= np.full((nbStartingPoints,nbAxes,3),np.nan)
+
+	measuredLengths 		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
+	degeneratedMeasuredLengths = np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
+	measuredAngles 			= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,2),np.nan)
+	measuredHysteresis 		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps),np.nan)
+	measuredRepeatability 	= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,5),np.nan) #Total, X, Y, Across, Along
 	
-	for slot in range(0,nbSlots):
-		if (not calibResults[slot].runDone) or calibResults[slot].calcDone:
-			continue
-		axesToTest 			= calibResults[slot].calibrationParameters.axesToTest
-		sortedCentroidsXY 	= calibResults[slot].sortedCentroidsXY
-		commandedAngle 		= calibResults[slot].sortedTargetCommand
-		nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,nbCentroidsData = sortedCentroidsXY.shape
+	modelOffsets 			= np.full((nbAxes),np.nan)
+	modelArmLengths 		= np.full((nbAxes),np.nan)
+	modelCenter				= np.full((2),np.nan)
+	modelNonLinearity 		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
+	modelNLDerivative		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps-1,nbDirections),np.nan)
+	modelEccentricity		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
+	modelError				= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,5),np.nan) #Total, Xerr, Yerr, AcrossErr, AlongErr
+
+	tempOffset				= np.full((nbStartingPoints,nbAxes),np.nan)
+	degeneratedNonLinearity = np.full((nbStartingPoints,nbDirections),np.nan)
+
+	# Fit the circles to the data
+	strSlot = slot+1
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,1,f'Calculating model fit of positioner #{slotResults.positionerID} (Slot #{slotResults.slotID}, {strSlot}/{nbSlots})')
+	for startingPoint in range(0,nbStartingPoints):
+		for axis in axesToTest:
+			#remove the outliers. The measures are masked by valuesToRemove and ordered by step, direction and repetition
+			pointsToRemove = valuesToRemove[:,startingPoint,axis,:,:]
+			pointsData = sortedCentroidsXY[:,startingPoint,axis,:,:,0:7]
+			for i in range(0,DEFINES.CALIB_MAX_ITER_FOR_OUTLIERS_DETECTION):
+				xData = np.ma.masked_array(pointsData[:,:,:,0], pointsToRemove).transpose(1,2,0)
+				yData = np.ma.masked_array(pointsData[:,:,:,1], pointsToRemove).transpose(1,2,0)
+				if xData.count() <= 2:
+					raise errors.Error("Not enough points in measured data to fit circle")
 
-		valuesToRemove 			= np.isnan(sortedCentroidsXY[:,:,:,:,:,0])
+				#iterate the center to remove the outliers
+				approximatedCircle = mm.fit_circle(xData.compressed(), yData.compressed())
+				distanceToCircle = np.ma.sqrt((approximatedCircle[0]-xData)**2 + (approximatedCircle[1]-yData)**2)
 
-		fittedCircles 			= np.full((nbStartingPoints,nbAxes,3),np.nan)
+				#Z score of the distances along the steps
+				zScore = np.ma.abs((distanceToCircle-distanceToCircle.mean(axis = 0))/distanceToCircle.std(axis = 0))
 
-		measuredLengths 		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
-		degeneratedMeasuredLengths = np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
-		measuredAngles 			= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,2),np.nan)
-		measuredHysteresis 		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps),np.nan)
-		measuredRepeatability 	= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,5),np.nan) #Total, X, Y, Across, Along
-		
-		modelOffsets 			= np.full((nbAxes),np.nan)
-		modelArmLengths 		= np.full((nbAxes),np.nan)
-		modelCenter				= np.full((2),np.nan)
-		modelNonLinearity 		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
-		modelNLDerivative		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps-1,nbDirections),np.nan)
-		modelEccentricity		= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections),np.nan)
-		modelError				= np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps,nbDirections,5),np.nan) #Total, Xerr, Yerr, AcrossErr, AlongErr
+				if np.ma.max(zScore) <= DEFINES.CALIB_CALC_MIN_ZSCORE_OUTLIER or np.ma.max(distanceToCircle) <= DEFINES.CALIB_CALC_MIN_ERROR_OUTLIER/1000:
+					break
+
+				outliers = np.ma.filled((zScore > DEFINES.CALIB_CALC_MIN_ZSCORE_OUTLIER) & (distanceToCircle > DEFINES.CALIB_CALC_MIN_ERROR_OUTLIER/1000), False).transpose(2,0,1)
+				pointsToRemove |= outliers
+				pointsData[pointsToRemove] = np.nan
+				if not np.any(outliers):
+					break
 
-		tempOffset				= np.full((nbStartingPoints,nbAxes),np.nan)
-		degeneratedNonLinearity = np.full((nbStartingPoints,nbDirections),np.nan)
+			direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER #fit model only on the couterclockwize
+			#input the data in a particular order
+			validPoints = ~valuesToRemove[:,startingPoint,axis,:,direction].T
+			xData = sortedCentroidsXY[:,startingPoint,axis,:,direction,0].T[validPoints]
+			yData = sortedCentroidsXY[:,startingPoint,axis,:,direction,1].T[validPoints]
+			if len(xData) > 2:
+				fittedCircles[startingPoint,axis] = mm.fit_circle(xData,yData)
+			else:
+				raise errors.Error("Not enough points in measured data to fit circle")
 
+	# If beta was the only axis tested, fit the alpha circle on the centers of the beta axis' fitting circles
+	if DEFINES.PARAM_AXIS_BETA in axesToTest and not DEFINES.PARAM_AXIS_ALPHA in axesToTest:				
 		# Fit the circles to the data
-		strSlot = slot+1
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,1,f'Calculating model fit of positioner #{calibResults[slot].positionerID} (Slot #{calibResults[slot].slotID}, {strSlot}/{nbSlots})')
-		for startingPoint in range(0,nbStartingPoints):
-			for axis in axesToTest:
-				#remove the outliers
-				for i in range(0,DEFINES.CALIB_MAX_ITER_FOR_OUTLIERS_DETECTION):
-					xData = []
-					yData = []
-					#input the data in a particular order
-					for step in range(0,nbSteps):
-						for direction in range(0,nbDirections):
-						# direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER #fit model only on the couterclockwize
-							for repetition in range(0,nbRepetitions):
-								if not valuesToRemove[repetition,startingPoint,axis,step,direction]:
-									xData.append(sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0])
-									yData.append(sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1])
-					xData = np.asarray(xData)
-					yData = np.asarray(yData)
-					if len(xData) > 2:
-						#iterate the center to remove the outliers
-						distanceToCircle = np.zeros((nbSteps, nbDirections, nbRepetitions))
-						approximatedCircle = mm.fit_circle(xData, yData)
-						for step in range(0,nbSteps):
-							for direction in range(0,nbDirections):
-								for repetition in range(0,nbRepetitions):
-									x = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
-									y = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
-									distanceToCircle[step, direction, repetition] = np.sqrt((approximatedCircle[0]-x)**2 + (approximatedCircle[1]-y)**2)
-						
-						zScore = abs(stats.zscore(distanceToCircle))
+		xData = np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_BETA,0])
+		yData = np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_BETA,1])
+		xData = xData[~np.isnan(xData)]
+		yData = yData[~np.isnan(yData)]
 
-						if np.nanmax(zScore) <= DEFINES.CALIB_CALC_MIN_ZSCORE_OUTLIER or np.nanmax(distanceToCircle) <= DEFINES.CALIB_CALC_MIN_ERROR_OUTLIER/1000:
-							break
+		if len(xData) > 2:
+				fittedCircles[startingPoint,axis] = mm.fit_circle(xData,yData)
+		else:
+			raise errors.Error("Not enough points in measured data to fit circle")
 
-						for step in range(0,nbSteps):
-							for direction in range(0,nbDirections):
-								for repetition in range(0,nbRepetitions):
-									valuesToRemove[repetition,startingPoint,axis,step,direction] = valuesToRemove[repetition,startingPoint,axis,step,direction] or ((zScore[step,direction,repetition] > DEFINES.CALIB_CALC_MIN_ZSCORE_OUTLIER) and distanceToCircle[step,direction,repetition] > DEFINES.CALIB_CALC_MIN_ERROR_OUTLIER/1000)
-									if valuesToRemove[repetition,startingPoint,axis,step,direction]:
-										# print(f'R{repetition:1}D{direction:1}S{step:03}: {distanceToCircle[step, direction, repetition]:05.3f} ({zScore[step,direction,repetition]:6.3f})')
-										sortedCentroidsXY[repetition,startingPoint,axis,step,direction,:] = (np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,sortedCentroidsXY[repetition,startingPoint,axis,step,direction,7])
-					else:
-						raise errors.Error("Not enough points in measured data to fit circle")
+	#Compute the overall positioner center
+	modelCenter[0] = np.mean(np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_ALPHA,0]))
+	modelCenter[1] = np.mean(np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_ALPHA,1]))
+
+	# Compute arm angles and arm lengths at all measured points
+	for axis in axesToTest:
+		for startingPoint in range(0,nbStartingPoints):
+			centerX = fittedCircles[startingPoint,axis,0]
+			centerY = fittedCircles[startingPoint,axis,1]
 
-				direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER #fit model only on the couterclockwize
-				xData = []
-				yData = []
-				#input the data in a particular order
+			for direction in range(0,nbDirections):
 				for step in range(0,nbSteps):
-					# for direction in range(0,nbDirections):
 					for repetition in range(0,nbRepetitions):
 						if not valuesToRemove[repetition,startingPoint,axis,step,direction]:
-							xData.append(sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0])
-							yData.append(sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1])
-				xData = np.asarray(xData)
-				yData = np.asarray(yData)
-				if len(xData) > 2:
-					fittedCircles[startingPoint,axis] = mm.fit_circle(xData,yData)
-				else:
-					raise errors.Error("Not enough points in measured data to fit circle")
+							measureX = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
+							measureY = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
 
-		# If beta was the only axis tested, fit the alpha circle on the centers of the beta axis' fitting circles
-		if DEFINES.PARAM_AXIS_BETA in axesToTest and not DEFINES.PARAM_AXIS_ALPHA in axesToTest:				
-			# Fit the circles to the data
-			xData = np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_BETA,0])
-			yData = np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_BETA,1])
-			xData = xData[~np.isnan(xData)]
-			yData = yData[~np.isnan(yData)]
+							measuredAngles[repetition,startingPoint,axis,step,direction,0] = np.mod(np.arctan2(measureX-centerX,measureY-centerY),2*np.pi)
+							
+							#Remove alpha angle from beta measures
+							if axis == DEFINES.PARAM_AXIS_BETA and DEFINES.PARAM_AXIS_ALPHA in axesToTest:
+								measuredAngles[repetition,startingPoint,axis,step,direction,0] -= measuredAngles[repetition,startingPoint,DEFINES.PARAM_AXIS_ALPHA,step,direction,1]
+							
+							#add measurement of the angle to the other axis' center
+							measuredLengths[repetition,startingPoint,axis,step,direction] = mm.dist((centerX,centerY),(measureX,measureY))
+							
+							if axis == DEFINES.PARAM_AXIS_BETA and DEFINES.PARAM_AXIS_ALPHA in axesToTest:
+								measureX = fittedCircles[startingPoint,axis,0]
+								measureY = fittedCircles[startingPoint,axis,1]
+								measuredAngles[repetition,startingPoint,axis,step,direction,1] = np.mod(np.arctan2(measureX-centerX,measureY-centerY),2*np.pi)
+
+							if axis == DEFINES.PARAM_AXIS_ALPHA and DEFINES.PARAM_AXIS_BETA in axesToTest:
+								measureX = fittedCircles[startingPoint,DEFINES.PARAM_AXIS_BETA,0]
+								measureY = fittedCircles[startingPoint,DEFINES.PARAM_AXIS_BETA,1]
+								measuredAngles[repetition,startingPoint,axis,step,direction,1] = np.mod(np.arctan2(measureX-centerX,measureY-centerY),2*np.pi)
+								degeneratedMeasuredLengths[repetition,startingPoint,axis,step,direction] = mm.dist((centerX,centerY),(measureX,measureY))
+
+							#store temporary non-linearity
+							modelNonLinearity[repetition,startingPoint,axis,step,direction] = np.mod(measuredAngles[repetition,startingPoint,axis,step,direction,0]-commandedAngle[startingPoint,axis,step,direction,axis]+np.pi,2*np.pi)-np.pi
+							
+							#compute hysteresis
+							if direction == DEFINES.MM_IMG_ID_CLOCKWIZE_DIR_IDENTIFIER:
+								measuredHysteresis[repetition,startingPoint,axis,step] = np.mod(measuredAngles[repetition,startingPoint,axis,step,DEFINES.MM_IMG_ID_CLOCKWIZE_DIR_IDENTIFIER,0]-measuredAngles[repetition,startingPoint,axis,step,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0]+np.pi,2*np.pi)-np.pi
+
+				#Degenerated is the non-linearity using the Center-to-center parameters
+				if axis == DEFINES.PARAM_AXIS_ALPHA and DEFINES.PARAM_AXIS_BETA in axesToTest:
+					degeneratedNonLinearity[startingPoint,direction] = np.nanmean(np.ravel(np.mod(measuredAngles[:,startingPoint,axis,0,direction,1]-commandedAngle[startingPoint,DEFINES.PARAM_AXIS_BETA,0,direction,DEFINES.PARAM_AXIS_ALPHA]+np.pi,2*np.pi)-np.pi))
+
+			#Get all the offsets in the same 180°. For example, measure of 179° and -179° should give 180° offset, not 0°.
+			referenceOffset = modelNonLinearity[0,startingPoint,axis,0,0]
+			for direction in range(0,nbDirections):
+				for repetition in range(0,nbRepetitions):
+					for step in range(0,nbSteps):
+						while referenceOffset - modelNonLinearity[repetition,startingPoint,axis,step,direction] < -np.pi:
+							modelNonLinearity[repetition,startingPoint,axis,step,direction] -= 2*np.pi
+						while referenceOffset - modelNonLinearity[repetition,startingPoint,axis,step,direction] > np.pi:
+							modelNonLinearity[repetition,startingPoint,axis,step,direction] += 2*np.pi
 
-			if len(xData) > 2:
-					fittedCircles[startingPoint,axis] = mm.fit_circle(xData,yData)
+			#get offset from the temporary non-linearity and remove it
+			tempOffset[startingPoint,axis] = np.nanmean(np.ravel(modelNonLinearity[:,startingPoint,axis,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER]))
+			measuredAngles[:,startingPoint,axis,:,:,0] -= tempOffset[startingPoint,axis]
+
+			for direction in range(0,nbDirections):
+				for step in range(0,nbSteps):
+					for repetition in range(0,nbRepetitions):
+						#get the measured angles in the same full rotation as the command (i.e. a -5° measure should be mapped to the -5° command, and not remain 355°)
+						while commandedAngle[startingPoint,axis,step,direction,axis]-measuredAngles[repetition,startingPoint,axis,step,direction,0] < -np.pi:
+							measuredAngles[repetition,startingPoint,axis,step,direction,0] -= 2*np.pi
+						while commandedAngle[startingPoint,axis,step,direction,axis]-measuredAngles[repetition,startingPoint,axis,step,direction,0] > np.pi:
+							measuredAngles[repetition,startingPoint,axis,step,direction,0] += 2*np.pi
+						
+						modelNonLinearity[repetition,startingPoint,axis,step,direction] = np.mod(measuredAngles[repetition,startingPoint,axis,step,direction,0]-commandedAngle[startingPoint,axis,step,direction,axis]+np.pi,2*np.pi)-np.pi
+
+			#compute non-linearity derivative
+			for direction in range(0,nbDirections):
+				for step in range(0,nbSteps-1):
+					for repetition in range(0,nbRepetitions):
+						if not valuesToRemove[repetition,startingPoint,axis,step,direction]:
+							angleInc = np.abs(commandedAngle[startingPoint,axis,step,direction,axis]-commandedAngle[startingPoint,axis,step+1,direction,axis])
+							nonLinInc = np.abs(modelNonLinearity[repetition,startingPoint,axis,step,direction]-modelNonLinearity[repetition,startingPoint,axis,step+1,direction])
+							modelNLDerivative[repetition,startingPoint,axis,step,direction] = nonLinInc/angleInc
+
+		#store the model arm length
+		if axis == DEFINES.PARAM_AXIS_ALPHA and DEFINES.PARAM_AXIS_BETA in axesToTest:
+			modelArmLengths[axis] = np.nanmean(np.ravel(degeneratedMeasuredLengths[:,:,axis,:,:]))
+		else:
+			modelArmLengths[axis] = np.nanmean(np.ravel(measuredLengths[:,:,axis,:,:]))
+		
+		#store the offset for the model
+		if axis == DEFINES.PARAM_AXIS_ALPHA:
+			if DEFINES.PARAM_AXIS_BETA in axesToTest:
+				modelOffsets[axis] = np.nanmean(np.ravel(degeneratedNonLinearity[:,:]))
 			else:
-				raise errors.Error("Not enough points in measured data to fit circle")
+				modelOffsets[axis] = 0 #Cannot be determined
+		if axis == DEFINES.PARAM_AXIS_BETA:
+			modelOffsets[axis] = np.nanmean(tempOffset[:,axis])
+	
+	metrologyToScienceOffset = slotResults.metrologyToScienceOffset
 
-		#Compute the overall positioner center
-		modelCenter[0] = np.mean(np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_ALPHA,0]))
-		modelCenter[1] = np.mean(np.ravel(fittedCircles[:,DEFINES.PARAM_AXIS_ALPHA,1]))
+	#modelError #Total, Xerr, Yerr, AcrossErr, AlongErr
+	direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER
 
-		# Compute arm angles and arm lengths at all measured points
-		for axis in axesToTest:
-			for startingPoint in range(0,nbStartingPoints):
-				centerX = fittedCircles[startingPoint,axis,0]
-				centerY = fittedCircles[startingPoint,axis,1]
+	meanAlphaMeasures = np.full((nbSteps),np.nan)
+	meanBetaMeasures = np.full((nbSteps),np.nan)
+	meanAlphaCommand = np.full((nbSteps),np.nan)
+	meanBetaCommand = np.full((nbSteps),np.nan)
 
-				for direction in range(0,nbDirections):
-					for step in range(0,nbSteps):
-						for repetition in range(0,nbRepetitions):
-							if not valuesToRemove[repetition,startingPoint,axis,step,direction]:
-								measureX = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
-								measureY = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
+	for step in range(0,nbSteps):
+		meanAlphaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_ALPHA,step,direction,0]))
+		meanBetaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_BETA,step,direction,0]))
+		meanAlphaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_ALPHA,step,direction,DEFINES.PARAM_AXIS_ALPHA]))
+		meanBetaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_BETA,step,direction,DEFINES.PARAM_AXIS_BETA]))
+	
+	if len(meanAlphaCommand) < 2 or len(meanBetaCommand) < 2 or len(meanAlphaMeasures) < 2 or len(meanBetaMeasures) < 2:
+		raise errors.Error("There must be at least 2 valid points to do an iterpolation")
 
-								measuredAngles[repetition,startingPoint,axis,step,direction,0] = np.mod(np.arctan2(measureX-centerX,measureY-centerY),2*np.pi)
-								
-								#Remove alpha angle from beta measures
-								if axis == DEFINES.PARAM_AXIS_BETA and DEFINES.PARAM_AXIS_ALPHA in axesToTest:
-									measuredAngles[repetition,startingPoint,axis,step,direction,0] -= measuredAngles[repetition,startingPoint,DEFINES.PARAM_AXIS_ALPHA,step,direction,1]
-								
-								#add measurement of the angle to the other axis' center
-								measuredLengths[repetition,startingPoint,axis,step,direction] = mm.dist((centerX,centerY),(measureX,measureY))
-								
-								if axis == DEFINES.PARAM_AXIS_BETA and DEFINES.PARAM_AXIS_ALPHA in axesToTest:
-									measureX = fittedCircles[startingPoint,axis,0]
-									measureY = fittedCircles[startingPoint,axis,1]
-									measuredAngles[repetition,startingPoint,axis,step,direction,1] = np.mod(np.arctan2(measureX-centerX,measureY-centerY),2*np.pi)
-
-								if axis == DEFINES.PARAM_AXIS_ALPHA and DEFINES.PARAM_AXIS_BETA in axesToTest:
-									measureX = fittedCircles[startingPoint,DEFINES.PARAM_AXIS_BETA,0]
-									measureY = fittedCircles[startingPoint,DEFINES.PARAM_AXIS_BETA,1]
-									measuredAngles[repetition,startingPoint,axis,step,direction,1] = np.mod(np.arctan2(measureX-centerX,measureY-centerY),2*np.pi)
-									degeneratedMeasuredLengths[repetition,startingPoint,axis,step,direction] = mm.dist((centerX,centerY),(measureX,measureY))
-
-								#store temporary non-linearity
-								modelNonLinearity[repetition,startingPoint,axis,step,direction] = np.mod(measuredAngles[repetition,startingPoint,axis,step,direction,0]-commandedAngle[startingPoint,axis,step,direction,axis]+np.pi,2*np.pi)-np.pi
-								
-								#compute hysteresis
-								if direction == DEFINES.MM_IMG_ID_CLOCKWIZE_DIR_IDENTIFIER:
-									measuredHysteresis[repetition,startingPoint,axis,step] = np.mod(measuredAngles[repetition,startingPoint,axis,step,DEFINES.MM_IMG_ID_CLOCKWIZE_DIR_IDENTIFIER,0]-measuredAngles[repetition,startingPoint,axis,step,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0]+np.pi,2*np.pi)-np.pi
+	#construct the alpha and beta approximators
+	alphaIterpolator = interpolate.interp1d(meanAlphaCommand, meanAlphaMeasures, kind='linear', fill_value='extrapolate') #gives the real value out of the command
+	betaIterpolator = interpolate.interp1d(meanBetaCommand, meanBetaMeasures, kind='linear', fill_value='extrapolate')
 
-					#Degenerated is the non-linearity using the Center-to-center parameters
-					if axis == DEFINES.PARAM_AXIS_ALPHA and DEFINES.PARAM_AXIS_BETA in axesToTest:
-						degeneratedNonLinearity[startingPoint,direction] = np.nanmean(np.ravel(np.mod(measuredAngles[:,startingPoint,axis,0,direction,1]-commandedAngle[startingPoint,DEFINES.PARAM_AXIS_BETA,0,direction,DEFINES.PARAM_AXIS_ALPHA]+np.pi,2*np.pi)-np.pi))
+	offsetAlpha_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_ALPHA]/np.pi
+	offsetBeta_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_BETA]/np.pi
 
-				#Get all the offsets in the same 180°. For example, measure of 179° and -179° should give 180° offset, not 0°.
-				referenceOffset = modelNonLinearity[0,startingPoint,axis,0,0]
-				for direction in range(0,nbDirections):
-					for repetition in range(0,nbRepetitions):
-						for step in range(0,nbSteps):
-							while referenceOffset - modelNonLinearity[repetition,startingPoint,axis,step,direction] < -np.pi:
-								modelNonLinearity[repetition,startingPoint,axis,step,direction] -= 2*np.pi
-							while referenceOffset - modelNonLinearity[repetition,startingPoint,axis,step,direction] > np.pi:
-								modelNonLinearity[repetition,startingPoint,axis,step,direction] += 2*np.pi
+	params = (	modelCenter[0],modelCenter[1],\
+				modelArmLengths[DEFINES.PARAM_AXIS_ALPHA],modelArmLengths[DEFINES.PARAM_AXIS_BETA],\
+				modelOffsets[DEFINES.PARAM_AXIS_ALPHA],modelOffsets[DEFINES.PARAM_AXIS_BETA])
 
-				#get offset from the temporary non-linearity and remove it
-				tempOffset[startingPoint,axis] = np.nanmean(np.ravel(modelNonLinearity[:,startingPoint,axis,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER]))
-				measuredAngles[:,startingPoint,axis,:,:,0] -= tempOffset[startingPoint,axis]
+	modelFit = mm.rms_model_error(	params,\
+									commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_BETA],\
+									alphaIterpolator,betaIterpolator,\
+									sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,1])
 
-				for direction in range(0,nbDirections):
-					for step in range(0,nbSteps):
-						for repetition in range(0,nbRepetitions):
-							#get the measured angles in the same full rotation as the command (i.e. a -5° measure should be mapped to the -5° command, and not remain 355°)
-							while commandedAngle[startingPoint,axis,step,direction,axis]-measuredAngles[repetition,startingPoint,axis,step,direction,0] < -np.pi:
-								measuredAngles[repetition,startingPoint,axis,step,direction,0] -= 2*np.pi
-							while commandedAngle[startingPoint,axis,step,direction,axis]-measuredAngles[repetition,startingPoint,axis,step,direction,0] > np.pi:
-								measuredAngles[repetition,startingPoint,axis,step,direction,0] += 2*np.pi
-							
-							modelNonLinearity[repetition,startingPoint,axis,step,direction] = np.mod(measuredAngles[repetition,startingPoint,axis,step,direction,0]-commandedAngle[startingPoint,axis,step,direction,axis]+np.pi,2*np.pi)-np.pi
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,1,f'Model fit before optimization: {modelFit:8.3f} [um]')
 
-				#compute non-linearity derivative
-				for direction in range(0,nbDirections):
-					for step in range(0,nbSteps-1):
-						for repetition in range(0,nbRepetitions):
-							if not valuesToRemove[repetition,startingPoint,axis,step,direction]:
-								angleInc = np.abs(commandedAngle[startingPoint,axis,step,direction,axis]-commandedAngle[startingPoint,axis,step+1,direction,axis])
-								nonLinInc = np.abs(modelNonLinearity[repetition,startingPoint,axis,step,direction]-modelNonLinearity[repetition,startingPoint,axis,step+1,direction])
-								modelNLDerivative[repetition,startingPoint,axis,step,direction] = nonLinInc/angleInc
-
-			#store the model arm length
-			if axis == DEFINES.PARAM_AXIS_ALPHA and DEFINES.PARAM_AXIS_BETA in axesToTest:
-				modelArmLengths[axis] = np.nanmean(np.ravel(degeneratedMeasuredLengths[:,:,axis,:,:]))
-			else:
-				modelArmLengths[axis] = np.nanmean(np.ravel(measuredLengths[:,:,axis,:,:]))
-			
-			#store the offset for the model
-			if axis == DEFINES.PARAM_AXIS_ALPHA:
-				if DEFINES.PARAM_AXIS_BETA in axesToTest:
-					modelOffsets[axis] = np.nanmean(np.ravel(degeneratedNonLinearity[:,:]))
-				else:
-					modelOffsets[axis] = 0 #Cannot be determined
-			if axis == DEFINES.PARAM_AXIS_BETA:
-				modelOffsets[axis] = np.nanmean(tempOffset[:,axis])
-		
-		metrologyToScienceOffset = calibResults[slot].metrologyToScienceOffset
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Length alpha: {modelArmLengths[DEFINES.PARAM_AXIS_ALPHA]:5.2f} [mm]',removeMsgHeader = False)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Length beta : {modelArmLengths[DEFINES.PARAM_AXIS_BETA]+metrologyToScienceOffset:5.2f} [mm]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Offset alpha: {offsetAlpha_deg:5.2f} [°]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Offset beta : {offsetBeta_deg:5.2f} [°]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Center X    : {modelCenter[0]:5.2f} [mm]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Center Y    : {modelCenter[1]:5.2f} [mm]',removeMsgHeader = True)
 
-		#modelError #Total, Xerr, Yerr, AcrossErr, AlongErr
-		direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER
+	#optimize the model
+	params = mm.optimize_model(	modelCenter[0],modelCenter[1],\
+								modelArmLengths[DEFINES.PARAM_AXIS_ALPHA],modelArmLengths[DEFINES.PARAM_AXIS_BETA],\
+								modelOffsets[DEFINES.PARAM_AXIS_ALPHA],modelOffsets[DEFINES.PARAM_AXIS_BETA],\
+								commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_BETA],\
+								measuredAngles[:,:,DEFINES.PARAM_AXIS_ALPHA,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],measuredAngles[:,:,DEFINES.PARAM_AXIS_BETA,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],\
+								sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,1])
 
-		meanAlphaMeasures = np.full((nbSteps),np.nan)
-		meanBetaMeasures = np.full((nbSteps),np.nan)
-		meanAlphaCommand = np.full((nbSteps),np.nan)
-		meanBetaCommand = np.full((nbSteps),np.nan)
 
-		for step in range(0,nbSteps):
-			meanAlphaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_ALPHA,step,direction,0]))
-			meanBetaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_BETA,step,direction,0]))
-			meanAlphaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_ALPHA,step,direction,DEFINES.PARAM_AXIS_ALPHA]))
-			meanBetaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_BETA,step,direction,DEFINES.PARAM_AXIS_BETA]))
-		
-		if len(meanAlphaCommand) < 2 or len(meanBetaCommand) < 2 or len(meanAlphaMeasures) < 2 or len(meanBetaMeasures) < 2:
-			raise errors.Error("There must be at least 2 valid points to do an iterpolation")
-
-		#construct the alpha and beta approximators
-		alphaIterpolator = interpolate.interp1d(meanAlphaCommand, meanAlphaMeasures, kind='linear', fill_value='extrapolate') #gives the real value out of the command
-		betaIterpolator = interpolate.interp1d(meanBetaCommand, meanBetaMeasures, kind='linear', fill_value='extrapolate')
-
-		offsetAlpha_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_ALPHA]/np.pi
-		offsetBeta_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_BETA]/np.pi
-
-		params = (	modelCenter[0],modelCenter[1],\
-					modelArmLengths[DEFINES.PARAM_AXIS_ALPHA],modelArmLengths[DEFINES.PARAM_AXIS_BETA],\
-					modelOffsets[DEFINES.PARAM_AXIS_ALPHA],modelOffsets[DEFINES.PARAM_AXIS_BETA])
-
-		modelFit = mm.rms_model_error(	params,\
-										commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_BETA],\
-										alphaIterpolator,betaIterpolator,\
-										sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,1])
-
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,1,f'Model fit before optimization: {modelFit:8.3f} [um]')
-
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Length alpha: {modelArmLengths[DEFINES.PARAM_AXIS_ALPHA]:5.2f} [mm]',removeMsgHeader = False)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Length beta : {modelArmLengths[DEFINES.PARAM_AXIS_BETA]+metrologyToScienceOffset:5.2f} [mm]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Offset alpha: {offsetAlpha_deg:5.2f} [°]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Offset beta : {offsetBeta_deg:5.2f} [°]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Center X    : {modelCenter[0]:5.2f} [mm]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,2,f'Center Y    : {modelCenter[1]:5.2f} [mm]',removeMsgHeader = True)
-
-		#optimize the model
-		params = mm.optimize_model(	modelCenter[0],modelCenter[1],\
-									modelArmLengths[DEFINES.PARAM_AXIS_ALPHA],modelArmLengths[DEFINES.PARAM_AXIS_BETA],\
-									modelOffsets[DEFINES.PARAM_AXIS_ALPHA],modelOffsets[DEFINES.PARAM_AXIS_BETA],\
-									commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_BETA],\
-									measuredAngles[:,:,DEFINES.PARAM_AXIS_ALPHA,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],measuredAngles[:,:,DEFINES.PARAM_AXIS_BETA,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],\
-									sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,1])
+	# Compute eccentricity parameters
+	for axis in axesToTest:
+		for startingPoint in range(0,nbStartingPoints):
+			modelEccentricity[:,startingPoint,axis,:,:] = np.subtract(measuredLengths[:,startingPoint,axis,:,:],fittedCircles[startingPoint,axis,2])
 
 
-		# Compute eccentricity parameters
-		for axis in axesToTest:
-			for startingPoint in range(0,nbStartingPoints):
-				modelEccentricity[:,startingPoint,axis,:,:] = np.subtract(measuredLengths[:,startingPoint,axis,:,:],fittedCircles[startingPoint,axis,2])
+	(modelCenter[0],modelCenter[1],\
+	modelArmLengths[DEFINES.PARAM_AXIS_ALPHA],modelArmLengths[DEFINES.PARAM_AXIS_BETA],\
+	modelOffsets[DEFINES.PARAM_AXIS_ALPHA],modelOffsets[DEFINES.PARAM_AXIS_BETA])			= params
 
+	#Compute Model error
+	#modelError #Total, Xerr, Yerr, AcrossErr, AlongErr
+	direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER
 
-		(modelCenter[0],modelCenter[1],\
-		modelArmLengths[DEFINES.PARAM_AXIS_ALPHA],modelArmLengths[DEFINES.PARAM_AXIS_BETA],\
-		modelOffsets[DEFINES.PARAM_AXIS_ALPHA],modelOffsets[DEFINES.PARAM_AXIS_BETA])			= params
+	meanAlphaMeasures = np.full((nbSteps),np.nan)
+	meanBetaMeasures = np.full((nbSteps),np.nan)
+	meanAlphaCommand = np.full((nbSteps),np.nan)
+	meanBetaCommand = np.full((nbSteps),np.nan)
 
-		#Compute Model error
-		#modelError #Total, Xerr, Yerr, AcrossErr, AlongErr
-		direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER
+	for step in range(0,nbSteps):
+		meanAlphaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_ALPHA,step,direction,0]))
+		meanBetaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_BETA,step,direction,0]))
+		meanAlphaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_ALPHA,step,direction,DEFINES.PARAM_AXIS_ALPHA]))
+		meanBetaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_BETA,step,direction,DEFINES.PARAM_AXIS_BETA]))
+	
+	meanAlphaCommand = meanAlphaCommand[~np.isnan(meanAlphaMeasures)]
+	meanBetaCommand = meanBetaCommand[~np.isnan(meanBetaMeasures)]
+	meanAlphaMeasures = meanAlphaMeasures[~np.isnan(meanAlphaMeasures)]
+	meanBetaMeasures = meanBetaMeasures[~np.isnan(meanBetaMeasures)]
 
-		meanAlphaMeasures = np.full((nbSteps),np.nan)
-		meanBetaMeasures = np.full((nbSteps),np.nan)
-		meanAlphaCommand = np.full((nbSteps),np.nan)
-		meanBetaCommand = np.full((nbSteps),np.nan)
+	#construct the alpha and beta approximators
+	alphaIterpolator = interpolate.interp1d(meanAlphaCommand, meanAlphaMeasures, kind='linear', fill_value='extrapolate') #gives the real value out of the command
+	betaIterpolator = interpolate.interp1d(meanBetaCommand, meanBetaMeasures, kind='linear', fill_value='extrapolate')
 
-		for step in range(0,nbSteps):
-			meanAlphaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_ALPHA,step,direction,0]))
-			meanBetaMeasures[step] = np.nanmean(np.ravel(measuredAngles[:,:,DEFINES.PARAM_AXIS_BETA,step,direction,0]))
-			meanAlphaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_ALPHA,step,direction,DEFINES.PARAM_AXIS_ALPHA]))
-			meanBetaCommand[step] = np.nanmean(np.ravel(commandedAngle[:,DEFINES.PARAM_AXIS_BETA,step,direction,DEFINES.PARAM_AXIS_BETA]))
-		
-		meanAlphaCommand = meanAlphaCommand[~np.isnan(meanAlphaMeasures)]
-		meanBetaCommand = meanBetaCommand[~np.isnan(meanBetaMeasures)]
-		meanAlphaMeasures = meanAlphaMeasures[~np.isnan(meanAlphaMeasures)]
-		meanBetaMeasures = meanBetaMeasures[~np.isnan(meanBetaMeasures)]
-
-		#construct the alpha and beta approximators
-		alphaIterpolator = interpolate.interp1d(meanAlphaCommand, meanAlphaMeasures, kind='linear', fill_value='extrapolate') #gives the real value out of the command
-		betaIterpolator = interpolate.interp1d(meanBetaCommand, meanBetaMeasures, kind='linear', fill_value='extrapolate')
-
-		modelFit = mm.rms_model_error(	params,\
-										commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_BETA],\
-										alphaIterpolator,betaIterpolator,\
-										sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,1])
-		
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,1,f'Model fit after optimization: {modelFit:8.3f} [um]')
-
-		offsetAlpha_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_ALPHA]/np.pi
-		offsetBeta_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_BETA]/np.pi
-
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Length alpha: {modelArmLengths[DEFINES.PARAM_AXIS_ALPHA]:5.2f} [mm]',removeMsgHeader = False)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Length beta : {modelArmLengths[DEFINES.PARAM_AXIS_BETA]+metrologyToScienceOffset:5.2f} [mm]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Offset alpha: {offsetAlpha_deg:5.2f} [°]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Offset beta : {offsetBeta_deg:5.2f} [°]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Center X    : {modelCenter[0]:5.2f} [mm]',removeMsgHeader = True)
-		log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Center Y    : {modelCenter[1]:5.2f} [mm]',removeMsgHeader = True)
-
-		#Total, Xerr, Yerr
-		(	modelError[:,:,:,:,direction,0],\
-			modelError[:,:,:,:,direction,1],\
-			modelError[:,:,:,:,direction,2]) 	= mm.model_error(	params,\
-																	commandedAngle[:,:,:,direction,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,direction,DEFINES.PARAM_AXIS_BETA],\
-																	alphaIterpolator,betaIterpolator,\
-																	sortedCentroidsXY[:,:,:,:,direction,0],sortedCentroidsXY[:,:,:,:,direction,1],\
-																	True)
-		
-		#AcrossErr, AlongErr
+	modelFit = mm.rms_model_error(	params,\
+									commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,DEFINES.PARAM_AXIS_BETA],\
+									alphaIterpolator,betaIterpolator,\
+									sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0],sortedCentroidsXY[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,1])
+	
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,1,f'Model fit after optimization: {modelFit:8.3f} [um]')
+
+	offsetAlpha_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_ALPHA]/np.pi
+	offsetBeta_deg = 180*modelOffsets[DEFINES.PARAM_AXIS_BETA]/np.pi
+
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Length alpha: {modelArmLengths[DEFINES.PARAM_AXIS_ALPHA]:5.2f} [mm]',removeMsgHeader = False)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Length beta : {modelArmLengths[DEFINES.PARAM_AXIS_BETA]+metrologyToScienceOffset:5.2f} [mm]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Offset alpha: {offsetAlpha_deg:5.2f} [°]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Offset beta : {offsetBeta_deg:5.2f} [°]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Center X    : {modelCenter[0]:5.2f} [mm]',removeMsgHeader = True)
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,2,f'Center Y    : {modelCenter[1]:5.2f} [mm]',removeMsgHeader = True)
+
+	#Total, Xerr, Yerr
+	(	modelError[:,:,:,:,direction,0],\
+		modelError[:,:,:,:,direction,1],\
+		modelError[:,:,:,:,direction,2]) 	= mm.model_error(	params,\
+																commandedAngle[:,:,:,direction,DEFINES.PARAM_AXIS_ALPHA],commandedAngle[:,:,:,direction,DEFINES.PARAM_AXIS_BETA],\
+																alphaIterpolator,betaIterpolator,\
+																sortedCentroidsXY[:,:,:,:,direction,0],sortedCentroidsXY[:,:,:,:,direction,1],\
+																True)
+	
+	#AcrossErr, AlongErr
+	for axis in axesToTest:
+		for startingPoint in range(0,nbStartingPoints):
+			centerX = fittedCircles[startingPoint,axis][0]
+			centerY = fittedCircles[startingPoint,axis][1]
+			for step in range(0,nbSteps):
+				for repetition in range(0,nbRepetitions):
+					measureX = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
+					measureY = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
+					modelX = measureX + modelError[repetition,startingPoint,axis,step,direction,1]
+					modelY = measureY + modelError[repetition,startingPoint,axis,step,direction,2]
+
+					#Project XY error on a radius-angle error (along, across)
+					angle1 = np.mod(np.arctan2(measureY-modelY,measureX-modelX),2*np.pi) #Angle between Ox, centroid and fittingCenter
+					angle2 = np.mod(np.arctan2(measureY-centerY,measureX-centerX),2*np.pi) #Angle between Ox, centroid and model
+					angleDiff = angle1-angle2 #Angle between model, centroid and fittingCenter
+
+					if angleDiff > np.pi:
+						angleDiff-= 2*np.pi
+					elif angleDiff < -np.pi:
+						angleDiff+= 2*np.pi
+
+					modelError[repetition,startingPoint,axis,step,direction,3] = modelError[repetition,startingPoint,axis,step,direction,0]*np.sin(angleDiff)
+					modelError[repetition,startingPoint,axis,step,direction,4] = modelError[repetition,startingPoint,axis,step,direction,0]*np.cos(angleDiff)
+
+	#Compute repeatability
+	#measuredRepeatability #Total, X, Y, Across, Along
+	if nbRepetitions > 1:
 		for axis in axesToTest:
 			for startingPoint in range(0,nbStartingPoints):
 				centerX = fittedCircles[startingPoint,axis][0]
 				centerY = fittedCircles[startingPoint,axis][1]
-				for step in range(0,nbSteps):
-					for repetition in range(0,nbRepetitions):
-						measureX = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
-						measureY = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
-						modelX = measureX + modelError[repetition,startingPoint,axis,step,direction,1]
-						modelY = measureY + modelError[repetition,startingPoint,axis,step,direction,2]
-
-						#Project XY error on a radius-angle error (along, across)
-						angle1 = np.mod(np.arctan2(measureY-modelY,measureX-modelX),2*np.pi) #Angle between Ox, centroid and fittingCenter
-						angle2 = np.mod(np.arctan2(measureY-centerY,measureX-centerX),2*np.pi) #Angle between Ox, centroid and model
-						angleDiff = angle1-angle2 #Angle between model, centroid and fittingCenter
-
-						if angleDiff > np.pi:
-							angleDiff-= 2*np.pi
-						elif angleDiff < -np.pi:
-							angleDiff+= 2*np.pi
-
-						modelError[repetition,startingPoint,axis,step,direction,3] = modelError[repetition,startingPoint,axis,step,direction,0]*np.sin(angleDiff)
-						modelError[repetition,startingPoint,axis,step,direction,4] = modelError[repetition,startingPoint,axis,step,direction,0]*np.cos(angleDiff)
-
-		#Compute repeatability
-		#measuredRepeatability #Total, X, Y, Across, Along
-		if nbRepetitions > 1:
-			for axis in axesToTest:
-				for startingPoint in range(0,nbStartingPoints):
-					centerX = fittedCircles[startingPoint,axis][0]
-					centerY = fittedCircles[startingPoint,axis][1]
-					for direction in range(0,nbDirections):
-						for step in range(0,nbSteps):
-							meanPointX = np.nanmean(sortedCentroidsXY[:,startingPoint,axis,step,direction,0])
-							meanPointY = np.nanmean(sortedCentroidsXY[:,startingPoint,axis,step,direction,1])
-							for repetition in range(0,nbRepetitions):
-								measureX = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
-								measureY = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
-								repeatabilityX = meanPointX-measureX
-								repeatabilityY = meanPointY-measureY
-								repeatabilityTotal = np.sqrt(repeatabilityX**2+repeatabilityY**2)
-
-								#Project XY error on a radius-angle error (along, across)
-								angle1 = np.mod(np.arctan2(measureY-repeatabilityY,measureX-repeatabilityX),2*np.pi) #Angle between Ox, centroid and fittingCenter
-								angle2 = np.mod(np.arctan2(measureY-centerY,measureX-centerX),2*np.pi) #Angle between Ox, centroid and model
-								angleDiff = angle1-angle2 #Angle between model, centroid and fittingCenter
-
-								if angleDiff > np.pi:
-									angleDiff-= 2*np.pi
-								elif angleDiff < -np.pi:
-									angleDiff+= 2*np.pi
-
-								measuredRepeatability[repetition,startingPoint,axis,step,direction,0] = repeatabilityTotal
-								measuredRepeatability[repetition,startingPoint,axis,step,direction,1] = repeatabilityX
-								measuredRepeatability[repetition,startingPoint,axis,step,direction,2] = repeatabilityY
-								measuredRepeatability[repetition,startingPoint,axis,step,direction,3] = repeatabilityTotal*np.sin(angleDiff)
-								measuredRepeatability[repetition,startingPoint,axis,step,direction,4] = repeatabilityTotal*np.cos(angleDiff)
-
-		mesAlphaLength = modelArmLengths[DEFINES.PARAM_AXIS_ALPHA]
-		mesBetaLength = modelArmLengths[DEFINES.PARAM_AXIS_BETA]+metrologyToScienceOffset
-		mesRMSModelFit = 1000*mm.nanrms(np.ravel(modelError[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0]))
-		mesRMSRepeatability = 1000*mm.nanrms(np.ravel(measuredRepeatability[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0]))
-		mesMaxHysteresis = 180*np.nanmax(np.abs(np.ravel(measuredHysteresis[:,:,:,:])))/np.pi
-		mesMaxNL = 180*np.nanmax(np.abs(np.ravel(modelNonLinearity[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER])))/np.pi
-		mesMaxNLDerivative = np.nanmax(np.ravel(modelNLDerivative[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER]))
-		mesRMSAlignmentError = np.nan
-		mesMaxAlignmentError = np.nan
-		mesMaxRoundnessError = 1000*np.nanmax(np.abs(np.ravel(modelEccentricity[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER])))
-
-		# Store the results
-		calibResults[slot].fittedCircles 			= fittedCircles
-		calibResults[slot].measuredAngles 			= measuredAngles
-		calibResults[slot].measuredLengths 			= measuredLengths
-		calibResults[slot].measuredHysteresis 		= measuredHysteresis
-		calibResults[slot].measuredRepeatability 	= measuredRepeatability
-		calibResults[slot].modelError 				= modelError
-		calibResults[slot].modelCenter				= modelCenter
-		calibResults[slot].modelOffsets				= modelOffsets
-		calibResults[slot].modelArmLengths			= modelArmLengths
-		calibResults[slot].modelNonLinearity		= modelNonLinearity
-		calibResults[slot].modelNLDerivative		= modelNLDerivative
-		calibResults[slot].modelEccentricity 		= modelEccentricity
-		calibResults[slot].valuesToRemove			= valuesToRemove
-		calibResults[slot].metrologyToScienceOffset = metrologyToScienceOffset
-		calibResults[slot].mesAlphaLength.append(		mesAlphaLength)
-		calibResults[slot].mesBetaLength.append(		mesBetaLength)
-		calibResults[slot].mesRMSModelFit.append(		mesRMSModelFit)
-		calibResults[slot].mesRMSRepeatability.append(	mesRMSRepeatability)
-		calibResults[slot].mesMaxHysteresis.append(		mesMaxHysteresis)
-		calibResults[slot].mesMaxNL.append(				mesMaxNL)
-		calibResults[slot].mesMaxNLDerivative.append(	mesMaxNLDerivative)
-		calibResults[slot].mesRMSAlignmentError.append(	mesRMSAlignmentError)
-		calibResults[slot].mesMaxAlignmentError.append(	mesMaxAlignmentError)
-		calibResults[slot].mesMaxRoundnessError.append(	mesMaxRoundnessError)
-		calibResults[slot].calcDone 				= True
+				for direction in range(0,nbDirections):
+					for step in range(0,nbSteps):
+						meanPointX = np.nanmean(sortedCentroidsXY[:,startingPoint,axis,step,direction,0])
+						meanPointY = np.nanmean(sortedCentroidsXY[:,startingPoint,axis,step,direction,1])
+						for repetition in range(0,nbRepetitions):
+							measureX = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,0]
+							measureY = sortedCentroidsXY[repetition,startingPoint,axis,step,direction,1]
+							repeatabilityX = meanPointX-measureX
+							repeatabilityY = meanPointY-measureY
+							repeatabilityTotal = np.sqrt(repeatabilityX**2+repeatabilityY**2)
+
+							#Project XY error on a radius-angle error (along, across)
+							angle1 = np.mod(np.arctan2(measureY-repeatabilityY,measureX-repeatabilityX),2*np.pi) #Angle between Ox, centroid and fittingCenter
+							angle2 = np.mod(np.arctan2(measureY-centerY,measureX-centerX),2*np.pi) #Angle between Ox, centroid and model
+							angleDiff = angle1-angle2 #Angle between model, centroid and fittingCenter
+
+							if angleDiff > np.pi:
+								angleDiff-= 2*np.pi
+							elif angleDiff < -np.pi:
+								angleDiff+= 2*np.pi
+
+							measuredRepeatability[repetition,startingPoint,axis,step,direction,0] = repeatabilityTotal
+							measuredRepeatability[repetition,startingPoint,axis,step,direction,1] = repeatabilityX
+							measuredRepeatability[repetition,startingPoint,axis,step,direction,2] = repeatabilityY
+							measuredRepeatability[repetition,startingPoint,axis,step,direction,3] = repeatabilityTotal*np.sin(angleDiff)
+							measuredRepeatability[repetition,startingPoint,axis,step,direction,4] = repeatabilityTotal*np.cos(angleDiff)
+
+	mesAlphaLength = modelArmLengths[DEFINES.PARAM_AXIS_ALPHA]
+	mesBetaLength = modelArmLengths[DEFINES.PARAM_AXIS_BETA]+metrologyToScienceOffset
+	mesRMSModelFit = 1000*mm.nanrms(np.ravel(modelError[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0]))
+	mesRMSRepeatability = 1000*mm.nanrms(np.ravel(measuredRepeatability[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER,0]))
+	mesMaxHysteresis = 180*np.nanmax(np.abs(np.ravel(measuredHysteresis[:,:,:,:])))/np.pi
+	mesMaxNL = 180*np.nanmax(np.abs(np.ravel(modelNonLinearity[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER])))/np.pi
+	mesMaxNLDerivative = np.nanmax(np.ravel(modelNLDerivative[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER]))
+	mesRMSAlignmentError = np.nan
+	mesMaxAlignmentError = np.nan
+	mesMaxRoundnessError = 1000*np.nanmax(np.abs(np.ravel(modelEccentricity[:,:,:,:,DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER])))
+
+	# Store the results
+	slotResults.fittedCircles			= fittedCircles
+	slotResults.measuredAngles			= measuredAngles
+	slotResults.measuredLengths			= measuredLengths
+	slotResults.measuredHysteresis		= measuredHysteresis
+	slotResults.measuredRepeatability	= measuredRepeatability
+	slotResults.modelError				= modelError
+	slotResults.modelCenter				= modelCenter
+	slotResults.modelOffsets			= modelOffsets
+	slotResults.modelArmLengths			= modelArmLengths
+	slotResults.modelNonLinearity		= modelNonLinearity
+	slotResults.modelNLDerivative		= modelNLDerivative
+	slotResults.modelEccentricity		= modelEccentricity
+	slotResults.valuesToRemove			= valuesToRemove
+	slotResults.metrologyToScienceOffset = metrologyToScienceOffset
+	slotResults.mesAlphaLength.append(			mesAlphaLength)
+	slotResults.mesBetaLength.append(			mesBetaLength)
+	slotResults.mesRMSModelFit.append(			mesRMSModelFit)
+	slotResults.mesRMSRepeatability.append(		mesRMSRepeatability)
+	slotResults.mesMaxHysteresis.append(		mesMaxHysteresis)
+	slotResults.mesMaxNL.append(				mesMaxNL)
+	slotResults.mesMaxNLDerivative.append(		mesMaxNLDerivative)
+	slotResults.mesRMSAlignmentError.append(	mesRMSAlignmentError)
+	slotResults.mesMaxAlignmentError.append(	mesMaxAlignmentError)
+	slotResults.mesMaxRoundnessError.append(	mesMaxRoundnessError)
+	slotResults.calcDone				= True
+
+	return slotResults
 
 def update_positioners_model(calibResults, testBench):
 	nbSlots = len(calibResults)
@@ -17,8 +17,15 @@
 #   Prints the values of the centroid of the light dot
 ##############################################################################
 
-from pypylon import pylon as pypylon
-from pypylon import genicam
+try:
+    from pypylon import pylon as pypylon
+    from pypylon import genicam
+except ImportError:
+    #Without pypylon, only the synthetic cameras are available
+    pypylon = None
+    class genicam:
+        class GenericException(Exception):
+            pass
 import logger as log
 import numpy as np
 import sys
@@ -27,17 +34,20 @@ from scipy import io
 from skimage.filters import gaussian as gaussianFilter
 import matplotlib.pyplot as plt
 import miscmath as mm
+import distortionMap as dm
 import time
+import threading
+import queue
 import DEFINES
 import errors
+import tracing
 
 #REPLACE THIS MODULE WITH THE CLASS
 class CameraParameters:
     __slots__ = (   'cameraType',\
                     'maxX',\
                     'maxY',\
-                    'xCorr',\
-                    'yCorr',\
+                    'distortionMap',\
                     'scaleFactor',\
                     'ROICenter',\
                     'validityRadius',\
@@ -59,8 +69,7 @@ class CameraParameters:
             self.maxX = 0
             self.maxY = 0
 
-        self.xCorr = np.zeros((self.maxX, self.maxY))
-        self.yCorr = np.zeros((self.maxX, self.maxY))
+        self.distortionMap = dm.DistortionMap(shape = (self.maxY, self.maxX))
 
         self.ROICenter = (self.maxX/2,self.maxY/2)
         self.validityRadius = np.sqrt(self.maxX**2+self.maxY**2)
@@ -74,15 +83,39 @@ class CameraParameters:
         self.ID = -1
         self.softROIrequired = True
 
+class PylonBackend:
+    """Basler cameras, through pypylon. A camera backend enumerates the devices and creates their handles, which
+    behave as pypylon InstantCamera objects. See syntheticCamera.SyntheticBackend for the rendered cameras."""
+    __slots__ = ()
+
+    @property
+    def timeoutHandling(self):
+        return pypylon.TimeoutHandling_Return
+
+    def enumerate_devices(self):
+        if pypylon is None:
+            return []
+        return pypylon.TlFactory.GetInstance().EnumerateDevices()
+
+    def create_camera(self, deviceInfo):
+        return pypylon.InstantCamera(pypylon.TlFactory.GetInstance().CreateDevice(deviceInfo))
+
+    def load_distortion_map(self, fileName):
+        return dm.DistortionMap(fileName)
+
 class Camera:
     __slots__ = (   'connected',\
                     'parameters',\
-                    'camHandle')
+                    'backend',\
+                    'camHandle',\
+                    'accumulator')
 
-    def __init__(self, cameraType = None, compatibleCameraID = None):
+    def __init__(self, cameraType = None, compatibleCameraID = None, backend = None):
 
         self.connected = False
+        self.accumulator = None
         self.parameters = CameraParameters(cameraType)
+        self.backend = PylonBackend() if backend is None else backend
         if cameraType is not None:
             self.connect(cameraType, compatibleCameraID)
 
@@ -108,9 +141,7 @@ class Camera:
                     raise TypeError
 
                 #initalize the camera
-                tlf = pypylon.TlFactory.GetInstance()
-
-                available_cameras = tlf.EnumerateDevices()
+                available_cameras = self.backend.enumerate_devices()
                 available_ids = np.zeros(len(available_cameras))
 
                 for i in range(0,len(available_cameras)):
@@ -118,7 +149,7 @@ class Camera:
                     if available_ids[i] == compatibleCameraID or compatibleCameraID == None:
                         cameraAlreadyUsed = False
                         try:
-                            self.camHandle = pypylon.InstantCamera(tlf.CreateDevice(available_cameras[i]))
+                            self.camHandle = self.backend.create_camera(available_cameras[i])
                         except genicam.GenericException:
                             cameraAlreadyUsed = True
                             log.message(DEFINES.LOG_MESSAGE_PRIORITY_WARNING, 0, f'Camera {available_ids[i]:.0f} is already used in another application')
@@ -170,25 +201,9 @@ class Camera:
 
             fileName = os.path.join(config.get_camera_path(), 'camera_'+str(self.parameters.ID)+config.cameraFileExtension)
 
-            #load the camera distortion parameters
-            try:
-                cam_distortion = io.loadmat(fileName)
-            except genicam.GenericException:
-                raise errors.IOError("Camera distortion file could not be loaded") from None
-                return
-
-            try:
-                cam_distortion = cam_distortion[DEFINES.PC_FILE_DISTORTION_PARAMETERS_NAME]
-
-                cam_x_corr = cam_distortion[DEFINES.PC_FILE_DISTORTION_XCORR_NAME]
-                cam_y_corr = cam_distortion[DEFINES.PC_FILE_DISTORTION_YCORR_NAME]
-                cam_scale_factor = cam_distortion[DEFINES.PC_FILE_DISTORTION_SCALE_FACTOR_NAME]
-
-                self.parameters.xCorr = np.nan_to_num(cam_x_corr[0,0])
-                self.parameters.yCorr = np.nan_to_num(cam_y_corr[0,0])
-                self.parameters.scaleFactor = cam_scale_factor[0,0][0,0]
-            except genicam.GenericException:
-                raise errors.IOError("Camera distortion file data is corrupted") from None
+            #load the camera distortion parameters, through their memory mapped cache
+            self.parameters.distortionMap = self.backend.load_distortion_map(fileName)
+            self.parameters.scaleFactor = self.parameters.distortionMap.scaleFactor
 
             return
 
@@ -293,58 +308,99 @@ class Camera:
         else:
             return mm.computeValidSoftROI(image, self.parameters.maxX, self.parameters.maxY, validityCenter, validityRadius)
 
-    def getImage(self, computationManager = None, imageID = None):
+    @tracing.traced(category = 'camera')
+    def getImage(self, processManager = None, imageID = None):
+        #directly send to computation queue if asked for
+        if processManager is not None and imageID is not None:
+            (frameIndex, image) = self.grabFrame(processManager)
+            try:
+                processManager.centroidQueuePutFrame(frameIndex, image, self.parameters.ROIoffsetX, self.parameters.ROIoffsetY, \
+                                                    [(imageID, None, self.parameters.ROICenter, DEFINES.PC_IMAGE_GET_ALL_ROI)], block = True)
+            except:
+                processManager.release_frame(frameIndex)
+                raise
+        else:
+            (frameIndex, image) = self._grabImage(None)
+        return image
+
+    @tracing.traced(category = 'camera')
+    def grabFrame(self, processManager):
+        #Grab the image directly in a free frame of the process manager shared memory. frameIndex is None if no frame buffer is available
+        return self._grabImage(processManager.frameBuffer)
+
+    def _grabImage(self, frameBuffer):
+        #Returns the average of the grabbed frames, written in a shared frame if frameBuffer is given
         if not self.connected:
             raise errors.CameraError("Camera is not connected") from None
         else:
+            if self.parameters.nbImagesToGrab*DEFINES.PC_CAMERA_MAX_INTENSITY_RAW > np.iinfo(DEFINES.PC_CAMERA_ACCUMULATOR_TYPE).max:
+                raise errors.OutOfRangeError("Too many images to grab for the accumulator") from None
             try:
-                #Initialize result container
-                i = 0
-                result = np.zeros((self.camHandle.Height.Value, self.camHandle.Width.Value), dtype = np.uint16);
-                #grab images
-                # t0 = time.perf_counter()
-
-                self.camHandle.StartGrabbingMax(self.parameters.nbImagesToGrab)
-                # t1 = time.perf_counter()
-                # print(f'StartGrab\t\t\t{t1-t0:3.3f}')
-                while self.camHandle.IsGrabbing():
-                    # t2 = time.perf_counter()
-                    grabResult = self.camHandle.RetrieveResult(DEFINES.PC_IMAGE_TIMEOUT, pypylon.TimeoutHandling_Return)
+                shape = (self.camHandle.Height.Value, self.camHandle.Width.Value)
 
-                    # t3 = time.perf_counter()
+                #Reuse the accumulator of the previous grabs
+                if self.accumulator is None or self.accumulator.shape != shape:
+                    self.accumulator = np.zeros(shape, dtype = DEFINES.PC_CAMERA_ACCUMULATOR_TYPE)
+                else:
+                    self.accumulator.fill(0)
 
-                    if grabResult.GrabSucceeded():
-                        result = np.add(grabResult.Array, result)
-                        grabResult.Release()
-                        i = i+1
-                    # t4 = time.perf_counter()
-                    # print(f'RetrieveResult\t\t\t{t3-t2:3.3f}')
-                    # print(f'Add and release result\t\t{t4-t3:3.3f}')
+                nbImages = self._accumulateFrames(self.accumulator)
+                if nbImages < 1:
+                    raise errors.CameraError("No image could be grabbed") from None
 
-                # t5 = time.perf_counter()
-                # print(f'Total grab\t\t\t{t5-t0:3.3f}')
                 #crop validity circle
                 if self.parameters.validityRadius != DEFINES.PC_IMAGE_GET_ALL_ROI:
                     validityCenter = (self.parameters.ROICenter[0]-self.camHandle.OffsetX.Value,self.parameters.ROICenter[1]-self.camHandle.OffsetY.Value)
-                    circularMask = mm.create_circular_mask(result.shape[0], result.shape[1], validityCenter, self.parameters.validityRadius)
-
-                    result[~circularMask] = 0
-                # t6 = time.perf_counter()
-                # print(f'Precropping circle\t\t{t6-t5:3.3f}')
-                image = np.divide(result, i)
-                # t7 = time.perf_counter()
-                # print(f'NP Divide image\t\t\t{t7-t6:3.3f}')
-                #directly send to computation queue if asked for
-                if computationManager is not None:
-                    computationManager.put_in_centroid_queue((image, self.parameters.ROIoffsetX, self.parameters.ROIoffsetY, imageID),block = True)
-                # t8 = time.perf_counter()
-                # print(f'Total execution\t\t\t{t8-t0:3.3f}')
-                #return image
-                return image
+                    circularMask = mm.create_circular_mask(shape[0], shape[1], validityCenter, self.parameters.validityRadius)
+
+                    self.accumulator[~circularMask] = 0
+
+                if frameBuffer is not None:
+                    #average directly in the shared frame
+                    (frameIndex, image) = frameBuffer.acquire_frame(shape)
+                    np.divide(self.accumulator, nbImages, out = image)
+                else:
+                    frameIndex = None
+                    image = np.divide(self.accumulator, nbImages)
+                return frameIndex, image
             except (genicam.GenericException, SystemError):
                 self.connected = False
                 raise errors.CameraError("Camera communication failed during image grabbing")
 
+    def _accumulateFrames(self, accumulator):
+        #Sum the grabbed frames in place in the accumulator. A background thread retrieves the next frame
+        #from the camera while the current one is added. Returns the number of frames summed
+        frames = queue.Queue()
+        retrievalErrors = []
+
+        def retrieveFrames():
+            try:
+                while self.camHandle.IsGrabbing():
+                    grabResult = self.camHandle.RetrieveResult(DEFINES.PC_IMAGE_TIMEOUT, self.backend.timeoutHandling)
+                    if grabResult.GrabSucceeded():
+                        frames.put(grabResult.Array)
+                        grabResult.Release()
+            except (genicam.GenericException, SystemError) as error:
+                retrievalErrors.append(error)
+            finally:
+                frames.put(None)
+
+        self.camHandle.StartGrabbingMax(self.parameters.nbImagesToGrab)
+        retrievalThread = threading.Thread(target = retrieveFrames, daemon = True)
+        retrievalThread.start()
+
+        nbImages = 0
+        frame = frames.get()
+        while frame is not None:
+            np.add(accumulator, frame, out = accumulator)
+            nbImages += 1
+            frame = frames.get()
+        retrievalThread.join()
+
+        if len(retrievalErrors) > 0:
+            raise retrievalErrors[0]
+        return nbImages
+
     def getOptimalExposure(self, initExposure):
         if not self.connected:
             raise errors.CameraError("Camera is not connected")
@@ -444,9 +500,11 @@ class Camera:
             pass
         self.connected = False
 
-def getAvailableCameraIDs():
+def getAvailableCameraIDs(backend = None):
     try:
-        available_cameras = pypylon.TlFactory.GetInstance().EnumerateDevices()
+        if backend is None:
+            backend = PylonBackend()
+        available_cameras = backend.enumerate_devices()
         available_ids = []
 
         for i in range(0,len(available_cameras)):
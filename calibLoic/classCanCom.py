@@ -1,9 +1,13 @@
 #cython: language_level=3
 import serial
+import struct
 import time
+import threading
+from collections import deque
 from serial.tools import list_ports
 import DEFINES
 import errors
+import tracing
 
 class StatusRegistery:
 # 	# Status register bits for system
@@ -80,6 +84,9 @@ class CAN_Options:
 	CAN_VCP_PORT		= -1		#Default initialization
 	CAN_ID_BIT_SHIFT 	= 18		#Bits to shift to get ID
 	CAN_CMD_BIT_SHIFT 	= 10		#Bits to shift to input the command
+	CAN_CMD_MASK		= 0xFF		#Bits of the command once shifted
+	CAN_RESPONSE_MASK	= 0x0F		#Bits of the response code in the arbitration ID of the replies
+	CAN_BROADCAST_ID	= 0			#ID received by all the positioners
 	TimeChannelSize		= 4			#Data size [byte]
 	DataChannelNumel	= 5			#Number of channels
 	DataChannelSize		= 4			#Data size [byte]
@@ -145,16 +152,91 @@ class COM_Options:
 	RX	= RX_Options()
 	STREG	= StatusRegistery()
 
+class CANCommand:
+	"""Layout of a positioner command answered by a single frame. The request fields are read from the data
+	dictionary by name and packed little endian into a reused buffer. The reply data is unpacked with replyFormat
+	and divided by replyScale if it is given."""
+	__slots__ = (	'name',\
+					'commandID',\
+					'requestFields',\
+					'requestLimits',\
+					'requestStruct',\
+					'replyStruct',\
+					'replyScale',\
+					'buffer')
+
+	def __init__(self, name, commandID, requestFields = (), replyFormat = '<', replyScale = None, requestLimits = None):
+		self.name			= name
+		self.commandID		= commandID
+		self.requestFields	= tuple(requestFields)
+		self.requestLimits	= requestLimits
+		self.requestStruct	= struct.Struct('<'+'I'*len(self.requestFields))
+		self.replyStruct	= struct.Struct(replyFormat)
+		self.replyScale		= replyScale
+		self.buffer			= bytearray(self.requestStruct.size)
+
+	def encode(self, positionerID, data):
+		#Returns the SLCAN frame of the request
+		if self.requestLimits is None:
+			values	= [data[field]&0xFFFFFFFF for field in self.requestFields]
+		else:
+			values	= [min(max(data[field], lower), upper)&0xFFFFFFFF for field, (lower, upper) in zip(self.requestFields, self.requestLimits)]
+		self.requestStruct.pack_into(self.buffer, 0, *values)
+		arbitrationID	= (self.commandID<<CAN_Options.CAN_CMD_BIT_SHIFT) + (positionerID<<CAN_Options.CAN_ID_BIT_SHIFT)
+		return f'T{arbitrationID:08X}{self.requestStruct.size:d}{self.buffer.hex().upper()}\r'.encode()
+
+	def decode(self, frame, positionerID):
+		#Checks a received frame and returns its data
+		if frame is None or not len(frame[4])	== self.replyStruct.size:
+			raise errors.CANError(f'CAN {self.name} received a wrong response from positioner {positionerID:04d}') from None
+		elif not frame[3]	== RX_Options.COMMAND_ACCEPTED:
+			raise errors.CANError(f'CAN {self.name} command was not accepted by the positioner with ID {positionerID:04d}') from None
+		if self.replyScale is None:
+			return list(self.replyStruct.unpack(frame[4]))
+		return [value/self.replyScale for value in self.replyStruct.unpack(frame[4])]
+
 class COM_handle:
 	__slots__	= (	'_OPT',\
 					'serHandle',\
 					'serialNo',\
-					'initialized')
+					'initialized',\
+					'frames',\
+					'framesCondition',\
+					'readerThread',\
+					'readerRunning')
+
+	#Commands answered by a single frame. They are sent by CAN_write, or to many positioners in one burst by CAN_write_many
+	COMMANDS	= {	'set_speed':					CANCommand('SetSpeed', RX_Options.SET_SPEED, ('SpeedAlpha', 'SpeedBeta')),\
+					'setopenloopcurrent':			CANCommand('SetCurrent', RX_Options.SET_CURRENT, ('currentAlpha', 'currentBeta'), requestLimits = ((0, 1024), (0, 1024))),\
+					'gotoposition_speed':			CANCommand('GoToPosition', RX_Options.GOTO_POSITION_ABSOLUTE, ('R1Steps', 'R2Steps'), '<II', DEFINES.CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY),\
+					'statusrequest':				CANCommand('StatutRequest', RX_Options.GET_STATUS, (), '<I'),\
+					'initdatum':					CANCommand('InitDatum', RX_Options.INIT_DATUM),\
+					'starttrajectory':				CANCommand('StartTrajectory', RX_Options.START_TRAJECTORY),\
+					'stoptrajectory':				CANCommand('StopTrajectory', RX_Options.STOP_TRAJECTORY),\
+					'set_position':					CANCommand('SetPosition', RX_Options.SET_ACTUAL_POSITION, ('Actual_alpha_pos', 'Actual_beta_pos')),\
+					'get_position':					CANCommand('GetPosition', RX_Options.GET_ACTUAL_POSITION, (), '<ii'),\
+					'get_pos_hall':					CANCommand('GetHallPosition', RX_Options.GET_MOTOR_HALL_POS, (), '<ii'),\
+					'start_motor_calibration':		CANCommand('StartMotorCalibration', RX_Options.START_MOTOR_CALIBRATION),\
+					'get_motor_calibration_error':	CANCommand('GetMotorCalibrtionError', RX_Options.GET_MOTOR_CALIBRATION_ERROR, (), '<ii'),\
+					'start_datum_calibration':		CANCommand('StartDatumCalibration', RX_Options.START_DATUM_CALIBRATION),\
+					'start_cogging_calibration':	CANCommand('StartCoggingCalibration', RX_Options.START_COGGING_CALIBRATION),\
+					'get_offset':					CANCommand('GetOffset', RX_Options.GET_OFFSET, (), '<ii'),\
+					'set_offset':					CANCommand('SetOffset', RX_Options.SET_OFFSET, ('alpha_offset', 'beta_offset'))}
+	COMMANDS['statusregrequest']		= COMMANDS['statusrequest']
+	COMMANDS['set_actual_position']		= COMMANDS['set_position']
+	COMMANDS['get_actual_position']		= COMMANDS['get_position']
+
+	#Broadcast command answered by all the positioners
+	ASK_ID		= CANCommand('AskID', RX_Options.GET_ID, (), '<I')
 
 	def __init__(self):
 		self._OPT	= COM_Options()
 		self.serHandle	= None
 		self.serialNo	= []
+		self.frames		= deque(maxlen = DEFINES.CANCOM_RX_QUEUE_SIZE) #(arbitrationID, positionerID, command, responseCode, payload) of the received frames
+		self.framesCondition	= threading.Condition()
+		self.readerThread	= None
+		self.readerRunning	= False
 
 	def get_all_serial_no(self):
 		"""Returns all the available connected CAN-USB transievers serial numbers"""
@@ -229,23 +311,41 @@ class COM_handle:
 			if self.serHandle is None:
 				raise errors.CANError("CAN initialization could not connect to the requested device") from None
 
-			#Initialize the serial port parameters
-			try:
-				self.serHandle.baudrate	= self._OPT.COM.CAN_BAUDRATE
-				self.serHandle.bytesize	= serial.EIGHTBITS
-				self.serHandle.timeout	= self._OPT.COM.CAN_TIMEOUT
+			self._init_bus()
+
+	#Uses an already opened handle instead of searching the COM ports, e.g. a canSimulator.SimulatedSerial
+	def init_handle(self, serialHandle):
+		if self.serHandle is not None:
+			self.close()
+
+		self.serHandle	= serialHandle
+		try:
+			self.serialNo	= self.CAN_write(0,'getserialnumber',[])[0]
+		except errors.CANError as e:
+			self.close()
+			raise e from None
+
+		self._init_bus()
 
-				#flush all the buffers
-				self.CAN_write(0,'clearbuffer',[])
+	def _init_bus(self):
+		#Initialize the serial port parameters
+		try:
+			self.serHandle.baudrate	= self._OPT.COM.CAN_BAUDRATE
+			self.serHandle.bytesize	= serial.EIGHTBITS
+			self.serHandle.timeout	= self._OPT.COM.CAN_TIMEOUT
+
+			#flush all the buffers
+			self.CAN_write(0,'clearbuffer',[])
 
-				#Initialize the CAN bus
-				self.CAN_write(0,'init',[])
-			except errors.CANError as e:
-				self.close()
-				raise e from None
+			#Initialize the CAN bus
+			self.CAN_write(0,'init',[])
+		except errors.CANError as e:
+			self.close()
+			raise e from None
 
 	#Closes the CAN communication
 	def close(self):
+		self._stop_reader()
 		if self.serHandle is not None:
 			try:
 				self.serHandle.close()
@@ -256,6 +356,7 @@ class COM_handle:
 
 	#Sends a command via the CAN bus
 	#Returns the received data
+	@tracing.traced(category = 'can')
 	def CAN_write(self, ID, command, data):
 		Output	= []
 
@@ -263,11 +364,14 @@ class COM_handle:
 			if self.serHandle is not None:		
 				#command is not case sensitive
 				command	= command.lower()
-				#Convert ID to usable adress
 				positionerID	= ID
-				ID	= ID<<self._OPT.COM.CAN_ID_BIT_SHIFT
 
-				if command	== 'init':#-------------------------------------------------------
+				if command in self.COMMANDS:#-------------------------------------------------
+					Output	= self.CAN_write_many([positionerID], command, [data])[0]
+
+				elif command	== 'init':#-------------------------------------------------------
+					#The adapter configuration answers are not CAN frames, they are read without the reader thread
+					self._stop_reader()
 					self.serHandle.reset_input_buffer()
 
 					#Close the CAN channel
@@ -291,488 +395,51 @@ class COM_handle:
 						input_buffer	= self.serHandle.readline(self.serHandle.inWaiting())
 						if input_buffer.decode() != '\r':
 							raise errors.CANError('CAN channel could not be reopened') from None
+
+					self._start_reader()
 				
 				elif command	== 'getserialnumber':#----------------------------------------
-					self.serHandle.reset_input_buffer()
-					#Retrieve the serial number
-					self.serHandle.write('N\r'.encode())#C\r
-					time.sleep(0.5)
-					input_buffer	= self.serHandle.readline(self.serHandle.inWaiting())
-					if not len(input_buffer.decode())	== 6:
-						raise errors.CANError("CAN could not retrieve the transceiver's serial number") from None
-					else:
-						Output.append(str(input_buffer[1:5].decode()))
+					readerRunning	= self._stop_reader()
+					try:
+						self.serHandle.reset_input_buffer()
+						#Retrieve the serial number
+						self.serHandle.write('N\r'.encode())#C\r
+						time.sleep(0.5)
+						input_buffer	= self.serHandle.readline(self.serHandle.inWaiting())
+						if not len(input_buffer.decode())	== 6:
+							raise errors.CANError("CAN could not retrieve the transceiver's serial number") from None
+						else:
+							Output.append(str(input_buffer[1:5].decode()))
+					finally:
+						if readerRunning:
+							self._start_reader()
 
 				elif command	== 'askid':#---------------------------------------------------
-					self.serHandle.reset_input_buffer()
-					#Ask for ID
-					#t(ID)l(OPT)\r
+					#All the positioners answer the broadcast, their replies are collected during CANCOM_ASK_ID_TIME
+					replies	= self._collect_frames(self.ASK_ID.encode(positionerID, data), self.ASK_ID.commandID, DEFINES.CANCOM_ASK_ID_TIME)
 
-					txCmd	= (self._OPT.RX.GET_ID<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#T(ID<<18+OPT<<8)\r
-					#self.serHandle.write(('7400010F0D').encode())#t(ID)1(OPT)\r
-					
-					time.sleep(0.5)			
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())#get whole input buffer
-
-					if not ((len(input_buffer.decode())-2)%19	== 0):
+					if len(replies) < 1 or any([not len(reply[4])	== self.ASK_ID.replyStruct.size for reply in replies]):
 						raise errors.CANError('CAN AskID received a wrong response')
-					# elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-					# 	raise errors.CANError('CAN AskID command was not accepted by the positioner')
 					else:
-						#treat the CAN frame to extract the IDs
-						start	= 12 #response is in the form b'T(ID)4(data). We extract the data.
-						for i in range(0,int((len(input_buffer)-2)/19)):
-							current_Byte	= start + i*19
-							if not int(input_buffer[current_Byte-2:current_Byte-1],16)	== self._OPT.RX.COMMAND_ACCEPTED:
+						#treat the CAN frames to extract the IDs
+						for reply in replies:
+							if not reply[3]	== self._OPT.RX.COMMAND_ACCEPTED:
 								raise errors.CANError('CAN AskID command was not accepted') from None
 							else:
-								Output.append(swapInt32(int(input_buffer[current_Byte:(current_Byte+8)],16)))
-
-				elif command == 'initdatum':
-					self.serHandle.reset_input_buffer()
-
-					txCmd	= (self._OPT.RX.INIT_DATUM<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#T(txCmd)\r
-
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())#get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN InitDatum received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN InitDatum command was not accepted by the positioner with ID {positionerID:04d}') from None
-
-				elif command	== 'starttrajectory':#-----------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					txCmd	= (self._OPT.RX.START_TRAJECTORY<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#T(txCmd)\r
-
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())#get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN StartTrajectory received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError('CAN StartTrajectory command was not accepted by the positioner with ID {positionerID:04d}') from None
-
-				elif command	== 'stoptrajectory':#------------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					txCmd	= (self._OPT.RX.STOP_TRAJECTORY<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#T(txCmd)\r
-
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())#get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN StopTrajectory received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN StopTrajectory command was not accepted by the positioner with ID {positionerID:04d}') from None
-						
-				
-				elif command	== 'statusregrequest' or command	== 'statusrequest':#----------
-					self.serHandle.reset_input_buffer()
-
-					txCmd	= (self._OPT.RX.GET_STATUS<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#T(txCmd)\r
-
-					#FOR 64b REGISTER OF v4
-					# #time.sleep(0.025)
-					# watchdog	= time.perf_counter()
-					# while self.serHandle.inWaiting()<29 and time.perf_counter()-0.1 < watchdog:
-					# 	_=1
-
-					# input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					# if not len(input_buffer.decode())	== 29:
-					# 	raise errors.CANError(f'CAN StatutRequest received a wrong response from positioner {positionerID:04d}') from None
-					# elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-					# 	raise errors.CANError(f'CAN StatutRequest command was not accepted by the positioner with ID {positionerID:04d}') from None
-					# else:
-					# 	Output.append(swapInt64(int(input_buffer[12:28],16)))
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<21 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())#get whole input buffer
-					if not len(input_buffer.decode())	== 21:
-						raise errors.CANError(f'CAN StatutRequest received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN StatutRequest command was not accepted by the positioner with ID {positionerID:04d}') from None
-					else:
-						Output.append(swapInt32(int(input_buffer[12:20],16)))
+								Output.extend(self.ASK_ID.decode(reply, positionerID))
 
 				elif command	== 'clearbuffer':#---------------------------------------------
 					self.serHandle.reset_input_buffer()
 					self.serHandle.reset_output_buffer()
+					with self.framesCondition:
+						self.frames.clear()
 				
 				elif command	== 'readbuffer' or command	== 'readdata':#---------------------
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())
-					Output.append(input_buffer)
-				
-				elif command	== 'set_speed':#--------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					#unsign the command
-					data['SpeedAlpha'] 	= data['SpeedAlpha']%(2**32)
-					data['SpeedBeta'] 	= data['SpeedBeta']%(2**32)
-
-					#cast to hex
-					alphaSpeedCommand 	= '%0.8X' % swapInt32((data['SpeedAlpha']))
-					betaSpeedCommand 	= '%0.8X' % swapInt32((data['SpeedBeta']))
-					#Create command
-					txCmd	= (self._OPT.RX.SET_SPEED<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'8'+alphaSpeedCommand+betaSpeedCommand+'\r').encode())#t(ID)4(data)\r
-					
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN SetSpeed received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN SetSpeed command was not accepted by the positioner with ID {positionerID:04d}') from None
-											
-				elif command	== 'set_position' or command	== 'set_actual_position':#--------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					#unsign the command
-					data['Actual_alpha_pos']	= data['Actual_alpha_pos']%(2**32)
-					data['Actual_beta_pos']	= data['Actual_beta_pos']%(2**32)
-
-					#cast to hex
-					alphaRefCommand	= '%0.8X' % (swapInt32(data['Actual_alpha_pos']))
-					betaRefCommand	= '%0.8X' % (swapInt32(data['Actual_beta_pos']))
-
-					#Create command
-					txCmd	= (self._OPT.RX.SET_ACTUAL_POSITION<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'8'+alphaRefCommand+betaRefCommand+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN SetPosition received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						print(int(input_buffer[10:11],16))
-						raise errors.CANError(f'CAN SetPosition command was not accepted by the positioner with ID {positionerID:04d}') from None
-					
-				elif command	== 'gotoposition_speed':#--------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					#unsign the command
-					data['R1Steps']	= data['R1Steps']%(2**32)
-					data['R2Steps']	= data['R2Steps']%(2**32)
-
-					#cast to hex
-					R1StepsCommand	= '%0.8X' % (swapInt32(data['R1Steps']))
-					R2StepsCommand	= '%0.8X' % (swapInt32(data['R2Steps']))
-
-					#Create command
-					txCmd	= (self._OPT.RX.GOTO_POSITION_ABSOLUTE<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'8'+R1StepsCommand+R2StepsCommand+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<29 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 29:
-						raise errors.CANError(f'CAN GoToPosition received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN GoToPosition command was not accepted by the positioner with ID {positionerID:04d}') from None
-					else:
-						Output.append(swapInt32(int(input_buffer[12:20],16))/DEFINES.CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY) #Time needed for movement of axis alpha. 2000[Hz] is the frequency of the control loop.
-						Output.append(swapInt32(int(input_buffer[20:28],16))/DEFINES.CANCOM_FIRMWARE_CONTROL_LOOP_FREQUENCY) #Time needed for movement of axis beta. 2000[Hz] is the frequency of the control loop.
+					#Returns the received frames no request was waiting for
+					with self.framesCondition:
+						Output.extend(self.frames)
+						self.frames.clear()
 				
-				elif command	== 'get_position' or command	== 'get_actual_position':#--------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.GET_ACTUAL_POSITION<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<29 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 29:
-						raise errors.CANError(f'CAN GetPosition received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN GetPosition command was not accepted by the positioner with ID {positionerID:04d}') from None
-					else:
-						R1_steps	= swapInt32(int(input_buffer[12:20],16))
-						R2_steps	= swapInt32(int(input_buffer[20:28],16))
-						if R1_steps > 2**31:
-							R1_steps -= 2**32
-						if R2_steps > 2**31:
-							R2_steps -= 2**32
-						Output.append(R1_steps) #R1 steps
-						Output.append(R2_steps) #R2 steps
-
-				elif command	== 'get_pos_hall':#--------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.GET_MOTOR_HALL_POS<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<29 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 29:
-						raise errors.CANError(f'CAN GetHallPosition received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN GetHallPosition command was not accepted by the positioner with ID {positionerID:04d}') from None
-					else:
-						R1_steps	= swapInt32(int(input_buffer[12:20],16))
-						R2_steps	= swapInt32(int(input_buffer[20:28],16))
-						if R1_steps > 2**31:
-							R1_steps -= 2**32
-						if R2_steps > 2**31:
-							R2_steps -= 2**32
-						Output.append(R1_steps) #R1 steps
-						Output.append(R2_steps) #R2 steps
-
-				elif command	== 'setopenloopcurrent':#--------------------------------------
-					self.serHandle.reset_input_buffer()
-
-					if data['currentAlpha'] < 0:
-						data['currentAlpha']	= 0
-					elif data['currentAlpha'] > 1024:
-						data['currentAlpha']	= 1024
-					if data['currentBeta'] < 0:
-						data['currentBeta']	= 0
-					elif data['currentBeta'] > 1024:
-						data['currentBeta']	= 1024
-
-					txCmd	= (self._OPT.RX.SET_CURRENT<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					alphaCurrentCommand	= '%0.8X' % (swapInt32(data['currentAlpha'])) #convert to hex
-					betaCurrentCommand	= '%0.8X' % (swapInt32(data['currentBeta']))
-
-					self.serHandle.write(('T'+txCmd+'8'+alphaCurrentCommand+betaCurrentCommand+'\r').encode())#t(ID)1(OPT)\r
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting())#get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN SetCurrent received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN SetCurrent command was not accepted by the positioner with ID {positionerID:04d}') from None
-					
-				elif command	== 'start_motor_calibration':
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.START_MOTOR_CALIBRATION<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-					
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN StartMotorCalibration received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN StartMotorCalibration command was not accepted by the positioner with ID {positionerID:04d}') from None
-
-				elif command	== 'get_motor_calibration_error':
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.GET_MOTOR_CALIBRATION_ERROR<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<29 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 29:
-						raise errors.CANError(f'CAN GetMotorCalibrtionError received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN GetMotorCalibrtionError command was not accepted by the positioner with ID {positionerID:04d}') from None
-					else:
-						R1_steps	= swapInt32(int(input_buffer[12:20],16))
-						R2_steps	= swapInt32(int(input_buffer[20:28],16))
-						if R1_steps > 2**31:
-							R1_steps -= 2**32
-						if R2_steps > 2**31:
-							R2_steps -= 2**32
-						Output.append(R1_steps) #R1 steps
-						Output.append(R2_steps) #R2 steps
-
-				elif command	== 'start_datum_calibration':
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.START_DATUM_CALIBRATION<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-					
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN StartDatumCalibration received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN StartDatumCalibration command was not accepted by the positioner with ID {positionerID:04d}') from None
-					
-				elif command	== 'start_cogging_calibration':
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.START_COGGING_CALIBRATION<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-					
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN StartCoggingCalibration received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN StartCoggingCalibration command was not accepted by the positioner with ID {positionerID:04d}') from None
-										
-				elif command	== 'get_offset':
-					self.serHandle.reset_input_buffer()
-
-					#Create command
-					txCmd	= (self._OPT.RX.GET_OFFSET<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'0'+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<29 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 29:
-						raise errors.CANError(f'CAN GetOffset received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN GetOffset command was not accepted by the positioner with ID {positionerID:04d}') from None
-					
-					else:
-						R1_steps	= swapInt32(int(input_buffer[12:20],16))
-						R2_steps	= swapInt32(int(input_buffer[20:28],16))
-						if R1_steps > 2**31:
-							R1_steps -= 2**32
-						if R2_steps > 2**31:
-							R2_steps -= 2**32
-						Output.append(R1_steps) #R1 steps
-						Output.append(R2_steps) #R2 steps
-
-				elif command	== 'set_offset':
-					self.serHandle.reset_input_buffer()
-
-					#unsign the command
-					data['alpha_offset']	= data['alpha_offset']%(2**32)
-					data['beta_offset']	= data['beta_offset']%(2**32)
-
-					#cast to hex
-					alphaRefCommand	= '%0.8X' % (swapInt32(data['alpha_offset']))
-					betaRefCommand	= '%0.8X' % (swapInt32(data['beta_offset']))
-
-					#Create command
-					txCmd	= (self._OPT.RX.SET_OFFSET<<self._OPT.COM.CAN_CMD_BIT_SHIFT) + ID
-					txCmd	= '%0.8X' % txCmd
-
-					#send command
-					self.serHandle.write(('T'+txCmd+'8'+alphaRefCommand+betaRefCommand+'\r').encode())#t(ID)4(data)\r
-
-					#time.sleep(0.025)
-					watchdog	= time.perf_counter()
-					while self.serHandle.inWaiting()<13 and time.perf_counter()-0.1 < watchdog:
-						_=1
-
-					input_buffer=self.serHandle.read(self.serHandle.inWaiting()) #get whole input buffer
-
-					if not len(input_buffer.decode())	== 13:
-						raise errors.CANError(f'CAN SetOffset received a wrong response from positioner {positionerID:04d}') from None
-					elif not int(input_buffer[10:11],16)	== self._OPT.RX.COMMAND_ACCEPTED:
-						raise errors.CANError(f'CAN SetOffset command was not accepted by the positioner with ID {positionerID:04d}') from None
-
 				elif command	== 'enable_closed_loop':
 					# self.serHandle.reset_input_buffer()
 
@@ -835,7 +502,6 @@ class COM_handle:
 
 				else:
 					raise errors.CANError('CAN unknown command') from None
-					Output	= []
 			else:
 				raise errors.CANError('CAN transceiver is disconnected') from None
 
@@ -847,21 +513,137 @@ class COM_handle:
 
 		return Output
 
-def swapInt32(number):
-	return (((number << 24) & 0xFF000000) | \
-			((number << 8) 	& 0x00FF0000) | \
-			((number >> 8) 	& 0x0000FF00) | \
-			((number >> 24) & 0x000000FF))
-
-def swapInt64(number):
-	return (((number << 56) & 0xFF00000000000000) | \
-			((number << 40) & 0x00FF000000000000) | \
-			((number << 24) & 0x0000FF0000000000) | \
-			((number << 8) 	& 0x000000FF00000000) | \
-			((number >> 8) 	& 0x00000000FF000000) | \
-			((number >> 24) & 0x0000000000FF0000) | \
-			((number >> 40) & 0x000000000000FF00) | \
-			((number >> 56) & 0x00000000000000FF))
+	#Sends the same command to all the positioners of IDs back-to-back, then matches the replies to the requests by
+	#positioner and command ID as they arrive. data is a list with the data of each positioner, or the data shared by all.
+	#Returns the output CAN_write would give for each positioner, in the order of IDs
+	@tracing.traced(category = 'can')
+	def CAN_write_many(self, IDs, command, data):
+		commandFormat	= self.COMMANDS.get(command.lower())
+		if commandFormat is None:
+			raise errors.CANError(f'CAN {command} can not be sent to several positioners at once') from None
+		if self.serHandle is None:
+			raise errors.CANError('CAN transceiver is disconnected') from None
+		if not isinstance(data, list) or not len(data)	== len(IDs):
+			data	= [data]*len(IDs)
+		if len(IDs) < 1:
+			return []
+
+		try:
+			txFrames	= [commandFormat.encode(positionerID, positionerData) for positionerID, positionerData in zip(IDs, data)]
+		except (KeyError, TypeError):
+			raise errors.CANError(f'CAN {commandFormat.name} received invalid data') from None
+
+		try:
+			replies	= self._transfer(IDs, commandFormat.commandID, txFrames)
+		except serial.SerialException:
+			self.close()
+			raise errors.CANError('CAN transceiver is disconnected') from None
+
+		return [commandFormat.decode(replies.get((positionerID, commandFormat.commandID)), positionerID) for positionerID in IDs]
+
+	def _transfer(self, IDs, commandID, txFrames):
+		#Writes the frames of the positioners back-to-back and waits for their replies. Returns the replies by (positionerID, commandID)
+		self._start_reader()
+		expectedKeys	= set([(positionerID, commandID) for positionerID in IDs])
+
+		#Late replies to previous requests must not be taken for the new ones
+		self._pop_frames(lambda frame: (frame[1], frame[2]) in expectedKeys)
+		self.serHandle.write(b''.join(txFrames))
+
+		replies		= {}
+		watchdog	= time.perf_counter()
+		with self.framesCondition:
+			while True:
+				for frame in self._pop_frames(lambda frame: (frame[1], frame[2]) in expectedKeys):
+					replies[(frame[1], frame[2])]	= frame
+					watchdog	= time.perf_counter()
+
+				tRemaining	= watchdog+DEFINES.CANCOM_REPLY_TIMEOUT-time.perf_counter()
+				if len(replies) >= len(expectedKeys) or tRemaining <= 0 or not self.readerRunning:
+					break
+				self.framesCondition.wait(tRemaining)
+
+		if not self.readerRunning:
+			raise serial.SerialException('The CAN reader stopped')
+		return replies
+
+	def _collect_frames(self, txFrame, commandID, duration):
+		#Writes one frame and returns all the frames of the command received during duration [s]
+		self._start_reader()
+		self._pop_frames(lambda frame: frame[2]	== commandID)
+		self.serHandle.write(txFrame)
+		time.sleep(duration)
+
+		if not self.readerRunning:
+			raise serial.SerialException('The CAN reader stopped')
+		return self._pop_frames(lambda frame: frame[2]	== commandID)
+
+	def _pop_frames(self, selected):
+		#Removes the selected frames from the queue and returns them
+		with self.framesCondition:
+			frames	= [frame for frame in self.frames if selected(frame)]
+			if len(frames) > 0:
+				remaining	= [frame for frame in self.frames if not selected(frame)]
+				self.frames.clear()
+				self.frames.extend(remaining)
+		return frames
+
+	def _start_reader(self):
+		#Starts the thread draining the serial link into the frame queue, if it is not running
+		if self.readerRunning:
+			return
+		self.serHandle.timeout	= DEFINES.CANCOM_READER_TIMEOUT
+		self.readerRunning	= True
+		self.readerThread	= threading.Thread(target = self._read_frames, args = (self.serHandle,), daemon = True)
+		self.readerThread.start()
+
+	def _stop_reader(self):
+		#Stops the reader thread. Returns True if it was running
+		wasRunning	= self.readerRunning
+		self.readerRunning	= False
+		if self.readerThread is not None:
+			self.readerThread.join()
+			self.readerThread	= None
+		return wasRunning
+
+	def _read_frames(self, serHandle):
+		#Reader thread. The waiters are woken up each time new frames are queued
+		received	= b''
+		while self.readerRunning:
+			try:
+				received	+= serHandle.read(max(serHandle.inWaiting(), 1))
+			except (serial.SerialException, OSError):
+				break
+
+			lines		= received.split(b'\r')
+			received	= lines.pop()
+			frames		= [frame for frame in map(parse_frame, lines) if frame is not None]
+			if len(frames) > 0:
+				with self.framesCondition:
+					self.frames.extend(frames)
+					self.framesCondition.notify_all()
+
+		with self.framesCondition:
+			self.readerRunning	= False
+			self.framesCondition.notify_all()
+
+def parse_frame(line):
+	#Returns the (arbitrationID, positionerID, command, responseCode, payload) of an extended SLCAN frame, None for any other line
+	line	= line.lstrip(b'\x07')
+	if len(line) < 10 or not line[0:1]	== b'T':
+		return None
+	try:
+		arbitrationID	= int(line[1:9],16)
+		payload			= bytes.fromhex(line[10:].decode())
+	except (ValueError, UnicodeDecodeError):
+		return None
+	if not len(payload)	== int(line[9:10],16):
+		return None
+	return (	arbitrationID,\
+				arbitrationID>>CAN_Options.CAN_ID_BIT_SHIFT,\
+				(arbitrationID>>CAN_Options.CAN_CMD_BIT_SHIFT)&CAN_Options.CAN_CMD_MASK,\
+				arbitrationID&CAN_Options.CAN_RESPONSE_MASK,\
+				payload)
 
 #TESTING SECTION------------------------------------------------------
 def main():
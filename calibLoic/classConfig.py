@@ -77,6 +77,8 @@ class Config:
 					'reloadCalibParEachIter',\
 					'reloadTestParEachIter',\
 					'doLivePlot',\
+					'centroidMode',\
+					'traceRun',\
 					'plotResults',\
 					'saveInQc',\
 					'sendMail',\
@@ -159,6 +161,8 @@ class Config:
 		self.reloadTestParEachIter 				= False
 
 		self.doLivePlot							= False
+		self.centroidMode						= DEFINES.CC_CENTROID_DEFAULT_MODE
+		self.traceRun							= False 	# Record the spans of the hot path and save them as a Chrome trace in the overviews folder
 		self.sendMail 							= True
 		self.plotResults 						= True
 		self.saveInQc 							= True
@@ -212,6 +216,8 @@ class Config:
 		variablesToSave['reloadCalibParEachIter']		= self.reloadCalibParEachIter
 		variablesToSave['reloadTestParEachIter']		= self.reloadTestParEachIter
 		variablesToSave['doLivePlot']					= self.doLivePlot
+		variablesToSave['centroidMode']					= self.centroidMode
+		variablesToSave['traceRun']						= self.traceRun
 		variablesToSave['plotResults'] 					= self.plotResults
 		variablesToSave['saveInQc'] 					= self.saveInQc
 		variablesToSave['sendMail']						= self.sendMail
@@ -421,6 +427,9 @@ class Config:
 									self.overviewsFolder)
 		return filePath
 
+	def get_trace_fileName(self):
+		return os.path.join(self.get_current_overview_folder(), self.currentProjectTime+'_trace.json')
+
 	def get_overwiew_filename(self, positionerID):
 
 		overviewFile = self.currentProjectTime+'_'+self.positionerFolderPrefix+'_'+str(positionerID)
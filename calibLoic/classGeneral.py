@@ -14,6 +14,7 @@ import miscmath as mm
 import mailSender as ms
 import DEFINES
 import errors
+import tracing
 
 class Status():
 	__slots__ = (	'currentState',\
@@ -109,7 +110,9 @@ class General:
 		if self.testBench.cameraTilt is not None:
 			cameraTiltparams = self.testBench.cameraTilt.parameters
 
-		self.processManager.start_centroid_processes(cameraXYparams, cameraTiltparams)
+		if self.config.traceRun:
+			tracing.enable()
+		self.processManager.start_centroid_processes(cameraXYparams, cameraTiltparams, self.config.centroidMode)
 		
 	def stop_all(self):
 		try:
@@ -118,6 +121,8 @@ class General:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR,0,str(e))
 		self.processManager.stop_livePlot_process()
 		self.processManager.stop_centroid_processes()
+		if tracing.is_enabled():
+			self.processManager.export_trace(self.config.get_trace_fileName())
 		self.testBench.close_handles()
 
 	def run_main(self): #TODO: To delete once the new strucutre works correcly
@@ -272,7 +277,7 @@ class General:
 				t10 = time.perf_counter()
 				log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,0,'Launching fast calibration calculation')
 
-				calib.compute_model(fastCalibrationResults)
+				calib.compute_model(fastCalibrationResults, processManager = self.processManager)
 
 				(days, hours, minutes, seconds) = mm.decompose_time(time.perf_counter()-t10)
 				log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO,0,f'Done in {seconds:5.2f}s')
@@ -364,7 +369,7 @@ class General:
 					t10 = time.perf_counter()
 					log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,0,'Launching calibration calculation')
 
-					calib.compute_model(calibrationResults)
+					calib.compute_model(calibrationResults, processManager = self.processManager)
 					# log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR,0,'Calibration calculation could not complete properly. Abort program.')
 						
 					self.config.save_calib_results(calibrationResults)
@@ -434,7 +439,7 @@ class General:
 					t10 = time.perf_counter()
 					log.message(DEFINES.LOG_MESSAGE_PRIORITY_INFO,0,'Launching test calculation')
 					
-					test.calc(testResults)
+					test.calc(testResults, processManager = self.processManager)
 				
 					self.config.save_test_results(testResults)
 
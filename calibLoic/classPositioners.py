@@ -318,46 +318,56 @@ class Positioner:
 		canComHandle.CAN_write(self.ID,'initdatum', [])
 
 	def set_speed(self, canComHandle, speedAlpha, speedBeta, respectPhysics = True):
+		canComHandle.CAN_write(self.ID,'set_speed', self.get_speed_command(speedAlpha, speedBeta, respectPhysics))
+
+	def get_speed_command(self, speedAlpha, speedBeta, respectPhysics = True):
+		#Returns the 'set_speed' data of the positioner, for CAN_write or CAN_write_many
 		if self.ID == None or self.initialized == False:
-			raise error.PositionerError("Trying to set speed on an uninitialized positioner")
+			raise errors.PositionerError("Trying to set speed on an uninitialized positioner")
 
 		#Set the speed
 		if 	respectPhysics and \
 			(speedAlpha < 0 or speedAlpha > self.physics.maxRpmAlpha or\
 			speedBeta < 0 or speedBeta > self.physics.maxRpmBeta):
-			raise error.OutOfRangeError("Trying to set out of range speed on positioner {self.ID:04d}")
+			raise errors.OutOfRangeError(f"Trying to set out of range speed on positioner {self.ID:04d}")
 
-		motor_rpm = {'SpeedAlpha': int(speedAlpha), 'SpeedBeta': int(speedBeta)}
-	
-		canComHandle.CAN_write(self.ID,'set_speed', motor_rpm)
+		return {'SpeedAlpha': int(speedAlpha), 'SpeedBeta': int(speedBeta)}
 
 	def set_current(self, canComHandle, currentAlpha, currentBeta, respectPhysics = True):
+		canComHandle.CAN_write(self.ID,'setopenloopcurrent', self.get_current_command(currentAlpha, currentBeta, respectPhysics))
+
+	def get_current_command(self, currentAlpha, currentBeta, respectPhysics = True):
+		#Returns the 'setopenloopcurrent' data of the positioner, for CAN_write or CAN_write_many
 		if self.ID == None or self.initialized == False:
-			raise error.PositionerError("Trying to set current on an uninitialized positioner")
+			raise errors.PositionerError("Trying to set current on an uninitialized positioner")
 
 		#Set the current
 		if 	respectPhysics and \
 			(currentAlpha < 0 or currentAlpha > self.physics.maxCurrentAlpha or\
 			currentBeta < 0 or currentBeta > self.physics.maxCurrentBeta):
-			raise error.OutOfRangeError("Trying to set out of range current on positioner {self.ID:04d}")
+			raise errors.OutOfRangeError(f"Trying to set out of range current on positioner {self.ID:04d}")
 
-		current = {'currentAlpha': int(currentAlpha), 'currentBeta': int(currentBeta)}
-	
-		canComHandle.CAN_write(self.ID,'setopenloopcurrent', current)
+		return {'currentAlpha': int(currentAlpha), 'currentBeta': int(currentBeta)}
 
 	def goto_position(self, canComHandle, angleAlpha, angleBeta, respectPhysics = True): #Angles in degrees
+		#Go to the specified position. Returns the time taken by the positioner to perform the move.
+		response=canComHandle.CAN_write(self.ID,'gotoposition_speed', self.get_goto_position_command(angleAlpha, angleBeta, respectPhysics))
+		return self.get_movement_time(response)
+
+	def get_goto_position_command(self, angleAlpha, angleBeta, respectPhysics = True): #Angles in degrees
+		#Returns the 'gotoposition_speed' data of the positioner, for CAN_write or CAN_write_many
 		if self.ID == None or self.initialized == False:
-			raise error.PositionerError("Trying to move an uninitialized positioner")
+			raise errors.PositionerError("Trying to move an uninitialized positioner")
 
 		if 	respectPhysics and \
 			(angleAlpha < self.physics.alphaAxisRange[0] or angleAlpha > self.physics.alphaAxisRange[1] or\
 			angleBeta < self.physics.betaAxisRange[0] or angleBeta > self.physics.betaAxisRange[1]):
-			raise error.OutOfRangeError("Trying to go to an out of range position on positioner {self.ID:04d}")
+			raise errors.OutOfRangeError(f"Trying to go to an out of range position on positioner {self.ID:04d}")
 
-		#Go to the specified position. Returns the time taken by the positioner to perform the move.
-		data={'R1Steps': int(round(self.physics.incrementsPerRotation*angleAlpha/(DEFINES.DEGREES_PER_ROTATION),0)), 'R2Steps': int(round(self.physics.incrementsPerRotation*angleBeta/(DEFINES.DEGREES_PER_ROTATION),0))}
-		
-		response=canComHandle.CAN_write(self.ID,'gotoposition_speed', data)
+		return {'R1Steps': int(round(self.physics.incrementsPerRotation*angleAlpha/(DEFINES.DEGREES_PER_ROTATION),0)), 'R2Steps': int(round(self.physics.incrementsPerRotation*angleBeta/(DEFINES.DEGREES_PER_ROTATION),0))}
+
+	def get_movement_time(self, response):
+		#Time to wait for the end of a move from the 'gotoposition_speed' response
 		return max(response)*(1+self.physics.movementSafetyDelay)
 
 	def set_position(self, canComHandle, angleAlpha, angleBeta):
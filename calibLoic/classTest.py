@@ -12,6 +12,7 @@ import testPlot as customPlot
 import classConfig
 import classPositioners
 import errors
+import tracing
 
 class Parameters():
 	__slots__ = (	'approachDistance',\
@@ -214,12 +215,12 @@ class Results():
 			json.dump(variablesToSave, outFile, separators = (',\n',': '))
 
 def run(testBench, testParameters, testResults, config, processManager):
+	grabbedFrame = None #frame grabbed from the camera and not yet handed to the centroid processes
 	try:
 		if len(testResults) is not testBench.nbSlots:
 			raise errors.Error("Test result container has the wrong length")
 
 		rand.seed()
-		processManager.clear_centroids_results()
 
 		nbSlots 			= testBench.nbSlots
 		nbRepetitions 		= testParameters.numberOfRepetitions
@@ -246,6 +247,9 @@ def run(testBench, testParameters, testResults, config, processManager):
 		realAngles			= np.full((testBench.nbSlots, nbRepetitions, nbTargets, maxNbMoves, 2),np.nan)
 		nbCorrections		= np.zeros((testBench.nbSlots, nbRepetitions, nbTargets))
 
+		#clear any remaining result in the centroid results container and size it for this run
+		processManager.clear_centroids_results((testBench.nbSlots, nbRepetitions, maxNbMoves, 1, nbTargets, 1, 1))
+
 		#Generate the targets
 		targets		  		= np.full((testBench.nbSlots, nbRepetitions, nbTargets, maxNbMoves, 2),np.nan)
 		targetsErrors 		= np.full((testBench.nbSlots, nbRepetitions, nbTargets, maxNbMoves, 3),np.nan)
@@ -380,7 +384,6 @@ def run(testBench, testParameters, testResults, config, processManager):
 
 		tStart = time.time()
 		currentPoint = 1
-		firstCentroid = 0
 
 		#start the moves
 		for repetition in range(0,nbRepetitions):
@@ -405,19 +408,11 @@ def run(testBench, testParameters, testResults, config, processManager):
 					# plt.draw()
 					# plt.pause(1e-17)
 
-					# Move to the target
-					testBench.move_all_positioners_different_angles(np.ravel(sortedCommands[:, repetition, target, currentMove, 0]), np.ravel(sortedCommands[:, repetition, target, currentMove, 1]), approachDistance, isInRad = True)
+					# Move to the target. The spots of the move are computed while the positioners reach it
+					testBench.move_all_positioners_different_angles(np.ravel(sortedCommands[:, repetition, target, currentMove, 0]), np.ravel(sortedCommands[:, repetition, target, currentMove, 1]), approachDistance, isInRad = True, wait = False)
 
-					#Adapt the current to wait current
-					if (currentMove == 0 and changeCurrentCruiseToWait) or (currentMove > 0 and changeCurrentCorrectionToWait):
-						testBench.set_current_all_positioners(testParameters.waitCurrentAlpha, testParameters.waitCurrentAlpha)
-					
-					# Take the image
 					ROI = np.zeros((5))
-
-					if testBench.cameraXY.parameters.softROIrequired:
-						completeImage = testBench.cameraXY.getImage()
-
+					frameSpots = []
 					for positioner in testBench.positioners:
 						if not positioner.benchSlot in finishedSlots:
 							imageID = mm.generate_img_ID(positioner.benchSlot, repetition, currentMove, 0, target, 0, DEFINES.MM_IMG_ID_XY_IDENTIFIER)
@@ -432,34 +427,41 @@ def run(testBench, testParameters, testResults, config, processManager):
 							ROI[2] = imageWindowSize
 							ROI[3] = imageWindowSize
 							ROI[4] = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-							
-							if testBench.cameraXY.parameters.softROIrequired:
-								#Do a software crop of the approximated model area
-								# print(f'\tComputing image {i:>2}/{testBench.nbSlots:2}')
 
-								(image, offsetX, offsetY) = mm.cropImage(completeImage,ROI,testBench.cameraXY.parameters.maxX,testBench.cameraXY.parameters.maxY)
-								validityCenter = (positioner.model.centerX/testBench.cameraXY.parameters.scaleFactor,positioner.model.centerY/testBench.cameraXY.parameters.scaleFactor)
-								validityRadius = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
-								
-								processManager.centroidQueuePut((image, offsetX, offsetY, imageID, validityCenter, validityRadius), block = True)
-							else:
-								#Do a hardware crop of the approximated model area and compute the centroid
-								# print(f'\tTaking image {i:>2}/{testBench.nbSlots:2}')
-								testBench.cameraXY.setROI(ROI)
-								testBench.cameraXY.setExposure(testBench.slotsExposures[positioner.benchSlot])
-								testBench.cameraXY.getImage(processManager.centroidQueue,imageID)
+							validityCenter = (positioner.model.centerX/testBench.cameraXY.parameters.scaleFactor,positioner.model.centerY/testBench.cameraXY.parameters.scaleFactor)
+							validityRadius = (positioner.model.lengthAlpha+positioner.model.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)/testBench.cameraXY.parameters.scaleFactor
+							frameSpots.append((imageID, tuple(ROI[0:4]), validityCenter, validityRadius))
+
+					#Adapt the current to wait current
+					if (currentMove == 0 and changeCurrentCruiseToWait) or (currentMove > 0 and changeCurrentCorrectionToWait):
+						testBench.set_current_all_positioners(testParameters.waitCurrentAlpha, testParameters.waitCurrentAlpha)
+					
+					# Take the image once the positioners are at the target
+					testBench.wait_all_positioners()
+					if testBench.cameraXY.parameters.softROIrequired:
+						#Do a software crop of the approximated model areas
+						(frameIndex, completeImage) = testBench.cameraXY.grabFrame(processManager)
+						grabbedFrame = frameIndex
+						processManager.centroidQueuePutFrame(frameIndex, completeImage, testBench.cameraXY.parameters.ROIoffsetX, testBench.cameraXY.parameters.ROIoffsetY, frameSpots, block = True)
+						grabbedFrame = None
+					else:
+						#Do a hardware crop of the approximated model area and compute the centroid
+						for (imageID, ROIwindow, validityCenter, validityRadius) in frameSpots:
+							slot = mm.get_img_ID(np.int64(imageID))[0]
+							ROI[0:4] = ROIwindow
+							ROI[4] = validityRadius
+							testBench.cameraXY.setROI(ROI)
+							testBench.cameraXY.setExposure(testBench.slotsExposures[slot])
+							testBench.cameraXY.getImage(processManager,imageID)
 
 					#wait for the centroid computations to finish
 					processManager.centroidQueueJoin()
 
-					#retrieve all the centroids and clear the results 
-					lastCentroid = processManager.get_centroid_results_length()
-					newCentroids = processManager.get_centroids_result(start = firstCentroid, end = lastCentroid)
-					firstCentroid = lastCentroid
-
-					for centroid in newCentroids:
-						(slotID, repetitionID, currentMoveID, _, targetID, _, cameraTypeID) = mm.get_img_ID(np.int64(centroid[7]))
-						sortedCentroidsXY[slotID, repetitionID, targetID, currentMoveID] = centroid
+					#retrieve the centroids of this move, in place from the result table
+					(tableCentroids, tableCompleted) = processManager.get_centroids_table()
+					completed = tableCompleted[:, repetition, currentMove, 0, target, 0, DEFINES.MM_IMG_ID_XY_IDENTIFIER]
+					sortedCentroidsXY[completed, repetition, target, currentMove] = tableCentroids[:, repetition, currentMove, 0, target, 0, DEFINES.MM_IMG_ID_XY_IDENTIFIER][completed]
+					del tableCentroids, tableCompleted
 
 					#compute error
 					for slot in range(0, nbSlots):
@@ -555,7 +557,8 @@ def run(testBench, testParameters, testResults, config, processManager):
 					if (currentMove > 0 and changeRPMCruiseToCorrection):
 						testBench.set_speed_all_positioners(testParameters.motorRpmAlpha, testParameters.motorRpmBeta)
 
-					testBench.move_all_positioners_to_origin()
+					#The next bench command waits for the end of the refold
+					testBench.move_all_positioners_to_origin(wait = False)
 
 				completion = currentPoint/totalNbPoints
 				(tRemaining, days, hours, minutes, seconds) = mm.get_ETA(tStart,completion)
@@ -578,6 +581,7 @@ def run(testBench, testParameters, testResults, config, processManager):
 				testBench.set_speed_all_positioners(testParameters.motorRpmAlpha, testParameters.motorRpmBeta)
 			testBench.move_all_positioners_to_origin()
 
+		testBench.wait_all_positioners()
 		testBench.stop_all_positioners()
 
 		positionersArmLengths = np.zeros((testBench.nbSlots, 2))
@@ -606,109 +610,105 @@ def run(testBench, testParameters, testResults, config, processManager):
 	except errors.Error as e:
 		log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 		raise errors.CalibrationError("Test run failed")
-
-def calc(testResults):
+	finally:
+		#a frame which never reached the centroid processes would leak its buffer slot
+		if grabbedFrame is not None:
+			processManager.release_frame(grabbedFrame)
+
+@tracing.traced(category = 'model')
+def calc(testResults, processManager = None):
+	#The slots are independent. If processManager is given, they are computed by its centroid processes
 	nbSlots = len(testResults)
-
-	for slot in range(0,nbSlots):
-		if (not testResults[slot].runDone) or testResults[slot].calcDone:
-			continue
-
-		nbRepetitions, nbTargets, maxNbMoves, nbDims = testResults[slot].targets.shape
-		modelError 		= np.full((nbRepetitions, nbTargets, maxNbMoves, 7), np.nan) #Total, X, Y, AcrossAlpha, AlongAlpha, Acrossbeta, AlongBeta
-		repeatability 	= np.full((nbTargets, 7), np.nan) #Total, X, Y, AcrossAlpha, AlongAlpha, Acrossbeta, AlongBeta
-		totalNbPoints  	= nbTargets*nbRepetitions
-
-		#Compute model error
-		#AcrossErr, AlongErr
-		centerX 	= testResults[slot].slotsCenters[0]
-		centerY 	= testResults[slot].slotsCenters[1]	
-		for target in range(0,nbTargets):
-			for repetition in range(0,nbRepetitions):
-				for move in range(0, maxNbMoves):
-					modelError[repetition,target,move,0] = testResults[slot].targetsErrors[repetition,target,move,2]
-					modelError[repetition,target,move,1] = testResults[slot].targetsErrors[repetition,target,move,0]
-					modelError[repetition,target,move,2] = testResults[slot].targetsErrors[repetition,target,move,1]
-					mesX 		= testResults[slot].sortedCentroidsXY[repetition, target, move, 0]
-					mesY 		= testResults[slot].sortedCentroidsXY[repetition, target, move, 1]
-					errX 		= modelError[repetition, target, move, 1]
-					errY 		= modelError[repetition, target, move, 2]
-
-					angleCenterToMes 	= np.arctan2(mesX-centerX, mesY-centerY)
-					angleBetaEnd 		= np.mod((testResults[slot].realAngles[repetition, target, move, 0]+testResults[slot].realAngles[repetition, target, move, 1]), 2*np.pi)
-					angleMesToErr 		= np.arctan2(errX, errY)
-
-					projectionAngleAlpha = np.mod(angleMesToErr-angleCenterToMes, 2*np.pi)
-					projectionAngleBeta = np.mod(angleMesToErr-angleBetaEnd, 2*np.pi)
-
-					#error across and along alpha
-					modelError[repetition, target, move, 3] = -modelError[repetition, target, move, 0]*np.cos(projectionAngleAlpha)
-					modelError[repetition, target, move, 4] = -modelError[repetition, target, move, 0]*np.sin(projectionAngleAlpha)
-					if (angleMesToErr-testResults[slot].realAngles[repetition, target, move, 0]) < 0 and (angleMesToErr-testResults[slot].realAngles[repetition, target, move, 0]) > -np.pi:
-						modelError[repetition, target, move, 3] = -modelError[repetition, target, move, 3]
-					
-					#error across and along beta
-					modelError[repetition, target, move, 5] = -modelError[repetition, target, move, 0]*np.cos(projectionAngleBeta)
-					modelError[repetition, target, move, 6] = -modelError[repetition, target, move, 0]*np.sin(projectionAngleBeta)
-
-		#Compute repeatability
-		#repeatability #Total, X, Y, Across, Along
-			if nbRepetitions > 1:
-				move = 0
-				meanPointX = np.nanmean(testResults[slot].sortedCentroidsXY[:, target, move, 0])
-				meanPointY = np.nanmean(testResults[slot].sortedCentroidsXY[:, target, move, 1])
-
-				for repetition in range(0,nbRepetitions):
-					mesX 		= testResults[slot].sortedCentroidsXY[repetition, target, move, 0]
-					mesY 		= testResults[slot].sortedCentroidsXY[repetition, target, move, 1]
-
-					repeatabilityX = meanPointX-mesX
-					repeatabilityY = meanPointY-mesY
-					repeatabilityTotal = np.sqrt(repeatabilityX**2+repeatabilityY**2)
-
-					repeatability[target, 0] = repeatabilityTotal
-					repeatability[target, 1] = repeatabilityX
-					repeatability[target, 2] = repeatabilityY
-
-					angleCenterToMes 	= np.arctan2(mesX-centerX, mesY-centerY)
-					angleBetaEnd 		= np.mod((testResults[slot].realAngles[repetition, target, move, 0]+testResults[slot].realAngles[repetition, target, move, 1]), 2*np.pi)
-					angleMesToErr 		= np.arctan2(repeatabilityX, repeatabilityY)
-
-					projectionAngleAlpha = np.mod(angleMesToErr-angleCenterToMes, 2*np.pi)
-					projectionAngleBeta = np.mod(angleMesToErr-angleBetaEnd, 2*np.pi)
-
-					#error across and along alpha
-					repeatability[target, 3] = -repeatability[target, 0]*np.cos(projectionAngleAlpha)
-					repeatability[target, 4] = -repeatability[target, 0]*np.sin(projectionAngleAlpha)
-					if (angleMesToErr-testResults[slot].realAngles[repetition, target, move, 0]) < 0 and (angleMesToErr-testResults[slot].realAngles[repetition, target, move, 0]) > -np.pi: #check if the solution to take is right-handed or left-handed
-						repeatability[target, 3] = -repeatability[target, 3]
-					
-					#error across and along beta
-					repeatability[target, 5] = -repeatability[target, 0]*np.cos(projectionAngleBeta)
-					repeatability[target, 6] = -repeatability[target, 0]*np.sin(projectionAngleBeta)
-		
-		completedTargets = 0
-		targetConvergeance = []
-		for move in range(0, maxNbMoves):
-			for repetition in range(0, nbRepetitions):
-				for target in range(0, nbTargets):
-					if 1000*modelError[repetition,target,move,0] <= testResults[slot].testParameters.desiredTargetError:
-						completedTargets += 1
-			targetConvergeance.append(completedTargets/totalNbPoints*100)
-
-		mesRMSError1stMove			= 1000*mm.nanrms(np.ravel(modelError[:,:,0,0]))
-		mesRMSRepeatability1stMove 	= 1000*mm.nanrms(np.ravel(repeatability[:,0]))
-		mesTargetConvergeance 		= targetConvergeance
-		mesMaxNbMoves				= np.max(np.ravel(testResults[slot].nbCorrections[:,:]))+1
-
-		#store the results
-		testResults[slot].mesRMSError1stMove.append(		mesRMSError1stMove)
-		testResults[slot].mesRMSRepeatability1stMove.append(mesRMSRepeatability1stMove)
-		testResults[slot].mesTargetConvergeance.append(		mesTargetConvergeance)
-		testResults[slot].mesMaxNbMoves.append(				mesMaxNbMoves)
-		testResults[slot].modelError 						= modelError
-		testResults[slot].repeatability 					= repeatability
-		testResults[slot].calcDone 							= True
+	slotsToCompute = [slot for slot in range(0,nbSlots) if testResults[slot].runDone and not testResults[slot].calcDone]
+	tasksArgs = [(testResults[slot],) for slot in slotsToCompute]
+
+	if processManager is None:
+		slotsResults = [calc_slot(*args) for args in tasksArgs]
+	else:
+		slotsResults = processManager.run_tasks(calc_slot, tasksArgs)
+
+	#merge the results computed by the other processes
+	for (slot, slotResults) in zip(slotsToCompute, slotsResults):
+		if slotResults is not testResults[slot]:
+			for name in Results.__slots__:
+				setattr(testResults[slot], name, getattr(slotResults, name))
+
+def project_errors(error, errorX, errorY, mesX, mesY, centerX, centerY, alphaAngle, betaAngle):
+	#Projects the errors at the measured points across and along the alpha arm and across and along the beta arm
+	angleCenterToMes 	= np.arctan2(mesX-centerX, mesY-centerY)
+	angleBetaEnd 		= np.mod(alphaAngle+betaAngle, 2*np.pi)
+	angleMesToErr 		= np.arctan2(errorX, errorY)
+
+	projectionAngleAlpha = np.mod(angleMesToErr-angleCenterToMes, 2*np.pi)
+	projectionAngleBeta = np.mod(angleMesToErr-angleBetaEnd, 2*np.pi)
+
+	#error across and along alpha. The sign across depends on whether the solution is right-handed or left-handed
+	acrossAlpha = -error*np.cos(projectionAngleAlpha)
+	alongAlpha = -error*np.sin(projectionAngleAlpha)
+	leftHanded = ((angleMesToErr-alphaAngle) < 0) & ((angleMesToErr-alphaAngle) > -np.pi)
+	acrossAlpha = np.where(leftHanded, -acrossAlpha, acrossAlpha)
+
+	#error across and along beta
+	acrossBeta = -error*np.cos(projectionAngleBeta)
+	alongBeta = -error*np.sin(projectionAngleBeta)
+
+	return np.stack((acrossAlpha, alongAlpha, acrossBeta, alongBeta), axis = -1)
+
+@tracing.traced(category = 'model')
+def calc_slot(slotResults):
+	nbRepetitions, nbTargets, maxNbMoves, nbDims = slotResults.targets.shape
+	modelError 		= np.full((nbRepetitions, nbTargets, maxNbMoves, 7), np.nan) #Total, X, Y, AcrossAlpha, AlongAlpha, Acrossbeta, AlongBeta
+	repeatability 	= np.full((nbTargets, 7), np.nan) #Total, X, Y, AcrossAlpha, AlongAlpha, Acrossbeta, AlongBeta
+	totalNbPoints  	= nbTargets*nbRepetitions
+
+	#Compute model error
+	#AcrossErr, AlongErr
+	centerX 	= slotResults.slotsCenters[0]
+	centerY 	= slotResults.slotsCenters[1]
+	modelError[:,:,:,0] = slotResults.targetsErrors[:,:,:,2]
+	modelError[:,:,:,1] = slotResults.targetsErrors[:,:,:,0]
+	modelError[:,:,:,2] = slotResults.targetsErrors[:,:,:,1]
+	modelError[:,:,:,3:7] = project_errors(	modelError[:,:,:,0], modelError[:,:,:,1], modelError[:,:,:,2],\
+											slotResults.sortedCentroidsXY[:,:,:,0], slotResults.sortedCentroidsXY[:,:,:,1],\
+											centerX, centerY, slotResults.realAngles[:,:,:,0], slotResults.realAngles[:,:,:,1])
+
+	#Compute repeatability
+	#repeatability #Total, X, Y, Across, Along
+	#Each target keeps the deviation of its last repetition to the mean of its first moves
+	if nbRepetitions > 1:
+		move = 0
+		repetition = nbRepetitions-1
+		meanPointX = np.nanmean(slotResults.sortedCentroidsXY[:, :, move, 0], axis = 0)
+		meanPointY = np.nanmean(slotResults.sortedCentroidsXY[:, :, move, 1], axis = 0)
+		mesX 		= slotResults.sortedCentroidsXY[repetition, :, move, 0]
+		mesY 		= slotResults.sortedCentroidsXY[repetition, :, move, 1]
+
+		repeatability[:, 1] = meanPointX-mesX
+		repeatability[:, 2] = meanPointY-mesY
+		repeatability[:, 0] = np.sqrt(repeatability[:, 1]**2+repeatability[:, 2]**2)
+		repeatability[:, 3:7] = project_errors(	repeatability[:, 0], repeatability[:, 1], repeatability[:, 2],\
+												mesX, mesY, centerX, centerY,\
+												slotResults.realAngles[repetition, :, move, 0], slotResults.realAngles[repetition, :, move, 1])
+
+	#the targets reached at each move are accumulated over the moves
+	reachedTargets 		= np.sum(1000*modelError[:,:,:,0] <= slotResults.testParameters.desiredTargetError, axis = (0,1))
+	targetConvergeance 	= (np.cumsum(reachedTargets)/totalNbPoints*100).tolist()
+
+	mesRMSError1stMove			= 1000*mm.nanrms(np.ravel(modelError[:,:,0,0]))
+	mesRMSRepeatability1stMove 	= 1000*mm.nanrms(np.ravel(repeatability[:,0]))
+	mesTargetConvergeance 		= targetConvergeance
+	mesMaxNbMoves				= np.max(np.ravel(slotResults.nbCorrections[:,:]))+1
+
+	#store the results
+	slotResults.mesRMSError1stMove.append(			mesRMSError1stMove)
+	slotResults.mesRMSRepeatability1stMove.append(	mesRMSRepeatability1stMove)
+	slotResults.mesTargetConvergeance.append(		mesTargetConvergeance)
+	slotResults.mesMaxNbMoves.append(				mesMaxNbMoves)
+	slotResults.modelError							= modelError
+	slotResults.repeatability						= repeatability
+	slotResults.calcDone							= True
+
+	return slotResults
 
 def plot(testResults, config):
 	if not config.plotResults:
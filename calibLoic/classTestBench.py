@@ -1,6 +1,8 @@
 #cython: language_level=3
 import classCamera as cam
 import classCanCom as com
+import canSimulator as sim
+import syntheticCamera as sc
 import classPositioners as pos
 import copy
 import computeCentroid as cc
@@ -13,6 +15,7 @@ import time
 import logger as log
 import DEFINES
 import errors
+import tracing
 from miscmath import decompose_time
 
 class TestBench:
@@ -20,6 +23,8 @@ class TestBench:
 					'XYCameraID',\
 					'TiltCameraID',\
 					'canUSBSerialNo',\
+					'canUSBSimulator',\
+					'cameraSimulator',\
 					'cameraXY',\
 					'cameraTilt',\
 					'canUSB',\
@@ -30,7 +35,10 @@ class TestBench:
 					'originalSlotsCenters',\
 					'positioners',\
 					'slotsExposures',\
-					'recalibrateCenters')
+					'recalibrateCenters',\
+					'movingIDs',\
+					'movementExpectedEnd',\
+					'movementEnd')
 
 	def __init__(self):
 		self.benchName 			= 'Undefined testbench'
@@ -38,6 +46,8 @@ class TestBench:
 		self.XYCameraID			= None
 		self.TiltCameraID		= None
 		self.canUSBSerialNo		= ''
+		self.canUSBSimulator	= None 	#Options of the simulated CAN-USB and positioners used instead of the hardware
+		self.cameraSimulator	= None 	#Options of the synthetic cameras used instead of the hardware
 
 		self.cameraXY			= None
 		self.cameraTilt			= None
@@ -48,6 +58,9 @@ class TestBench:
 		self.slotsCenters 		= np.zeros((self.nbSlots, 2))
 		self.originalSlotsCenters = np.zeros((self.nbSlots, 2))
 		self.recalibrateCenters = True
+		self.movingIDs			= []
+		self.movementExpectedEnd = 0
+		self.movementEnd		= 0
 		self.clear_slots()
 
 	def init_cameraXY(self, pathToFile):
@@ -55,7 +68,7 @@ class TestBench:
 			return
 
 		try:
-			self.cameraXY = cam.Camera(DEFINES.PC_CAMERA_TYPE_XY, self.XYCameraID)
+			self.cameraXY = cam.Camera(DEFINES.PC_CAMERA_TYPE_XY, self.XYCameraID, self.get_camera_backend(self.XYCameraID))
 			self.cameraXY.setDistortionCorrection(pathToFile)
 		except Exception as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
@@ -66,18 +79,41 @@ class TestBench:
 			return
 
 		try:
-			self.cameraTilt = cam.Camera(DEFINES.PC_CAMERA_TYPE_TILT, self.TiltCameraID)
+			self.cameraTilt = cam.Camera(DEFINES.PC_CAMERA_TYPE_TILT, self.TiltCameraID, self.get_camera_backend(self.TiltCameraID))
 			self.cameraTilt.setDistortionCorrection(pathToFile)
 		except Exception as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise e from None
 
+	def get_camera_backend(self, cameraID):
+		#Basler cameras, or synthetic cameras if the testbench file asks for them
+		if self.cameraSimulator is None:
+			return None
+		return sc.SyntheticBackend(cameraID, self.get_simulated_spots, **self.cameraSimulator)
+
+	def get_simulated_spots(self):
+		#Positions [mm] of the fibers of the positioners, from their model and the positions of the simulated positioners
+		if not isinstance(self.canUSB.serHandle, sim.SimulatedSerial):
+			return []
+
+		spots = []
+		tNow = time.perf_counter()
+		for positioner in self.positioners:
+			simulatedPositioner = self.canUSB.serHandle.positioners.get(positioner.ID)
+			if simulatedPositioner is not None:
+				(alphaAngle, betaAngle) = [positioner.get_angle_from_steps(self.canUSB, steps) for steps in simulatedPositioner.get_position(tNow)]
+				spots.append(sc.get_spot_position(positioner.model, alphaAngle, betaAngle))
+		return spots
+
 	def init_canUSB(self):
-		if self.canUSBSerialNo is '':
+		if self.canUSBSimulator is None and self.canUSBSerialNo == '':
 			return
 
 		try:
-			self.canUSB.init(self.canUSBSerialNo)
+			if self.canUSBSimulator is not None:
+				self.canUSB.init_handle(sim.SimulatedSerial(**self.canUSBSimulator))
+			else:
+				self.canUSB.init(self.canUSBSerialNo)
 		except errors.CANError as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise e from None
@@ -169,6 +205,10 @@ class TestBench:
 		variablesToSave['XYCameraID'] 			= self.XYCameraID
 		variablesToSave['TiltCameraID'] 		= self.TiltCameraID
 		variablesToSave['canUSBSerialNo'] 		= self.canUSBSerialNo
+		if self.canUSBSimulator is not None:
+			variablesToSave['canUSBSimulator'] 	= self.canUSBSimulator
+		if self.cameraSimulator is not None:
+			variablesToSave['cameraSimulator'] 	= self.cameraSimulator
 		variablesToSave['slotsCenters'] 		= self.slotsCenters.tolist()
 		variablesToSave['recalibrateCenters'] 	= self.recalibrateCenters
 
@@ -211,55 +251,113 @@ class TestBench:
 	def get_connected_positioners_IDs(self):
 		return [self.positioners[i].ID for i in range(0, len(self.positioners)) ]
 
+	@tracing.traced(category = 'bench')
+	def wait_all_positioners(self):
+		#Wait for the end of the movements started without waiting. From the expected end of the moves, the status of the
+		#positioners still moving is polled until they all report their displacement completed. The positioners that did
+		#not complete it at the padded end raise an error
+		if len(self.movingIDs) < 1:
+			return
+
+		tRemaining = (self.movementExpectedEnd if DEFINES.POS_STATUS_POLLING_ENABLE else self.movementEnd)-time.perf_counter()
+		if tRemaining > 0:
+			time.sleep(tRemaining)
+
+		try:
+			movingIDs = self.movingIDs
+			while DEFINES.POS_STATUS_POLLING_ENABLE and len(movingIDs) > 0:
+				statuses = self.canUSB.CAN_write_many(movingIDs, 'statusrequest', [])
+				movingIDs = [ID for (ID, status) in zip(movingIDs, statuses) if not status[0]&self.canUSB._OPT.STREG.DISPLACEMENT_COMPLETED]
+				if len(movingIDs) < 1 or time.perf_counter() >= self.movementEnd:
+					break
+				time.sleep(min(DEFINES.POS_STATUS_POLLING_PERIOD, max(self.movementEnd-time.perf_counter(), 0)))
+
+			if DEFINES.POS_STATUS_POLLING_ENABLE and len(movingIDs) > 0:
+				strIDs = ', '.join([f'{ID:04d}' for ID in movingIDs])
+				log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, f'Positioners {strIDs} did not complete their movement in time')
+				raise errors.PositionerError(f'Positioners {strIDs} are still moving') from None
+
+		except errors.CANError as e:
+			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
+			raise errors.PositionerError("Positioners status could not be read") from None
+
+		finally:
+			self.movingIDs = []
+
+	def track_movements(self, moves):
+		#Registers the movements just started. moves is a list of (positioner, movement time of each axis [s])
+		tStart = time.perf_counter()
+		self.movingIDs				= [positioner.ID for (positioner, movementTimes) in moves]
+		self.movementExpectedEnd	= tStart+max([max(movementTimes) for (positioner, movementTimes) in moves], default = 0)
+		self.movementEnd			= tStart+max([positioner.get_movement_time(movementTimes) for (positioner, movementTimes) in moves], default = 0)
+
 	def stop_all_positioners(self):
 		try:
 			for positioner in self.positioners:
 				positioner.stop(self.canUSB)
+			self.movingIDs = []
+			self.movementEnd = 0
 		except errors.CANError as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise errors.PositionerError("Positioners could not be stopped. A manual shutdown is recommended") from None
 
+	@tracing.traced(category = 'bench')
 	def set_current_all_positioners(self, alphaCurrent, betaCurrent):
+		self.wait_all_positioners()
 		try:
-			for positioner in self.positioners:
-				positioner.set_current(self.canUSB, alphaCurrent, betaCurrent)
+			commands = [positioner.get_current_command(alphaCurrent, betaCurrent) for positioner in self.positioners]
+			self.canUSB.CAN_write_many(self.get_connected_positioners_IDs(), 'setopenloopcurrent', commands)
 		except (errors.CANError, errors.PositionerError) as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise errors.PositionerError("Positioners current setting failed") from None
 
+	@tracing.traced(category = 'bench')
 	def set_speed_all_positioners(self, alphaSpeed, betaSpeed):
+		self.wait_all_positioners()
 		try:
-			for positioner in self.positioners:
-				positioner.set_speed(self.canUSB, alphaSpeed, betaSpeed)
+			commands = [positioner.get_speed_command(alphaSpeed, betaSpeed) for positioner in self.positioners]
+			self.canUSB.CAN_write_many(self.get_connected_positioners_IDs(), 'set_speed', commands)
 		except (errors.CANError, errors.PositionerError) as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise errors.PositionerError("Positioners speed setting failed") from None
 
-	def move_all_positioners(self, alphaAngle, betaAngle):
-		tStart 	= -1
-		tEnd 	= 0
+	def move_all_positioners(self, alphaAngle, betaAngle, wait = True):
+		#If wait is False, the function returns as soon as the movements are started. The next bench command waits for their end
+		self.move_all_positioners_burst([alphaAngle]*len(self.positioners), [betaAngle]*len(self.positioners), wait)
+
+	@tracing.traced(category = 'bench')
+	def move_all_positioners_burst(self, alphaAngles, betaAngles, wait = True):
+		#Sends the moves of all the positioners as gotoposition commands in one burst. NaN angles leave the positioner in place.
+		#If wait is False, the function returns as soon as the movements are started. The next bench command waits for their end
+		if not len(alphaAngles) == len(self.positioners) or not len(betaAngles) == len(self.positioners):
+			raise errors.PositionerError("Length of input angles does not match the number of positioners") from None
+
+		self.wait_all_positioners()
 
 		try:
-			for positioner in self.positioners:
-				movementTime = positioner.goto_position(self.canUSB, alphaAngle, betaAngle)
-				if tStart < 0:
-					tStart = time.perf_counter() #Start chronometer after the first movemement started
-				tEnd = max(time.perf_counter()+movementTime,tEnd)
+			moves = [(positioner, alpha, beta) for (positioner, alpha, beta) in zip(self.positioners, alphaAngles, betaAngles) if not np.isnan(alpha) and not np.isnan(beta)]
+			IDs = [positioner.ID for (positioner, alpha, beta) in moves]
+			if len(IDs) < 1:
+				return
 
-			#Wait for the movements to finish
-			tRemaining = tEnd-time.perf_counter()
+			commands = [positioner.get_goto_position_command(alpha, beta) for (positioner, alpha, beta) in moves]
+			responses = self.canUSB.CAN_write_many(IDs, 'gotoposition_speed', commands)
+			self.track_movements([(positioner, response) for ((positioner, alpha, beta), response) in zip(moves, responses)])
 
-			while time.perf_counter()<tEnd:
-				time.sleep(0.005)
+			if wait:
+				self.wait_all_positioners()
 
 		except (errors.CANError, errors.PositionerError) as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise errors.PositionerError("Positioners movement failed") from None
 
-	def move_all_positioners_different_angles(self, alphaAngle, betaAngle, approachDistance = 0, isInRad = False):
+	@tracing.traced(category = 'bench')
+	def move_all_positioners_different_angles(self, alphaAngle, betaAngle, approachDistance = 0, isInRad = False, wait = True):
+		#If wait is False, the function returns as soon as the target movements are started. The next bench command waits for their end
 		if len(alphaAngle) is not self.nbSlots or len(betaAngle) is not self.nbSlots:
 			raise errors.PositionerError("Length of input angles does not match the number of positioners") from None
 
+		self.wait_all_positioners()
 		try:
 			if isInRad:
 				alphaAngle = 180*alphaAngle/np.pi
@@ -267,64 +365,16 @@ class TestBench:
 				approachDistance = 180*approachDistance/np.pi
 
 			if not approachDistance == 0:
-		
-				tStart 	= -1
-				tEnd 	= 0
-				movementTime = 0
-
-				for slot in range(0, self.nbSlots):
-					if not np.isnan(alphaAngle[slot]) and not np.isnan(betaAngle[slot]):
-						movementTime = self.positioners[slot].goto_position(self.canUSB, alphaAngle[slot]-approachDistance, betaAngle[slot]-approachDistance)
-					if tStart < 0:
-						tStart = time.perf_counter() #Start chronometer after the first movmement started
-					tEnd = max(time.perf_counter()+movementTime,tEnd)
-
-				#Wait for the movement to finish
-				tRemaining = tEnd-time.perf_counter()
-				while time.perf_counter()<tEnd:
-					time.sleep(0.005)
-
-			tStart 	= -1
-			tEnd 	= 0
-			movementTime = 0
-
-			for slot in range(0, self.nbSlots):
-				if not np.isnan(alphaAngle[slot]) and not np.isnan(betaAngle[slot]):
-					movementTime = self.positioners[slot].goto_position(self.canUSB, alphaAngle[slot], betaAngle[slot])
-				if tStart < 0:
-					tStart = time.perf_counter() #Start chronometer after the first movmement started
-				tEnd = max(time.perf_counter()+movementTime,tEnd)
-
-			#Wait for the movement to finish
-			tRemaining = tEnd-time.perf_counter()
-			while time.perf_counter()<tEnd:
-				time.sleep(0.005)
+				self.move_all_positioners_burst([angle-approachDistance for angle in alphaAngle], [angle-approachDistance for angle in betaAngle])
+			self.move_all_positioners_burst(alphaAngle, betaAngle, wait)
 
 		except (errors.CANError, errors.PositionerError) as e:
 			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
 			raise errors.PositionerError("Positioners movement failed") from None
 
-	def move_all_positioners_to_origin(self):
-		try:
-			tStart 	= -1
-			tEnd 	= 0
-
-			for positioner in self.positioners:
-				alphaAngle = max(0,positioner.physics.alphaAxisRange[0])
-				betaAngle = max(0,positioner.physics.betaAxisRange[0])
-				movementTime = positioner.goto_position(self.canUSB, alphaAngle, betaAngle)
-				if tStart < 0:
-					tStart = time.perf_counter() #Start chronometer after the first movmement started
-				tEnd = max(time.perf_counter()+movementTime,tEnd)
-
-			#Wait for the movement to finish
-			tRemaining = tEnd-time.perf_counter()
-			while time.perf_counter()<tEnd:
-				time.sleep(0.005)
-
-		except (errors.CANError, errors.PositionerError) as e:
-			log.message(DEFINES.LOG_MESSAGE_PRIORITY_ERROR, 0, str(e))
-			raise errors.PositionerError("Positioners movement failed") from None
+	def move_all_positioners_to_origin(self, wait = True):
+		self.move_all_positioners_burst(	[max(0,positioner.physics.alphaAxisRange[0]) for positioner in self.positioners],\
+										[max(0,positioner.physics.betaAxisRange[0]) for positioner in self.positioners], wait)
 
 	def move_positioners_to_offset(self, approachDistance):
 		try:
@@ -342,6 +392,7 @@ class TestBench:
 			raise errors.PositionerError("Positioners movement failed") from None
 
 	def calibrate_all_motors(self):
+		self.wait_all_positioners()
 		try:
 			# Launch motor calibration
 			for positioner in self.positioners:
@@ -367,6 +418,7 @@ class TestBench:
 			raise errors.PositionerError("Positioners motor calibration failed") from None
 
 	def calibrate_all_datums(self):
+		self.wait_all_positioners()
 		try:
 			for positioner in self.positioners:
 				positioner.calibrate_datum(self.canUSB)
@@ -386,6 +438,7 @@ class TestBench:
 			raise errors.PositionerError("Positioners datum calibration failed") from None
 
 	def calibrate_all_coggings(self):
+		self.wait_all_positioners()
 		try:
 			for positioner in self.positioners:
 				positioner.calibrate_cogging_torque(self.canUSB)
@@ -410,6 +463,7 @@ class TestBench:
 		self.close_canUSB()
 
 	def refold_positioners_for_shipping(self):
+		self.wait_all_positioners()
 		for positioner in self.positioners:
 			positioner.set_current(self.canUSB, positioner.physics.maxCurrentAlpha, positioner.physics.maxCurrentBeta)
 			positioner.set_speed(self.canUSB, positioner.physics.maxRpmAlpha, positioner.physics.maxRpmBeta)
@@ -2,29 +2,22 @@
 import logger as log
 import numpy as np
 import miscmath as mm
+import spotFitting as sf
 import copy
 from skimage.measure import label, regionprops
 from skimage.filters import gaussian as gaussian_filter
 import matplotlib.pyplot as plt
 import DEFINES
+import tracing
 
 #Get the exact location of the centroid
 def compute_centroid_old(image, cameraProps, result_ID):
-	col_corr = cameraProps.yCorr
-	row_corr = cameraProps.xCorr
-	# col_corr = cameraProps.xCorr
-	# row_corr = cameraProps.yCorr
-	# col_corr = np.multiply(cameraProps.xCorr,0)
-	# row_corr = np.multiply(cameraProps.yCorr,0)
 	col_offset = cameraProps.ROIoffsetX
 	row_offset = cameraProps.ROIoffsetY
 	scale_factor = cameraProps.scaleFactor
 	test_bench = cameraProps.cameraType
 	image_shape = image.shape
-	col_corr = col_corr[(row_offset):(row_offset+image_shape[DEFINES.CC_ROW_COORDINATE]),\
-						(col_offset):(col_offset+image_shape[DEFINES.CC_COL_COORDINATE])]
-	row_corr = row_corr[(row_offset):(row_offset+image_shape[DEFINES.CC_ROW_COORDINATE]),\
-						(col_offset):(col_offset+image_shape[DEFINES.CC_COL_COORDINATE])]				
+	(row_corr, col_corr) = cameraProps.distortionMap.get_window(row_offset, col_offset, image_shape[DEFINES.CC_ROW_COORDINATE], image_shape[DEFINES.CC_COL_COORDINATE])
 	image = np.divide(image, DEFINES.PC_CAMERA_MAX_INTENSITY_RAW).astype(np.float_)
 	image = np.nan_to_num(image)
 
@@ -217,23 +210,11 @@ def compute_centroid_old(image, cameraProps, result_ID):
 	return (col_out*scale_factor,row_out*scale_factor,col_out,row_out,width_col,width_row,height,result_ID)
 
 
-#Get the exact location of the centroid
-def compute_centroid(image, cameraProps, result_ID):
-	col_corr = copy.deepcopy(cameraProps.yCorr)
-	row_corr = copy.deepcopy(cameraProps.xCorr)
-	# col_corr = cameraProps.xCorr
-	# row_corr = cameraProps.yCorr
-	# col_corr = np.multiply(cameraProps.xCorr,0)
-	# row_corr = np.multiply(cameraProps.yCorr,0)
-	col_offset = cameraProps.ROIoffsetX
-	row_offset = cameraProps.ROIoffsetY
-	scale_factor = cameraProps.scaleFactor
-	test_bench = cameraProps.cameraType
+#Detect the spot in the image and return its thresholded cut-out with the distortion corrected coordinates.
+#Returns None if no valid spot could be found
+def _extract_spot(image, distortionMap, col_offset, row_offset, test_bench):
 	image_shape = image.shape
-	col_corr = col_corr[(row_offset):(row_offset+image_shape[DEFINES.CC_ROW_COORDINATE]),\
-						(col_offset):(col_offset+image_shape[DEFINES.CC_COL_COORDINATE])]
-	row_corr = row_corr[(row_offset):(row_offset+image_shape[DEFINES.CC_ROW_COORDINATE]),\
-						(col_offset):(col_offset+image_shape[DEFINES.CC_COL_COORDINATE])]				
+	(row_corr, col_corr) = distortionMap.get_window(row_offset, col_offset, image_shape[DEFINES.CC_ROW_COORDINATE], image_shape[DEFINES.CC_COL_COORDINATE])
 	image = np.divide(image, DEFINES.PC_CAMERA_MAX_INTENSITY_RAW).astype(np.float_)
 	image = np.nan_to_num(image)
 
@@ -242,17 +223,17 @@ def compute_centroid(image, cameraProps, result_ID):
 
 	#Check if the image is sufficiently bright
 	if np.max(image) < DEFINES.CC_CENTROID_DETECTION_THRESHOLD:
-		return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+		return None
 
 	#Check if the image is sufficiently big
 	if test_bench == DEFINES.PC_CAMERA_TYPE_XY:
 		if image_shape[0] < DEFINES.CC_CENTROID_XY_MAX_DIAMETER*DEFINES.CC_SMALL_IMAGE_CROP_ROW_RATIO_XY*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_XY or image_shape[1] < DEFINES.CC_CENTROID_XY_MAX_DIAMETER*DEFINES.CC_SMALL_IMAGE_CROP_COL_RATIO_XY*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_XY:
-			return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+			return None
 	elif test_bench == DEFINES.PC_CAMERA_TYPE_TILT:
 		if image_shape[0] < DEFINES.CC_CENTROID_TILT_MAX_DIAMETER*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_TILT or image_shape[1] < DEFINES.CC_CENTROID_TILT_MAX_DIAMETER*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_TILT:
-			return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+			return None
 	else:
-		return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+		return None
 
 	#Get connected points of the image
 	if test_bench == DEFINES.PC_CAMERA_TYPE_XY:
@@ -260,19 +241,19 @@ def compute_centroid(image, cameraProps, result_ID):
 	elif test_bench == DEFINES.PC_CAMERA_TYPE_TILT:
 		label_img = label(image > DEFINES.CC_CENTROID_DETECTION_THRESHOLD_TILT_RATIO*np.max(image))
 	else:
-		return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+		return None
 
 	props = regionprops(label_img, intensity_image=image, coordinates='rc')
 
 	if len(props) < 1:
-		return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+		return None
 
 	#search the first big dot in the properties. This avoids most reflectance artifacts.
 	for i in range(0,len(props)+1):
 		if i >= len(props):
 			# for i in range(0,len(props)):
 			# 	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO, 1, f'Diameter {props[i].equivalent_diameter:.2f}')
-			return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+			return None
 
 		diameter  = props[i].equivalent_diameter
 		intensity = props[i].max_intensity
@@ -284,6 +265,14 @@ def compute_centroid(image, cameraProps, result_ID):
 				if centroids[DEFINES.CC_ROW_COORDINATE] >= 0 and centroids[DEFINES.CC_ROW_COORDINATE] <= (image.shape)[DEFINES.CC_ROW_COORDINATE] \
 				and centroids[DEFINES.CC_COL_COORDINATE] >= 0 and centroids[DEFINES.CC_COL_COORDINATE] <= (image.shape)[DEFINES.CC_COL_COORDINATE]:
 					break
+
+	return _cut_spot(image, row_corr, col_corr, test_bench, diameter, centroids)
+
+#Cut the spot of the given diameter centered on centroids (row, col) out of the filtered image, threshold it
+#and build its distortion corrected coordinates
+def _cut_spot(image, row_corr, col_corr, test_bench, diameter, centroids):
+	image_shape = image.shape
+
 	#crop the image
 	if test_bench == DEFINES.PC_CAMERA_TYPE_XY:
 		crop_size_row_min = -int(diameter*DEFINES.CC_SMALL_IMAGE_CROP_ROW_RATIO_XY*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_XY)
@@ -296,7 +285,7 @@ def compute_centroid(image, cameraProps, result_ID):
 		crop_size_col_min = -int(diameter*DEFINES.CC_SMALL_IMAGE_CROP_COL_RATIO_TILT*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_TILT)
 		crop_size_col_max = int(diameter*DEFINES.CC_SMALL_IMAGE_CROP_COL_RATIO_TILT*DEFINES.CC_COMPUTATION_SIGMA_CROP_RATIO_TILT)
 	else:
-		return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+		return None
 
 	row_centroid = int(centroids[DEFINES.CC_ROW_COORDINATE])
 	col_centroid = int(centroids[DEFINES.CC_COL_COORDINATE])
@@ -312,7 +301,7 @@ def compute_centroid(image, cameraProps, result_ID):
 		crop_size_col_max = image_shape[DEFINES.CC_COL_COORDINATE]-col_centroid
 
 	image_small = image[	(row_centroid+crop_size_row_min):(row_centroid+crop_size_row_max),\
-							(col_centroid+crop_size_col_min):(col_centroid+crop_size_col_max)]
+							(col_centroid+crop_size_col_min):(col_centroid+crop_size_col_max)].copy()
 
 	col_corr_small = col_corr[	(row_centroid+crop_size_row_min):(row_centroid+crop_size_row_max),\
 								(col_centroid+crop_size_col_min):(col_centroid+crop_size_col_max)]
@@ -331,15 +320,121 @@ def compute_centroid(image, cameraProps, result_ID):
 
 	mm.threshold(image_small,data_min,data_max)
 
+	return (image_small, colIn, rowIn, data_max, crop_size_col_min, crop_size_row_min, col_centroid, row_centroid)
+
+#Detect the spots of several slots in one image. The image is filtered and labeled once, each blob is given to the
+#slot whose validity circle (center (col, row) in the image, radius in pixels) contains it, the nearest center winning.
+#Returns one spot per slot, None where no valid spot could be found
+def _extract_spots(image, distortionMap, col_offset, row_offset, test_bench, validityCenters, validityRadii):
+	spots = [None]*len(validityCenters)
+	image_shape = image.shape
+	if test_bench == DEFINES.PC_CAMERA_TYPE_XY:
+		ratio = DEFINES.CC_CENTROID_DETECTION_THRESHOLD_XY_RATIO
+	elif test_bench == DEFINES.PC_CAMERA_TYPE_TILT:
+		ratio = DEFINES.CC_CENTROID_DETECTION_THRESHOLD_TILT_RATIO
+	else:
+		return spots
+
+	(row_corr, col_corr) = distortionMap.get_window(row_offset, col_offset, image_shape[DEFINES.CC_ROW_COORDINATE], image_shape[DEFINES.CC_COL_COORDINATE], cache = False)
+	image = np.divide(image, DEFINES.PC_CAMERA_MAX_INTENSITY_RAW).astype(np.float_)
+	image = np.nan_to_num(image)
+
+	# Filter the 2D image
+	image = gaussian_filter(image,DEFINES.CC_IMAGE_XY_FILTERING_SIGMA)
+
+	#The slots do not share the same brightness, the blobs are labeled with the absolute detection threshold
+	label_img = label(image > DEFINES.CC_CENTROID_DETECTION_THRESHOLD)
+	props = regionprops(label_img, intensity_image=image, coordinates='rc')
+
+	candidates = [[] for center in validityCenters]
+	for prop in props:
+		centroid = prop.centroid
+		bestSlot = None
+		bestDistance = np.inf
+		for slot in range(0,len(validityCenters)):
+			distance = np.hypot(centroid[DEFINES.CC_COL_COORDINATE]-validityCenters[slot][0], centroid[DEFINES.CC_ROW_COORDINATE]-validityCenters[slot][1])
+			if (validityRadii[slot] == DEFINES.PC_IMAGE_GET_ALL_ROI or distance <= validityRadii[slot]) and distance < bestDistance:
+				bestSlot = slot
+				bestDistance = distance
+		if bestSlot is not None:
+			candidates[bestSlot].append(prop)
+
+	for slot in range(0,len(validityCenters)):
+		if len(candidates[slot]) < 1:
+			continue
+
+		#Keep the brightest blob of the slot and measure it above the same relative threshold as _extract_spot
+		prop = max(candidates[slot], key = lambda candidate: candidate.max_intensity)
+		blob = prop.intensity_image > ratio*prop.max_intensity
+		(blobRows, blobCols) = np.nonzero(blob)
+		diameter = np.sqrt(4*len(blobRows)/np.pi)
+		centroids = [0,0]
+		centroids[DEFINES.CC_ROW_COORDINATE] = prop.bbox[DEFINES.CC_ROW_COORDINATE]+np.mean(blobRows)
+		centroids[DEFINES.CC_COL_COORDINATE] = prop.bbox[DEFINES.CC_COL_COORDINATE]+np.mean(blobCols)
+
+		spots[slot] = _cut_spot(image, row_corr, col_corr, test_bench, diameter, centroids)
+
+	return spots
+
+#Detect the spot in windows growing around its predicted (col, row) position in the image, so that the filtering
+#and the labeling only cover the neighbourhood of the spot. The whole image is used if no window contains it.
+def _extract_predicted_spot(image, distortionMap, col_offset, row_offset, test_bench, prediction):
+	if prediction is None or not DEFINES.CC_PREDICTION_WINDOW_ENABLE:
+		return _extract_spot(image, distortionMap, col_offset, row_offset, test_bench)
+
+	(nbRows, nbCols) = image.shape
+	windowSize = DEFINES.CC_PREDICTION_WINDOW_INITIAL_SIZE
+	while windowSize < max(nbRows, nbCols):
+		#Keep the window in the image
+		col_min = int(min(max(prediction[0]-windowSize/2, 0), max(nbCols-windowSize, 0)))
+		row_min = int(min(max(prediction[1]-windowSize/2, 0), max(nbRows-windowSize, 0)))
+		col_max = min(col_min+windowSize, nbCols)
+		row_max = min(row_min+windowSize, nbRows)
+
+		spot = _extract_spot(image[row_min:row_max,col_min:col_max], distortionMap, col_offset+col_min, row_offset+row_min, test_bench)
+		if spot is not None:
+			(image_small, colIn, rowIn, data_max, crop_size_col_min, crop_size_row_min, col_centroid, row_centroid) = spot
+
+			#A cut-out touching the border of the window may be truncated, it is then searched in a bigger window
+			cut_row_min = row_centroid+crop_size_row_min
+			cut_col_min = col_centroid+crop_size_col_min
+			truncated = (cut_row_min <= 0 and row_min > 0) or \
+						(cut_col_min <= 0 and col_min > 0) or \
+						(cut_row_min+image_small.shape[0] >= row_max-row_min and row_max < nbRows) or \
+						(cut_col_min+image_small.shape[1] >= col_max-col_min and col_max < nbCols)
+			if not truncated:
+				return (image_small, colIn, rowIn, data_max, crop_size_col_min, crop_size_row_min, col_centroid+col_min, row_centroid+row_min)
+
+		windowSize *= DEFINES.CC_PREDICTION_WINDOW_GROWTH
+
+	return _extract_spot(image, distortionMap, col_offset, row_offset, test_bench)
+
+#Get the exact location of the centroid. spotFitter keeps the previous solutions of the slots to seed the fits.
+#prediction is the expected (col, row) position of the spot in the image, if known
+@tracing.traced(category = 'centroid')
+def compute_centroid(image, cameraProps, result_ID, spotFitter = None, prediction = None):
+	if spotFitter is None:
+		spotFitter = sf.SpotFitter(warmStart = False)
+	col_offset = cameraProps.ROIoffsetX
+	row_offset = cameraProps.ROIoffsetY
+	scale_factor = cameraProps.scaleFactor
+
+	spot = _extract_predicted_spot(image, cameraProps.distortionMap, col_offset, row_offset, cameraProps.cameraType, prediction)
+	if spot is None:
+		return [np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID]
+	(image_small, colIn, rowIn, data_max, crop_size_col_min, crop_size_row_min, col_centroid, row_centroid) = spot
+
 	current_image = image_small.copy()
 	current_colIn = colIn.copy()
 	current_rowIn = rowIn.copy()
 	
-	#Fit a 2D mm.gaussian
+	#Fit a 2D super-gaussian
+	colOrigin = col_centroid+crop_size_col_min+col_offset
+	rowOrigin = row_centroid+crop_size_row_min+row_offset
 	if cameraProps.cameraType == DEFINES.PC_CAMERA_TYPE_XY:
-		params = mm.fitgaussian(current_image,current_colIn,current_rowIn,data_min,data_max, DEFINES.CC_OPTIMIZER_TOLERANCE_XY)
+		params = spotFitter.fit(current_image,current_colIn,current_rowIn,DEFINES.CC_IMAGE_THRESHOLD_MIN,data_max, DEFINES.CC_OPTIMIZER_TOLERANCE_XY, result_ID, colOrigin, rowOrigin)
 	else:
-		params = mm.fitgaussian(current_image,current_colIn,current_rowIn,data_min,data_max, DEFINES.CC_OPTIMIZER_TOLERANCE_TILT)
+		params = spotFitter.fit(current_image,current_colIn,current_rowIn,DEFINES.CC_IMAGE_THRESHOLD_MIN,data_max, DEFINES.CC_OPTIMIZER_TOLERANCE_TILT, result_ID, colOrigin, rowOrigin)
 	(height, center_col, center_row, width_col, width_row, n) = params
 	
 	#rescale the result
@@ -351,10 +446,107 @@ def compute_centroid(image, cameraProps, result_ID):
 
 	return [col_out*scale_factor,row_out*scale_factor,col_out,row_out,width_col,width_row,height,result_ID]
 
+#Get the exact location of N spots at once. images are the spot cut-outs (typically one per bench slot),
+#offsetsX and offsetsY their ROI offsets in the full frame. The detection is done per image, the
+#gaussian fits of all the spots are then solved together on the stacked cut-outs.
+#predictions are the expected (col, row) positions of the spots in their image, None where unknown.
+@tracing.traced(category = 'centroid')
+def compute_centroids_batch(images, cameraProps, offsetsX, offsetsY, result_IDs, spotFitter = None, predictions = None):
+	spots = []
+	for i in range(0,len(images)):
+		prediction = None if predictions is None else predictions[i]
+		spots.append(_extract_predicted_spot(images[i], cameraProps.distortionMap, offsetsX[i], offsetsY[i], cameraProps.cameraType, prediction))
+
+	return _fit_spots(spots, cameraProps, offsetsX, offsetsY, result_IDs, spotFitter)
+
+#Get the exact location of the spots of several slots in one full frame, filtered and labeled only once.
+#validityCenters are the (col, row) centers of the slots validity circles in the frame and validityRadii their
+#radii in pixels (DEFINES.PC_IMAGE_GET_ALL_ROI for no limit)
+@tracing.traced(category = 'centroid')
+def compute_centroids_frame(frame, cameraProps, frameOffsetX, frameOffsetY, result_IDs, validityCenters, validityRadii, spotFitter = None):
+	(nbRows, nbCols) = frame.shape
+	col_min = 0
+	row_min = 0
+	col_max = nbCols
+	row_max = nbRows
+
+	#Only process the part of the frame covered by the validity circles
+	if all([radius != DEFINES.PC_IMAGE_GET_ALL_ROI for radius in validityRadii]):
+		col_min = int(max(min([center[0]-radius for (center, radius) in zip(validityCenters, validityRadii)]), 0))
+		row_min = int(max(min([center[1]-radius for (center, radius) in zip(validityCenters, validityRadii)]), 0))
+		col_max = int(min(max([center[0]+radius for (center, radius) in zip(validityCenters, validityRadii)])+1, nbCols))
+		row_max = int(min(max([center[1]+radius for (center, radius) in zip(validityCenters, validityRadii)])+1, nbRows))
+		if col_max <= col_min or row_max <= row_min:
+			return [[np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID] for result_ID in result_IDs]
+
+	centers = [(center[0]-col_min, center[1]-row_min) for center in validityCenters]
+	offsetsX = [frameOffsetX+col_min]*len(result_IDs)
+	offsetsY = [frameOffsetY+row_min]*len(result_IDs)
+
+	spots = _extract_spots(frame[row_min:row_max, col_min:col_max], cameraProps.distortionMap, offsetsX[0], offsetsY[0], cameraProps.cameraType, centers, validityRadii)
+
+	return _fit_spots(spots, cameraProps, offsetsX, offsetsY, result_IDs, spotFitter)
+
+#Solve the gaussian fits of the extracted spots together on their stacked cut-outs. spots are None where no
+#valid spot was found
+def _fit_spots(spots, cameraProps, offsetsX, offsetsY, result_IDs, spotFitter = None):
+	if spotFitter is None:
+		spotFitter = sf.SpotFitter(warmStart = False)
+	scale_factor = cameraProps.scaleFactor
+	results = [[np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,result_ID] for result_ID in result_IDs]
+
+	spotIndexes = [i for i in range(0,len(spots)) if spots[i] is not None]
+	spots = [spots[i] for i in spotIndexes]
+
+	if len(spots) < 1:
+		return results
+
+	#Stack the cut-outs, padding them to the biggest one. Padded pixels are masked out of the fit
+	nbRows = max([spot[0].shape[DEFINES.CC_ROW_COORDINATE] for spot in spots])
+	nbCols = max([spot[0].shape[DEFINES.CC_COL_COORDINATE] for spot in spots])
+	imageStack = np.full((len(spots),nbRows,nbCols), DEFINES.CC_IMAGE_THRESHOLD_MIN)
+	colInStack = np.zeros((len(spots),nbRows,nbCols))
+	rowInStack = np.zeros((len(spots),nbRows,nbCols))
+	maskStack = np.zeros((len(spots),nbRows,nbCols), dtype = bool)
+	dataMax = np.zeros(len(spots))
+	colOrigins = np.zeros(len(spots))
+	rowOrigins = np.zeros(len(spots))
+
+	for j in range(0,len(spots)):
+		(image_small, colIn, rowIn, data_max, crop_size_col_min, crop_size_row_min, col_centroid, row_centroid) = spots[j]
+		(rows, cols) = image_small.shape
+		imageStack[j,:rows,:cols] = image_small
+		colInStack[j,:rows,:cols] = colIn
+		rowInStack[j,:rows,:cols] = rowIn
+		maskStack[j,:rows,:cols] = True
+		dataMax[j] = data_max
+		colOrigins[j] = col_centroid+crop_size_col_min+offsetsX[spotIndexes[j]]
+		rowOrigins[j] = row_centroid+crop_size_row_min+offsetsY[spotIndexes[j]]
+	spotIDs = [result_IDs[i] for i in spotIndexes]
+
+	if cameraProps.cameraType == DEFINES.PC_CAMERA_TYPE_XY:
+		params = spotFitter.fit_batch(imageStack,colInStack,rowInStack,maskStack,DEFINES.CC_IMAGE_THRESHOLD_MIN,dataMax, DEFINES.CC_OPTIMIZER_TOLERANCE_XY, spotIDs, colOrigins, rowOrigins)
+	else:
+		params = spotFitter.fit_batch(imageStack,colInStack,rowInStack,maskStack,DEFINES.CC_IMAGE_THRESHOLD_MIN,dataMax, DEFINES.CC_OPTIMIZER_TOLERANCE_TILT, spotIDs, colOrigins, rowOrigins)
+
+	for j in range(0,len(spots)):
+		i = spotIndexes[j]
+		(height, center_col, center_row, width_col, width_row, n) = params[j]
+		(_, _, _, _, crop_size_col_min, crop_size_row_min, col_centroid, row_centroid) = spots[j]
+
+		#rescale the result
+		col_out = col_centroid+center_col+crop_size_col_min+offsetsX[i] # Add centroid offset and ROI offset
+		row_out = row_centroid+center_row+crop_size_row_min+offsetsY[i]
+
+		results[i] = [col_out*scale_factor,row_out*scale_factor,col_out,row_out,width_col,width_row,height,result_IDs[i]]
+
+	return results
+
 def main():
 	import miscmath as mm
 	import matplotlib.pyplot as plt
 	import classCamera
+	import distortionMap as dm
 
 	imgSizeX = 200
 	imgSizeY = 100
@@ -363,8 +555,7 @@ def main():
 	cam.parameters = classCamera.CameraParameters(DEFINES.PC_CAMERA_TYPE_XY, None)
 	cam.parameters.ROIoffsetX = 0
 	cam.parameters.ROIoffsetY = 0
-	cam.parameters.xCorr = np.zeros((imgSizeX,imgSizeY))
-	cam.parameters.yCorr = np.zeros((imgSizeX,imgSizeY))
+	cam.parameters.distortionMap = dm.DistortionMap(shape = (imgSizeX,imgSizeY))
 	cam.parameters.scaleFactor = 1
 
 	Xin = np.array([np.mgrid[0:imgSizeX],]*(imgSizeY)).transpose()
@@ -392,7 +583,8 @@ def main():
 	centroid = compute_centroid(imgIn,cam.parameters,1)
 	print(centroid)
 	plt.figure()
-	plt.pcolormesh(np.add(Xin,cam.parameters.xCorr) , np.add(Yin, cam.parameters.yCorr), imgIn, cmap=plt.cm.viridis)
+	(xCorr, yCorr) = cam.parameters.distortionMap.get_window(0, 0, imgSizeX, imgSizeY)
+	plt.pcolormesh(np.add(Xin,xCorr) , np.add(Yin, yCorr), imgIn, cmap=plt.cm.viridis)
 	plt.scatter(centroid[1],centroid[0],marker ='x',c='red')
 	plt.draw()
 	plt.pause(1e-17)
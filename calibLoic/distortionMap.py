@@ -0,0 +1,132 @@
+#cython: language_level=3
+import os
+import numpy as np
+from scipy import io
+from collections import OrderedDict
+import logger as log
+import DEFINES
+import errors
+
+class DistortionMap:
+	"""Distortion correction grids of a camera. The grids of the .mat file are converted once to a float32
+	.npy cache next to it, which is then memory mapped. The processes receiving this object through a queue
+	or as an argument map the cache again instead of copying the grids."""
+	__slots__ = (	'fileName',\
+					'shape',\
+					'scaleFactor',\
+					'grids',\
+					'windows')
+
+	GRIDS_NAMES	= ('xCorr', 'yCorr')
+
+	def __init__(self, fileName = None, shape = (0,0)):
+		self.fileName		= None
+		self.shape			= tuple(shape)
+		self.scaleFactor	= 1
+		self.windows		= OrderedDict()
+		self.grids			= None
+		if fileName is not None:
+			self.load(fileName)
+
+	def __getstate__(self):
+		return {'fileName': self.fileName, 'shape': self.shape, 'scaleFactor': self.scaleFactor}
+
+	def __setstate__(self, state):
+		self.fileName		= state['fileName']
+		self.shape			= state['shape']
+		self.scaleFactor	= state['scaleFactor']
+		self.windows		= OrderedDict()
+		self.grids			= None
+
+	def load(self, fileName):
+		cacheFileName = os.path.splitext(fileName)[0]+DEFINES.PC_FILE_DISTORTION_CACHE_EXTENSION
+
+		try:
+			cacheValid = os.path.getmtime(cacheFileName) >= os.path.getmtime(fileName)
+		except OSError:
+			cacheValid = False
+
+		if not cacheValid:
+			convert_distortion_file(fileName, cacheFileName)
+
+		self.fileName	= cacheFileName
+		self.windows	= OrderedDict()
+		self.grids		= None
+		grids			= self.get_grids()
+		self.shape		= grids[self.GRIDS_NAMES[0]].shape
+		self.scaleFactor= float(grids['scaleFactor'])
+
+	def get_grids(self):
+		#Map the cache on first use. Without a file, the grids are read-only zeros
+		if self.grids is None:
+			if self.fileName is None:
+				zeros = np.broadcast_to(np.float32(0), self.shape)
+				self.grids = {self.GRIDS_NAMES[0]: zeros, self.GRIDS_NAMES[1]: zeros, 'scaleFactor': self.scaleFactor}
+			else:
+				try:
+					self.grids = np.load(self.fileName, mmap_mode = 'r')
+				except (OSError, ValueError):
+					raise errors.IOError("Camera distortion cache could not be loaded") from None
+		return self.grids
+
+	def get_window(self, rowOffset, colOffset, nbRows, nbCols, cache = True):
+		#Returns the read-only (xCorr, yCorr) grids of a ROI. The recently used windows are kept in memory.
+		#Without cache, the windows are views of the mapped grids, for large ROIs that are only sampled
+		key = (int(rowOffset), int(colOffset), int(nbRows), int(nbCols))
+		if not cache:
+			grids = self.get_grids()
+			return tuple([grids[name][key[0]:key[0]+key[2], key[1]:key[1]+key[3]] for name in self.GRIDS_NAMES])
+
+		window = self.windows.get(key)
+		if window is not None:
+			self.windows.move_to_end(key)
+			return window
+
+		grids = self.get_grids()
+		window = []
+		for name in self.GRIDS_NAMES:
+			grid = np.array(grids[name][key[0]:key[0]+key[2], key[1]:key[1]+key[3]])
+			grid.flags.writeable = False
+			window.append(grid)
+		window = tuple(window)
+
+		self.windows[key] = window
+		if len(self.windows) > DEFINES.PC_DISTORTION_WINDOW_CACHE_SIZE:
+			self.windows.popitem(last = False)
+		return window
+
+def convert_distortion_file(fileName, cacheFileName):
+	try:
+		camDistortion = io.loadmat(fileName)
+	except (OSError, ValueError):
+		raise errors.IOError("Camera distortion file could not be loaded") from None
+
+	try:
+		camDistortion = camDistortion[DEFINES.PC_FILE_DISTORTION_PARAMETERS_NAME]
+
+		xCorr = np.nan_to_num(camDistortion[DEFINES.PC_FILE_DISTORTION_XCORR_NAME][0,0]).astype(np.float32)
+		yCorr = np.nan_to_num(camDistortion[DEFINES.PC_FILE_DISTORTION_YCORR_NAME][0,0]).astype(np.float32)
+		scaleFactor = camDistortion[DEFINES.PC_FILE_DISTORTION_SCALE_FACTOR_NAME][0,0][0,0]
+	except (KeyError, IndexError, ValueError):
+		raise errors.IOError("Camera distortion file data is corrupted") from None
+
+	if not xCorr.shape == yCorr.shape:
+		raise errors.IOError("Camera distortion file data is corrupted") from None
+
+	grids = np.zeros((), dtype = [	(DistortionMap.GRIDS_NAMES[0], np.float32, xCorr.shape),\
+									(DistortionMap.GRIDS_NAMES[1], np.float32, yCorr.shape),\
+									('scaleFactor', np.float64)])
+	grids[DistortionMap.GRIDS_NAMES[0]] = xCorr
+	grids[DistortionMap.GRIDS_NAMES[1]] = yCorr
+	grids['scaleFactor'] = scaleFactor
+
+	#write to a temporary file first so that a concurrent reader never maps a partial cache
+	temporaryFileName = cacheFileName+'.tmp'
+	try:
+		with open(temporaryFileName, 'wb') as cacheFile:
+			np.save(cacheFile, grids)
+		os.replace(temporaryFileName, cacheFileName)
+	except OSError:
+		raise errors.IOError("Camera distortion cache could not be written") from None
+
+	log.message(DEFINES.LOG_MESSAGE_PRIORITY_DEBUG_INFO, 1, f'Camera distortion cached in {cacheFileName}')
@@ -13,7 +13,8 @@ class _LoggingManager():
 					'guiWindow',\
 					'nbMessages',\
 					'previousMsgPriority',\
-					'previousMsgOverwritable')
+					'previousMsgOverwritable',\
+					'capturedMessages')
 
 	def __init__(self, guiWindow = None):
 		self.logProcess	= None		
@@ -23,6 +24,7 @@ class _LoggingManager():
 		self.nbMessages = 0
 		self.previousMsgPriority = DEFINES.LOG_MESSAGE_PRIORITY_INFO
 		self.previousMsgOverwritable = True
+		self.capturedMessages = None
 
 	def start_logging(self, guiWindow = None):
 		if not self.logReady:
@@ -59,7 +61,9 @@ class _LoggingManager():
 		self.guiWindow = None
 
 	def add_log(self, priority = DEFINES.LOG_MESSAGE_PRIORITY_INFO, tabulationLevel = 0, message = '', overwritable = False, removeMsgHeader = False):
-		if self.guiWindow is not None:
+		if self.capturedMessages is not None:
+			self.capturedMessages.append((priority, tabulationLevel, message, overwritable, removeMsgHeader))
+		elif self.guiWindow is not None:
 			self.gui_log(priority, message, overwritable)
 		elif self.logReady:
 			args = (priority, tabulationLevel, message, overwritable, removeMsgHeader)
@@ -214,6 +218,20 @@ def message(priority = DEFINES.LOG_MESSAGE_PRIORITY_INFO, tabulationLevel = 0, m
 
 def reset_message_count():
 	_logManager.reset_message_count()
+
+def start_capture():
+	#The next messages are kept instead of being logged, until stop_capture returns them
+	_logManager.capturedMessages = []
+
+def stop_capture():
+	messages = _logManager.capturedMessages
+	_logManager.capturedMessages = None
+	return [] if messages is None else messages
+
+def replay(messages):
+	#Logs the messages returned by stop_capture, for example in another process
+	for args in messages:
+		_logManager.add_log(*args)
 	
 def main():
 	init()
@@ -88,6 +88,53 @@ def get_circle_center_approx(xData, yData):
 
 	return (xC, yC)
 
+def fit_circle_algebraic(xData, yData):
+	#Taubin algebraic fit of the circles through the points of the last axis, the NaN being ignored.
+	#The leading axes are fitted independently. Returns the centers X, Y and the radii
+	xData = np.asarray(xData, dtype = np.float64)
+	yData = np.asarray(yData, dtype = np.float64)
+	valid = ~(np.isnan(xData) | np.isnan(yData))
+	nbData = np.count_nonzero(valid, axis = -1)
+
+	with np.errstate(invalid = 'ignore', divide = 'ignore'):
+		meanX = np.sum(np.where(valid, xData, 0), axis = -1)/nbData
+		meanY = np.sum(np.where(valid, yData, 0), axis = -1)/nbData
+		X = np.where(valid, xData-meanX[...,np.newaxis], 0)
+		Y = np.where(valid, yData-meanY[...,np.newaxis], 0)
+		Z = X**2+Y**2
+
+		Mxx = np.sum(X*X, axis = -1)/nbData
+		Myy = np.sum(Y*Y, axis = -1)/nbData
+		Mxy = np.sum(X*Y, axis = -1)/nbData
+		Mxz = np.sum(X*Z, axis = -1)/nbData
+		Myz = np.sum(Y*Z, axis = -1)/nbData
+		Mzz = np.sum(Z*Z, axis = -1)/nbData
+
+		#Coefficients of the characteristic polynomial, whose smallest root is found by Newton's method starting from 0
+		Mz = Mxx+Myy
+		covXY = Mxx*Myy-Mxy**2
+		varZ = Mzz-Mz**2
+		A3 = 4*Mz
+		A2 = -3*Mz**2-Mzz
+		A1 = varZ*Mz+4*covXY*Mz-Mxz**2-Myz**2
+		A0 = Mxz*(Mxz*Myy-Myz*Mxy)+Myz*(Myz*Mxx-Mxz*Mxy)-varZ*covXY
+
+		root = np.zeros_like(Mz)
+		for i in range(0,DEFINES.MM_CIRCLE_FIT_NEWTON_ITERATIONS):
+			value = A0+root*(A1+root*(A2+root*A3))
+			derivative = A1+root*(2*A2+root*3*A3)
+			increment = np.where(derivative != 0, value/derivative, 0)
+			root = root-increment
+			if not np.any(np.abs(increment) > DEFINES.MM_CIRCLE_FIT_NEWTON_TOLERANCE*np.abs(root)):
+				break
+
+		det = 2*(root**2-root*Mz+covXY)
+		centerX = (Mxz*(Myy-root)-Myz*Mxy)/det
+		centerY = (Myz*(Mxx-root)-Mxz*Mxy)/det
+		radius = np.sqrt(centerX**2+centerY**2+Mz)
+
+	return centerX+meanX, centerY+meanY, radius
+
 def fit_circle(xData,yData):
 	#rough approximation of the circle's parameters
 
@@ -96,18 +143,20 @@ def fit_circle(xData,yData):
 
 	nbData = len(xData)
 	if nbData>2:
-		#get rough estimation of circle using 3 well space points to create the circumcircle
+		#get an estimation of the circle with the algebraic fit
 		xData = xData.astype(np.float64)
 		yData = yData.astype(np.float64)
 
-		estimate_center = get_circle_center_approx(xData, yData)
-		estimate_radius = np.nanmedian(dist((estimate_center[0],estimate_center[1]),(xData,yData)))
-
-		params = (estimate_center[0], estimate_center[1], estimate_radius)
+		params = fit_circle_algebraic(xData, yData)
+		if not np.all(np.isfinite(params)):
+			#collinear points, use 3 well space points to create the circumcircle
+			estimate_center = get_circle_center_approx(xData, yData)
+			estimate_radius = np.nanmedian(dist((estimate_center[0],estimate_center[1]),(xData,yData)))
+			params = (estimate_center[0], estimate_center[1], estimate_radius)
 
 		#optimize
 		errorfunction = lambda p: distToCircle(*p)(xData,yData)
-		params, success = optimize.leastsq(errorfunction, params, ftol = 1e-30)
+		params, success = optimize.leastsq(errorfunction, params, Dfun = distToCircleJacobian(xData,yData), ftol = 1e-30)
 	elif nbData == 2:
 		params = (np.mean(xData),np.mean(yData),np.sqrt((xData[0]-xData[1])**2+(yData[0]-yData[1])**2))
 	else:
@@ -265,8 +314,9 @@ def computeValidSoftROI(image, camMaxX, camMaxY, validityCenter, validityRadius)
 
 		validityCenter = (validityCenter[0]-x_min, validityCenter[1]-y_min) #Shift the circle center in the new image shape
 
+		#The masked image is a new array, the input image may be a view on a shared frame
 		circularMask = create_circular_mask(image.shape[0], image.shape[1], validityCenter, validityRadius)
-		image[~circularMask] = 0
+		image = np.where(circularMask, image, 0)
 
 		return image, x_min, y_min
 
@@ -336,33 +386,55 @@ def get_endpoint(centerX,centerY,lAlpha,lBeta,alphaAngle,betaAngle):
 
 	return targetX, targetY
 
-def model_error(optParams,alphaCommand,betaCommand,alphaIterpolator,betaIterpolator,xData,yData,getFullOutput = False):
+def interp_extrapolate(x, xTable, yTable):
+	#np.interp on the sorted table, extended linearly beyond its ends as interp1d(kind='linear', fill_value='extrapolate')
+	order = np.argsort(xTable, kind = 'stable')
+	xTable = np.asarray(xTable, dtype = np.float64)[order]
+	yTable = np.asarray(yTable, dtype = np.float64)[order]
+	x = np.asarray(x, dtype = np.float64)
+	y = np.interp(x, xTable, yTable)
+	if len(xTable) > 1:
+		with np.errstate(invalid = 'ignore'):
+			y = np.where(x < xTable[0], yTable[0]+(x-xTable[0])*(yTable[1]-yTable[0])/(xTable[1]-xTable[0]), y)
+			y = np.where(x > xTable[-1], yTable[-1]+(x-xTable[-1])*(yTable[-1]-yTable[-2])/(xTable[-1]-xTable[-2]), y)
+	return y
+
+def model_endpoint_error(optParams,alphaAngle,betaAngle,xData,yData):
+	#Errors of the model endpoints to the measures, for the angles given by the non-linearity tables (without the offsets)
 	(centerX,centerY,lAlpha,lBeta,offsetAlpha,offsetBeta) = optParams
-	# print((centerX,centerY,lAlpha,lBeta,offsetAlpha,offsetBeta))
-
-	#iterate to get all the errors
-	valuesToRemove = np.isnan(xData)
-	(nbRepetitions,nbStartingPoints,nbAxes,nbSteps) = xData.shape
-	totalNbPoints = nbRepetitions*nbStartingPoints*nbAxes*nbSteps
-	resErrors = np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps),np.nan)
-	errorX = np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps),np.nan)
-	errorY = np.full((nbRepetitions,nbStartingPoints,nbAxes,nbSteps),np.nan)
-
-	for repetition in range(0,nbRepetitions):
-		for startingPoint in range(0,nbStartingPoints):
-			for axis in range(0,nbAxes):
-				for step in range(0,nbSteps):
-					if not valuesToRemove[repetition,startingPoint,axis,step]:
-						#get model angle
-						alphaAngle = alphaIterpolator(alphaCommand[startingPoint,axis,step])+offsetAlpha
-						betaAngle = betaIterpolator(betaCommand[startingPoint,axis,step])+offsetBeta
-
-						(targetX,targetY) = get_endpoint(centerX,centerY,lAlpha,lBeta,alphaAngle,betaAngle)
-						
-						errorX[repetition,startingPoint,axis,step] = targetX-xData[repetition,startingPoint,axis,step]
-						errorY[repetition,startingPoint,axis,step] = targetY-yData[repetition,startingPoint,axis,step]
+	(targetX,targetY) = get_endpoint(centerX,centerY,lAlpha,lBeta,alphaAngle+offsetAlpha,betaAngle+offsetBeta)
+	errorX = targetX-xData
+	errorY = targetY-yData
+	return np.sqrt(errorX**2+errorY**2),errorX,errorY
+
+def model_endpoint_error_jacobian(optParams,alphaAngle,betaAngle,xData,yData):
+	#Derivatives of the model_endpoint_error distances with respect to the 6 model parameters, one row per measure
+	(centerX,centerY,lAlpha,lBeta,offsetAlpha,offsetBeta) = optParams
+	alphaArm = alphaAngle+offsetAlpha-np.pi/2
+	betaArm = alphaArm+betaAngle+offsetBeta
+	(cosAlpha,sinAlpha) = (np.cos(alphaArm),np.sin(alphaArm))
+	(cosBeta,sinBeta) = (np.cos(betaArm),np.sin(betaArm))
+
+	errorX = cosAlpha*lAlpha+cosBeta*lBeta+centerX-xData
+	errorY = -sinAlpha*lAlpha-sinBeta*lBeta+centerY-yData
+	with np.errstate(invalid = 'ignore', divide = 'ignore'):
+		distance = np.sqrt(errorX**2+errorY**2)
+		(unitX,unitY) = (np.where(distance > 0, errorX/distance, 0),np.where(distance > 0, errorY/distance, 0))
+
+	#d(targetX, targetY)/d(centerX, centerY, lAlpha, lBeta, offsetAlpha, offsetBeta)
+	return np.stack((	unitX,\
+						unitY,\
+						unitX*cosAlpha-unitY*sinAlpha,\
+						unitX*cosBeta-unitY*sinBeta,\
+						-unitX*(sinAlpha*lAlpha+sinBeta*lBeta)-unitY*(cosAlpha*lAlpha+cosBeta*lBeta),\
+						-(unitX*sinBeta+unitY*cosBeta)*lBeta), axis = -1)
 
-						resErrors[repetition,startingPoint,axis,step] = np.sqrt(errorX[repetition,startingPoint,axis,step]**2+errorY[repetition,startingPoint,axis,step]**2)
+def model_error(optParams,alphaCommand,betaCommand,alphaIterpolator,betaIterpolator,xData,yData,getFullOutput = False):
+	#get model angles of all the measures at once
+	alphaAngle = alphaIterpolator(alphaCommand)
+	betaAngle = betaIterpolator(betaCommand)
+
+	(resErrors,errorX,errorY) = model_endpoint_error(optParams,alphaAngle,betaAngle,xData,yData)
 
 	if getFullOutput:
 		return resErrors,errorX,errorY
@@ -407,14 +479,24 @@ def optimize_model(centerX,centerY,lAlpha,lBeta,offsetAlpha,offsetBeta,alphaComm
 	# print((meanBetaMeasures,meanBetaCommand))
 
 	#construct the alpha and beta approximators
-	alphaIterpolator = interpolate.interp1d(meanAlphaCommand, meanAlphaMeasures, kind='linear', fill_value='extrapolate')
-	betaIterpolator = interpolate.interp1d(meanBetaCommand, meanBetaMeasures, kind='linear', fill_value='extrapolate')
+	alphaIterpolator = lambda command: interp_extrapolate(command, meanAlphaCommand, meanAlphaMeasures)
+	betaIterpolator = lambda command: interp_extrapolate(command, meanBetaCommand, meanBetaMeasures)
 
-	modelFit = rms_model_error(params,alphaCommand,betaCommand,alphaIterpolator,betaIterpolator,xData,yData)
-	
 	if len(~np.isnan(np.ravel(xData))) >= len(params):
-		degenerated_error = lambda params: np.sqrt(model_error(params,alphaCommand,betaCommand,alphaIterpolator,betaIterpolator,xData,yData,False))
-		params, success = optimize.leastsq(degenerated_error, params, ftol = DEFINES.MM_MODEL_FIT_OPT_TOLERANCE, maxfev = DEFINES.MM_MODEL_FIT_OPT_MAX_F_EV)
+		#the model angles do not depend on the parameters, they are interpolated once for the valid measures
+		(alphaAngle,betaAngle,xValid,yValid) = np.broadcast_arrays(alphaIterpolator(alphaCommand),betaIterpolator(betaCommand),xData,yData)
+		validPoints = ~np.isnan(model_endpoint_error(params,alphaAngle,betaAngle,xValid,yValid)[0])
+		(alphaAngle,betaAngle,xValid,yValid) = (alphaAngle[validPoints],betaAngle[validPoints],xValid[validPoints],yValid[validPoints])
+
+		#the residuals are the square roots of the distances, so that the sum of the distances is minimized
+		degenerated_error = lambda params: np.sqrt(model_endpoint_error(params,alphaAngle,betaAngle,xValid,yValid)[0])
+		def degenerated_error_jacobian(params):
+			residuals = degenerated_error(params)
+			with np.errstate(invalid = 'ignore', divide = 'ignore'):
+				scale = np.where(residuals > 0, 0.5/residuals, 0)
+			return scale[:,np.newaxis]*model_endpoint_error_jacobian(params,alphaAngle,betaAngle,xValid,yValid)
+
+		params, success = optimize.leastsq(degenerated_error, params, Dfun = degenerated_error_jacobian, ftol = DEFINES.MM_MODEL_FIT_OPT_TOLERANCE, maxfev = DEFINES.MM_MODEL_FIT_OPT_MAX_F_EV)
 	else:
 		log.message(DEFINES.LOG_MESSAGE_PRIORITY_WARNING,1,f'Optimization skipped. Not enough data available.')
 
@@ -422,8 +504,6 @@ def optimize_model(centerX,centerY,lAlpha,lBeta,offsetAlpha,offsetBeta,alphaComm
 	params[4] = np.mod(params[4]+np.pi,2*np.pi)-np.pi
 	params[5] = np.mod(params[5]+np.pi,2*np.pi)-np.pi #adapt offsets between -pi and pi
 
-	modelFit = rms_model_error(params,alphaCommand,betaCommand,alphaIterpolator,betaIterpolator,xData,yData)
-	
 	return params
 
 def threshold(data, min_val, max_val):
@@ -445,6 +525,13 @@ def circle(centerX, centerY, radius):
 def distToCircle(centerX, centerY, radius):
 	return lambda x,y: np.sqrt((centerX-x)**2+(centerY-y)**2)-radius
 
+def distToCircleJacobian(x, y):
+	#Derivatives of distToCircle with respect to the center X, Y and the radius
+	def jacobian(p):
+		distance = dist((p[0],p[1]),(x,y))
+		return np.stack(((p[0]-x)/distance, (p[1]-y)/distance, np.full(np.shape(x),-1.0)), axis = 1)
+	return jacobian
+
 def gaussian(height, center_x, center_y, width_x, width_y, n):
 	"""Returns a gaussian function with the given parameters"""
 	width_x = float(width_x)
@@ -489,6 +576,22 @@ def fitgaussian(data,Xin,Yin,data_min,data_max,optimizerTolerance):
 
 	return estimate
 
+def moments_batch(data, Xin, Yin, mask):
+	"""Returns a (N,6) array of (height, x, y, width_x, width_y, n)
+	the gaussian parameters of a stack of 2D distributions by calculating their
+	background subtracted moments. Pixels outside mask are ignored"""
+	background = np.min(np.where(mask, data, np.inf), axis = (1,2))
+	weights = np.where(mask, data-background[:,np.newaxis,np.newaxis], 0)
+	total = np.sum(weights, axis = (1,2))
+	total[total <= 0] = np.nan
+	x = np.sum(Xin*weights, axis = (1,2))/total
+	y = np.sum(Yin*weights, axis = (1,2))/total
+	width_x = np.sqrt(np.sum((Xin-x[:,np.newaxis,np.newaxis])**2*weights, axis = (1,2))/total)
+	width_y = np.sqrt(np.sum((Yin-y[:,np.newaxis,np.newaxis])**2*weights, axis = (1,2))/total)
+	height = np.max(np.where(mask, data, -np.inf), axis = (1,2))
+	n = np.ones(data.shape[0])
+	return np.stack((height, x, y, width_x, width_y, n), axis = 1)
+
 def get_img_ID(image_ID):
 	centroidType = 		(image_ID & MM_IMG_ID_BITMASK_FOR_CENTROID_TYPE)	>> MM_IMG_ID_BITSHIFT_FOR_CENTROID_TYPE
 	direction = 		(image_ID & MM_IMG_ID_BITMASK_FOR_DIRECTION)		>> MM_IMG_ID_BITSHIFT_FOR_DIRECTION
@@ -0,0 +1,261 @@
+#cython: language_level=3
+import numpy as np
+import warnings
+import miscmath as mm
+import tracing
+import DEFINES
+
+CIRCLE_SUMS_LENGTH	= 9 #n, x, y, xx, xy, yy, xz, yz, zz with z = xx+yy
+STEP_SUMS_LENGTH	= 4 #n, x, y, z
+
+def wrap_angle(angle):
+	return np.mod(angle+np.pi,2*np.pi)-np.pi
+
+def angular_mean(angles, axis = None):
+	return np.arctan2(np.nanmean(np.sin(angles), axis = axis), np.nanmean(np.cos(angles), axis = axis))
+
+def fit_circle_sums(sums):
+	#Kasa algebraic fit of the circles of the sums of the last axis. Returns the centers X, Y, the radii and the RMS distances
+	#of the points to the circles, NaN for the circles with less than CALIB_ONLINE_MIN_POINTS points
+	(n, Sx, Sy, Sxx, Sxy, Syy, Sxz, Syz, Szz) = np.moveaxis(sums, -1, 0)
+	Sz = Sxx+Syy
+	matrix = np.stack((	np.stack((Sxx, Sxy, Sx), axis = -1),\
+						np.stack((Sxy, Syy, Sy), axis = -1),\
+						np.stack((Sx, Sy, n), axis = -1)), axis = -2)
+	vector = -np.stack((Sxz, Syz, Sz), axis = -1)
+
+	solution = np.full(np.shape(vector), np.nan)
+	valid = n >= DEFINES.CALIB_ONLINE_MIN_POINTS
+	valid[valid] = np.abs(np.linalg.det(matrix[valid])) > 0
+	solution[valid] = np.linalg.solve(matrix[valid], vector[valid][...,np.newaxis])[...,0]
+	(D, E, F) = np.moveaxis(solution, -1, 0)
+
+	#sum of the squared algebraic distances z+Dx+Ey+F, which are about 2*radius times the distances to the circle
+	squaredErrors = Szz+D**2*Sxx+E**2*Syy+F**2*n+2*(D*Sxz+E*Syz+F*Sz+D*E*Sxy+D*F*Sx+E*F*Sy)
+	with np.errstate(invalid = 'ignore', divide = 'ignore'):
+		radius = np.sqrt(D**2/4+E**2/4-F)
+		residual = np.sqrt(np.maximum(squaredErrors, 0)/n)/(2*radius)
+
+	return -D/2, -E/2, radius, residual
+
+class OnlineModel:
+	"""Model of the bench positioners estimated during the calibration run, as the centroids arrive.
+	The centroids are only accumulated in sums: the circle fit sums of each starting point and axis, and the position
+	sums of each step. The circles, arm lengths, offsets and non-linearity are computed from them on demand."""
+	__slots__ = (	'nbSlots',\
+					'axesToTest',\
+					'commands',\
+					'requirements',\
+					'origins',\
+					'circleSums',\
+					'stepSums',\
+					'nbReceived',\
+					'nbMissing',\
+					'nbResultsRead',\
+					'nbRepetitionsDone',\
+					'previousEstimates',\
+					'changes',\
+					'converged',\
+					'failing')
+
+	def __init__(self, nbSlots, nbStartingPoints, axesToTest, nbSteps, nbDirections, commands, requirements):
+		#commands are the (startingPoint, axis, step, direction, alpha/beta) commanded angles [deg], filled during the run.
+		#requirements are the PositionerRequirements of each slot
+		nbAxes = max(axesToTest)+1
+		self.nbSlots			= nbSlots
+		self.axesToTest			= axesToTest
+		self.commands			= commands
+		self.requirements		= requirements
+		self.origins			= np.full((nbSlots,2), np.nan) #the sums are relative to the first centroid of each slot
+		self.circleSums			= np.zeros((nbSlots,nbStartingPoints,nbAxes,CIRCLE_SUMS_LENGTH))
+		self.stepSums			= np.zeros((nbSlots,nbStartingPoints,nbAxes,nbSteps,nbDirections,STEP_SUMS_LENGTH))
+		self.nbReceived			= np.zeros(nbSlots, dtype = np.int64)
+		self.nbMissing			= np.zeros(nbSlots, dtype = np.int64)
+		self.nbResultsRead		= 0
+		self.nbRepetitionsDone	= 0
+		self.previousEstimates	= None
+		self.changes			= np.full(nbSlots, np.nan)
+		self.converged			= np.full(nbSlots, False)
+		self.failing			= np.full(nbSlots, False)
+
+	@tracing.traced(category = 'model')
+	def update(self, processManager):
+		#Reads the centroids computed since the last update
+		nbResults = processManager.get_centroid_results_length()
+		if nbResults > self.nbResultsRead:
+			self.add_centroids(processManager.get_centroids_result(self.nbResultsRead, nbResults))
+			self.nbResultsRead = nbResults
+
+	def add_centroids(self, results):
+		(benchSlot, repetition, startingPoint, axis, step, direction, centroidType) = mm.get_img_ID(np.asarray(results[:,7], dtype = np.int64))
+		received = (centroidType == DEFINES.MM_IMG_ID_XY_IDENTIFIER) & (benchSlot < self.nbSlots)
+		valid = received & ~np.isnan(results[:,0]) & ~np.isnan(results[:,1])
+		np.add.at(self.nbReceived, benchSlot[received], 1)
+		np.add.at(self.nbMissing, benchSlot[received & ~valid], 1)
+
+		(benchSlot, startingPoint, axis, step, direction) = (benchSlot[valid], startingPoint[valid], axis[valid], step[valid], direction[valid])
+		for slot in np.unique(benchSlot[np.isnan(self.origins[benchSlot,0])]):
+			self.origins[slot] = results[valid][benchSlot == slot][0,0:2]
+
+		x = results[valid,0]-self.origins[benchSlot,0]
+		y = results[valid,1]-self.origins[benchSlot,1]
+		z = x**2+y**2
+		ones = np.ones(len(x))
+		np.add.at(self.circleSums, (benchSlot, startingPoint, axis), np.stack((ones, x, y, x*x, x*y, y*y, x*z, y*z, z*z), axis = -1))
+		np.add.at(self.stepSums, (benchSlot, startingPoint, axis, step, direction), np.stack((ones, x, y, z), axis = -1))
+
+	def get_estimates(self):
+		#Current model of all the slots. Positions are in [mm], angles in [rad]. The slots, starting points and steps
+		#without enough centroids yet give NaN
+		with warnings.catch_warnings(), np.errstate(invalid = 'ignore', divide = 'ignore'):
+			warnings.simplefilter('ignore', category = RuntimeWarning)
+			return self._compute_estimates()
+
+	def _compute_estimates(self):
+		direction = DEFINES.MM_IMG_ID_COUNTERCLOCKWIZE_DIR_IDENTIFIER
+		alpha = DEFINES.PARAM_AXIS_ALPHA
+		beta = DEFINES.PARAM_AXIS_BETA
+		commands = mm.deg2rad(np.asarray(self.commands))
+
+		(centersX, centersY, radii, residuals) = fit_circle_sums(self.circleSums)
+		nbPoints = self.circleSums[...,0]
+		circleResidual = np.sqrt(np.nansum(nbPoints*residuals**2, axis = (1,2))/np.sum(np.where(np.isnan(residuals), 0, nbPoints), axis = (1,2)))
+
+		#Mean position of each step, and its scatter
+		stepPoints = self.stepSums[...,0]
+		stepX = self.stepSums[...,1]/stepPoints
+		stepY = self.stepSums[...,2]/stepPoints
+		stepScatter = np.where(stepPoints > 1, self.stepSums[...,3]-stepPoints*(stepX**2+stepY**2), 0)
+		repeatability = np.sqrt(np.sum(np.maximum(stepScatter, 0), axis = (1,2,3,4))/np.sum(np.where(stepPoints > 1, stepPoints, 0), axis = (1,2,3,4)))
+
+		#Measured angles of the steps around the circle of their starting point and axis
+		stepAngles = np.arctan2(stepX-centersX[...,np.newaxis,np.newaxis], stepY-centersY[...,np.newaxis,np.newaxis])
+
+		alphaArmAngles = np.full(centersX.shape[0:2], np.nan)
+		if alpha in self.axesToTest and beta in self.axesToTest:
+			#Angle of the beta axis seen from the alpha axis
+			alphaArmAngles = np.arctan2(centersX[:,:,beta]-centersX[:,:,alpha], centersY[:,:,beta]-centersY[:,:,alpha])
+			stepAngles[:,:,beta] -= alphaArmAngles[...,np.newaxis,np.newaxis]
+
+		axesCommands = np.stack([commands[:,axis,:,:,axis] for axis in range(0,commands.shape[1])], axis = 1)
+		stepNonLinearity = wrap_angle(stepAngles-axesCommands[np.newaxis])
+		startingPointOffsets = angular_mean(stepNonLinearity[...,direction], axis = -1)
+		stepNonLinearity = wrap_angle(stepNonLinearity-startingPointOffsets[...,np.newaxis,np.newaxis])
+		nonLinearity = np.nanmean(stepNonLinearity[...,direction], axis = 1)
+
+		#Center, arm lengths and offsets as computed by compute_model
+		center = self.origins+np.stack((np.nanmean(centersX[:,:,alpha], axis = 1), np.nanmean(centersY[:,:,alpha], axis = 1)), axis = -1)
+		lengths = np.full((self.nbSlots,2), np.nan)
+		offsets = np.zeros((self.nbSlots,2))
+		if alpha in self.axesToTest and beta in self.axesToTest:
+			lengths[:,alpha] = np.nanmean(np.hypot(centersX[:,:,beta]-centersX[:,:,alpha], centersY[:,:,beta]-centersY[:,:,alpha]), axis = 1)
+			offsets[:,alpha] = angular_mean(wrap_angle(alphaArmAngles-commands[np.newaxis,:,beta,0,direction,alpha]), axis = 1)
+		elif alpha in self.axesToTest:
+			lengths[:,alpha] = np.nanmean(radii[:,:,alpha], axis = 1)
+		if beta in self.axesToTest:
+			lengths[:,beta] = np.nanmean(radii[:,:,beta], axis = 1)
+			offsets[:,beta] = angular_mean(startingPointOffsets[:,:,beta], axis = 1)
+
+		return {'center': center,\
+				'lengths': lengths,\
+				'radii': np.nanmean(radii, axis = 1),\
+				'offsets': offsets,\
+				'nonLinearity': nonLinearity,\
+				'circleResidual': circleResidual,\
+				'repeatability': repeatability,\
+				'missingRate': np.where(self.nbReceived > 0, self.nbMissing/np.maximum(self.nbReceived, 1), 0)}
+
+	def end_repetition(self):
+		#Compares the model with the one at the end of the previous repetition. Returns the slots which converged
+		estimates = self.get_estimates()
+		self.nbRepetitionsDone += 1
+
+		if self.previousEstimates is not None:
+			#changes of the positions and of the arm ends positions due to the offsets [um]
+			with np.errstate(invalid = 'ignore'):
+				changes = np.concatenate((	np.abs(estimates['center']-self.previousEstimates['center']),\
+											np.abs(estimates['lengths']-self.previousEstimates['lengths']),\
+											np.abs(wrap_angle(estimates['offsets']-self.previousEstimates['offsets']))*estimates['lengths']), axis = 1)
+			self.changes = 1000*np.max(changes, axis = 1)
+		self.previousEstimates = estimates
+
+		with np.errstate(invalid = 'ignore'):
+			self.converged = (self.nbRepetitionsDone >= DEFINES.CALIB_ONLINE_MIN_REPETITIONS) & (self.changes <= DEFINES.CALIB_ONLINE_CONVERGENCE_TOLERANCE)
+		return [slot for slot in range(0,self.nbSlots) if self.converged[slot]]
+
+	def check_failures(self):
+		#Flags the slots whose model is far off the requirements. Returns the slots which started failing
+		estimates = self.get_estimates()
+		newFailures = []
+		for slot in range(0,self.nbSlots):
+			if self.failing[slot]:
+				continue
+			requirements = self.requirements[slot]
+			maxNonLinearity = 180*np.nanmax(np.abs(estimates['nonLinearity'][slot]), initial = 0)/np.pi
+			if	1000*estimates['circleResidual'][slot] > DEFINES.CALIB_ONLINE_FAILURE_MARGIN*requirements.maxRoundnessDeviation or\
+				maxNonLinearity > DEFINES.CALIB_ONLINE_FAILURE_MARGIN*requirements.maxNonLinearity or\
+				estimates['missingRate'][slot] > DEFINES.CALIB_ONLINE_MAX_MISSING_RATE:
+				self.failing[slot] = True
+				newFailures.append(slot)
+		return newFailures
+
+	def get_quality(self, slot):
+		#Live quality of the slot model. The circle residual, repeatability and change since the previous repetition are in [um],
+		#the non-linearity in [deg] and the arm lengths in [mm]
+		estimates = self.get_estimates()
+		return {'nbCentroids':		int(self.nbReceived[slot]),\
+				'missingRate':		float(estimates['missingRate'][slot]),\
+				'circleResidual':	1000*float(estimates['circleResidual'][slot]),\
+				'repeatability':	1000*float(estimates['repeatability'][slot]),\
+				'maxNonLinearity':	180*float(np.nanmax(np.abs(estimates['nonLinearity'][slot]), initial = 0))/np.pi,\
+				'alphaLength':		float(estimates['lengths'][slot,DEFINES.PARAM_AXIS_ALPHA]),\
+				'betaLength':		float(estimates['lengths'][slot,DEFINES.PARAM_AXIS_BETA]),\
+				'change':			float(self.changes[slot]),\
+				'converged':		bool(self.converged[slot]),\
+				'failing':			bool(self.failing[slot])}
+
+class AdaptiveSampling:
+	"""Steps of the calibration circles, refined where the non-linearity cannot be interpolated between the measured steps.
+	The sweeps start on a coarse subset of the steps. After each sweep, the change of the online model non-linearity derivative
+	at each measured step gives the error of its interpolation from its neighbours, and the steps halfway to them are added
+	to the next sweeps where it exceeds the tolerance"""
+	__slots__ = (	'stepCoords',\
+					'onlineModel',\
+					'tolerance',\
+					'selected')
+
+	def __init__(self, stepCoords, axesToTest, onlineModel, coarseStepsRatio, tolerance):
+		#stepCoords are the commanded angles [deg] of the steps of each axis, tolerance is the max interpolation error [um]
+		nbSteps = len(stepCoords[0])
+		self.stepCoords		= stepCoords
+		self.onlineModel	= onlineModel
+		self.tolerance		= tolerance
+		self.selected		= np.full((max(axesToTest)+1,nbSteps), False)
+		for axis in axesToTest:
+			self.selected[axis,0:nbSteps:max(int(coarseStepsRatio), 1)] = True
+			self.selected[axis,nbSteps-1] = True
+
+	def get_nb_selected(self):
+		return int(np.sum(self.selected))
+
+	def refine(self, axis):
+		#Adds the steps where the interpolation error of a slot exceeds the tolerance. Returns the number of steps added
+		estimates = self.onlineModel.get_estimates()
+		steps = np.flatnonzero(self.selected[axis])
+		if len(steps) < 3:
+			return 0
+		angles = mm.deg2rad(np.asarray(self.stepCoords[axis])[steps])
+		nonLinearity = estimates['nonLinearity'][:,axis,steps]
+
+		#the error of the linear interpolation of a step from its neighbours is proportional to the change of the derivative
+		intervals = np.diff(angles)
+		derivative = np.diff(nonLinearity, axis = -1)/intervals
+		weights = intervals[:-1]*intervals[1:]/(intervals[:-1]+intervals[1:])
+		errors = 1000*estimates['radii'][:,axis,np.newaxis]*np.abs(np.diff(derivative, axis = -1))*weights
+		errors = np.where(np.isnan(errors) | self.onlineModel.failing[:,np.newaxis], 0, errors)
+		stepsToRefine = np.flatnonzero(np.max(errors, axis = 0, initial = 0) > self.tolerance)+1
+
+		newSteps = np.unique(np.concatenate(((steps[stepsToRefine-1]+steps[stepsToRefine])//2, (steps[stepsToRefine]+steps[stepsToRefine+1])//2)))
+		newSteps = newSteps[~self.selected[axis,newSteps]]
+		self.selected[axis,newSteps] = True
+		return len(newSteps)
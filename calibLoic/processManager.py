@@ -3,6 +3,7 @@ import DEFINES
 import time
 import numpy as np
 import computeCentroid as cc
+import spotFitting as sf
 import multiprocessing as mp
 from queue import Empty
 import matplotlib
@@ -11,15 +12,230 @@ import matplotlib.pyplot as plt
 import logger as log
 import miscmath as mm
 import sys
-import copy
+import os
+from multiprocessing import shared_memory
+import errors
+import tracing
+
+class FrameBuffer:
+	"""Ring of shared memory frames. The cameras write the images in a free frame and only the frame index
+	goes through the centroid queue. The centroid process releases the frame once the spots are computed."""
+	__slots__ = (	'nbFrames',\
+					'frameSize',\
+					'sharedMemories',\
+					'freeFrames')
+
+	def __init__(self, nbFrames, frameSize):
+		self.nbFrames			= nbFrames
+		self.frameSize			= int(frameSize) #pixels
+		self.sharedMemories		= [shared_memory.SharedMemory(create = True, size = self.frameSize*np.dtype(np.float64).itemsize) for i in range(0,nbFrames)]
+		self.freeFrames			= mp.Queue()
+
+		for i in range(0,nbFrames):
+			self.freeFrames.put(i)
+
+	def __getstate__(self):
+		#Only the shared memory names are sent to the processes, which then attach to the same frames
+		return {'nbFrames': self.nbFrames, 'frameSize': self.frameSize, 'names': [memory.name for memory in self.sharedMemories], 'freeFrames': self.freeFrames}
+
+	def __setstate__(self, state):
+		self.nbFrames			= state['nbFrames']
+		self.frameSize			= state['frameSize']
+		self.sharedMemories		= [shared_memory.SharedMemory(name = name) for name in state['names']]
+		self.freeFrames			= state['freeFrames']
+
+	def acquire_frame(self, shape):
+		if shape[0]*shape[1] > self.frameSize:
+			raise errors.OutOfRangeError('The image does not fit in the shared memory frames') from None
+		try:
+			frameIndex = self.freeFrames.get(block = True, timeout = DEFINES.PROC_FRAME_BUFFER_TIMEOUT)
+		except Empty:
+			raise errors.Error('No shared memory frame was released in time') from None
+
+		return frameIndex, self.get_frame(frameIndex, shape)
+
+	def get_frame(self, frameIndex, shape):
+		return np.ndarray(shape, dtype = np.float64, buffer = self.sharedMemories[frameIndex].buf)
+
+	def release_frame(self, frameIndex):
+		self.freeFrames.put(frameIndex)
+
+	def close(self):
+		for memory in self.sharedMemories:
+			try:
+				memory.close()
+			except BufferError:
+				pass #an image still references the frame, the mapping is freed with it
+
+	def unlink(self):
+		#Only called by the process manager which created the frames, once all the processes are stopped
+		for memory in self.sharedMemories:
+			memory.unlink()
+		self.sharedMemories = []
+
+class ResultTable:
+	"""Shared memory table of the centroid results. The rows are indexed by the decoded image ID
+	(benchSlot, repetition, startingPoint, axis, step, direction, centroidType) in the shape given
+	at reset, so the results can be read in place. The completion order is kept for the live plot.
+	The table is moved to a bigger shared memory segment when a run does not fit in it, and the other processes
+	attach to the new segment the next time they use the table."""
+	__slots__ = (	'capacity',\
+					'creatorPID',\
+					'sharedMemory',\
+					'segmentName',\
+					'segmentCapacity',\
+					'lock',\
+					'header',\
+					'rows',\
+					'order')
+
+	ROW_DTYPE		= np.dtype([('centroid', np.float64, (8,)), ('completed', np.bool_), ('fallback', np.bool_)], align = True)
+	HEADER_LENGTH	= DEFINES.MM_IMG_ID_NB_FIELDS+1 #table shape, then number of stored results
+
+	def __init__(self, capacity):
+		self.creatorPID			= os.getpid()
+		self.sharedMemory		= None
+		self.segmentName		= mp.Array('c', DEFINES.PROC_RESULT_TABLE_NAME_LENGTH, lock = False)
+		self.segmentCapacity	= mp.Value('q', 0, lock = False)
+		self.lock				= mp.Lock()
+		self._allocate(capacity)
+		self.reset((0,)*DEFINES.MM_IMG_ID_NB_FIELDS)
+
+	def __getstate__(self):
+		return {'segmentName': self.segmentName, 'segmentCapacity': self.segmentCapacity, 'lock': self.lock}
+
+	def __setstate__(self, state):
+		self.creatorPID			= None
+		self.sharedMemory		= None
+		self.segmentName		= state['segmentName']
+		self.segmentCapacity	= state['segmentCapacity']
+		self.lock				= state['lock']
+		self._attach()
+
+	def _allocate(self, capacity):
+		#Creates the segment of the table, the previous one is freed once its views are released
+		previousMemory			= self.sharedMemory
+		self.capacity			= int(capacity)
+		self.sharedMemory		= shared_memory.SharedMemory(create = True, size = self.HEADER_LENGTH*8+self.capacity*(self.ROW_DTYPE.itemsize+8))
+		self.segmentName.value	= self.sharedMemory.name.encode()
+		self.segmentCapacity.value = self.capacity
+		self._map_arrays()
+		if previousMemory is not None:
+			try:
+				previousMemory.close()
+			except BufferError:
+				pass #a view of the table is still used, the mapping is freed with it
+			previousMemory.unlink()
+
+	def _attach(self):
+		#Attaches to the current segment of the table if it was moved since the last use
+		if self.sharedMemory is not None and self.sharedMemory.name == self.segmentName.value.decode():
+			return
+		if self.sharedMemory is not None:
+			try:
+				self.sharedMemory.close()
+			except BufferError:
+				pass
+		self.capacity			= int(self.segmentCapacity.value)
+		self.sharedMemory		= shared_memory.SharedMemory(name = self.segmentName.value.decode())
+		self._map_arrays()
+
+	def _map_arrays(self):
+		self.header				= np.ndarray((self.HEADER_LENGTH,), dtype = np.int64, buffer = self.sharedMemory.buf)
+		self.rows				= np.ndarray((self.capacity,), dtype = self.ROW_DTYPE, buffer = self.sharedMemory.buf, offset = self.header.nbytes)
+		self.order				= np.ndarray((self.capacity,), dtype = np.int64, buffer = self.sharedMemory.buf, offset = self.header.nbytes+self.rows.nbytes)
+
+	def reset(self, shape):
+		if len(shape) != DEFINES.MM_IMG_ID_NB_FIELDS:
+			raise errors.Error('The result table shape must have one dimension per image ID field') from None
+		with self.lock:
+			if int(np.prod(shape)) > self.capacity:
+				if self.creatorPID != os.getpid():
+					raise errors.OutOfRangeError('The centroid results do not fit in the result table') from None
+				self._allocate(int(np.prod(shape)))
+
+			self.header[DEFINES.MM_IMG_ID_NB_FIELDS] = 0
+			self.rows['completed'] = False
+			self.rows['fallback'] = False
+			self.rows['centroid'] = np.nan
+			self.header[0:DEFINES.MM_IMG_ID_NB_FIELDS] = shape
+
+	def get_shape(self):
+		return tuple(int(dim) for dim in self.header[0:DEFINES.MM_IMG_ID_NB_FIELDS])
+
+	def store(self, result, fallback = False):
+		#Returns False if the image ID is outside of the current table. fallback flags the results of a fast centroid mode that required the full fit
+		self._attach()
+		try:
+			row = np.ravel_multi_index(mm.get_img_ID(np.int64(result[7])), self.get_shape())
+		except ValueError:
+			return False
+
+		#write the data before raising the completion flag, readers only consider completed rows
+		self.rows['centroid'][row] = result
+		self.rows['fallback'][row] = fallback
+		self.rows['completed'][row] = True
+
+		with self.lock:
+			self.order[self.header[DEFINES.MM_IMG_ID_NB_FIELDS]] = row
+			self.header[DEFINES.MM_IMG_ID_NB_FIELDS] += 1
+		return True
+
+	def get_length(self):
+		self._attach()
+		return int(self.header[DEFINES.MM_IMG_ID_NB_FIELDS])
+
+	def get_results(self, start = 0, end = -1):
+		#Copy of the results stored between start and end, in completion order
+		self._attach()
+		if end == -1:
+			end = self.get_length()
+		return self.rows['centroid'][self.order[start:end]]
+
+	def get_table(self):
+		#In place views of the results and of their completion flags, shaped as the decoded image IDs
+		self._attach()
+		shape = self.get_shape()
+		nbRows = int(np.prod(shape))
+		return self.rows['centroid'][0:nbRows].reshape(shape+(8,)), self.rows['completed'][0:nbRows].reshape(shape)
+
+	def get_fallbacks(self):
+		#In place view of the fallback flags, shaped as the decoded image IDs
+		self._attach()
+		shape = self.get_shape()
+		return self.rows['fallback'][0:int(np.prod(shape))].reshape(shape)
+
+	def close(self):
+		self.header = None
+		self.rows = None
+		self.order = None
+		try:
+			self.sharedMemory.close()
+		except BufferError:
+			pass #a view of the table is still used, the mapping is freed with it
+
+	def unlink(self):
+		#Only the process that created the table frees it, the forked processes inherit this object
+		if self.creatorPID == os.getpid():
+			self.sharedMemory.unlink()
+			self.creatorPID = None
+
+	def __del__(self):
+		if self.creatorPID == os.getpid():
+			self.close()
+			self.unlink()
 
 class ProcessManager:
 	__slots__ = (	'nbCentroidProcesses',\
 					'centroidProcesses',\
 					'centroidQueue',\
-					'resultManager',\
-					'resultList',\
+					'taskResultQueue',\
+					'taskBatch',\
+					'resultTable',\
+					'frameBuffer',\
+					'centroidMode',\
 					'centroidProcessesStarted',\
+					'traceFiles',\
 					'livePlotProcess',\
 					'livePlotCommandQueue',\
 					'livePlotProcessStarted')
@@ -29,9 +245,13 @@ class ProcessManager:
 
 		self.centroidProcesses					= []
 		self.centroidQueue						= mp.JoinableQueue(2**30)# for i in range(0,self.nbCentroidProcesses)]
-		self.resultManager						= mp.Manager()
-		self.resultList 						= self.resultManager.list()
+		self.taskResultQueue					= mp.Queue()
+		self.taskBatch							= 0
+		self.resultTable 						= ResultTable(DEFINES.PROC_RESULT_TABLE_CAPACITY)
+		self.frameBuffer						= None
+		self.centroidMode						= DEFINES.CC_CENTROID_DEFAULT_MODE
 		self.centroidProcessesStarted			= False
+		self.traceFiles							= []
 
 		self.livePlotProcess					= []
 		self.livePlotCommandQueue 				= None
@@ -41,19 +261,41 @@ class ProcessManager:
 		self.livePlotCommandQueue = mp.Queue()
 		return self.livePlotCommandQueue
 
-	def start_centroid_processes(self, cameraXYparams = None, cameraTiltparams = None):
+	def start_centroid_processes(self, cameraXYparams = None, cameraTiltparams = None, centroidMode = DEFINES.CC_CENTROID_DEFAULT_MODE):
 		if not self.centroidProcessesStarted:
+			if centroidMode not in (DEFINES.CC_CENTROID_MODE_FIT, DEFINES.CC_CENTROID_MODE_CENTER_OF_MASS, DEFINES.CC_CENTROID_MODE_QUADRATIC_PEAK):
+				raise errors.Error(f'Unknown centroid mode {centroidMode}') from None
+			self.centroidMode = centroidMode
+
 			# self.nbCentroidProcesses = max(min(mp.cpu_count()-1,DEFINES.PROC_MAX_NB_PROCESSES), DEFINES.PROC_MIN_NB_PROCESSES)
 
 			# self.nbCentroidProcesses = 1
 
+			#Size the shared frames for the biggest camera image
+			frameSize = 0
+			for cameraParams in (cameraXYparams, cameraTiltparams):
+				if cameraParams is not None:
+					frameSize = max(frameSize, cameraParams.maxX*cameraParams.maxY)
+			if frameSize > 0:
+				self.frameBuffer = FrameBuffer(DEFINES.PROC_FRAME_BUFFER_NB_FRAMES, frameSize)
+
+			#If the spans are traced, the processes save theirs when they stop
+			if tracing.is_enabled():
+				self.traceFiles = [tracing.get_process_trace_fileName(f'centroid{i}') for i in range(0,self.nbCentroidProcesses)]
+			else:
+				self.traceFiles = [None]*self.nbCentroidProcesses
+
 			for i in range(0,self.nbCentroidProcesses):
 				self.centroidProcesses.append(mp.Process(	target = centroids_calculation_process,\
 															args = (self.centroidQueue,\
-																	self.resultList,\
+																	self.resultTable,\
 																	log.get_queue_object(),\
 																	cameraXYparams,\
-																	cameraTiltparams)))
+																	cameraTiltparams,\
+																	self.frameBuffer,\
+																	self.centroidMode,\
+																	self.traceFiles[i],\
+																	self.taskResultQueue)))
 			for p in self.centroidProcesses:
 				p.start()
 
@@ -63,7 +305,7 @@ class ProcessManager:
 		if not self.livePlotProcessStarted and self.livePlotCommandQueue is not None:
 			self.livePlotProcess.append(mp.Process(	target = livePlot_process, \
 													args = (self.livePlotCommandQueue, \
-															self.resultList,\
+															self.resultTable,\
 															xMax, \
 															yMax, \
 															nbSlots)))
@@ -86,10 +328,15 @@ class ProcessManager:
 			#reclear the queue
 			self.centroidQueueClear()
 
+			if self.frameBuffer is not None:
+				self.frameBuffer.close()
+				self.frameBuffer.unlink()
+				self.frameBuffer = None
+
 			#clear the variables
 			self.centroidProcesses			= []
 			self.centroidProcessesStarted 	= False
-			self.restart_manager()
+			self.clear_centroids_results()
 
 	def stop_livePlot_process(self):
 		if self.livePlotProcessStarted:
@@ -116,87 +363,223 @@ class ProcessManager:
 			self.livePlotProcess			= []
 			self.livePlotProcessStarted 	= False
 
-	def restart_manager(self):
-		if not self.centroidProcessesStarted:
-			self.resultManager				= mp.Manager()
-			self.resultList 				= self.resultManager.list()
+	def export_trace(self, fileName):
+		#Chrome trace of this process and of the centroid processes stopped since they were started with tracing enabled
+		tracing.export_chrome_trace(fileName, [traceFile for traceFile in self.traceFiles if traceFile is not None and os.path.exists(traceFile)])
 
 	def get_centroids_result(self, start = 0, end = -1):
-		if end == -1:
-			return self.resultList[start:]
-		else:
-			return self.resultList[start:end]
+		return self.resultTable.get_results(start, end)
 
-	def clear_centroids_results(self):
-		self.resultList[:] = []
+	def get_centroids_table(self):
+		return self.resultTable.get_table()
 
-	def get_centroid_results_length(self):
-		return len(self.resultList)
+	def get_centroids_fallbacks(self):
+		return self.resultTable.get_fallbacks()
 
-	def centroidQueuePut(self, args, block = True):
-		self.centroidQueue.put(args, block = block)
+	def clear_centroids_results(self, shape = None):
+		#shape is the number of (benchSlot, repetition, startingPoint, axis, step, direction, centroidType) of the next run
+		if shape is None:
+			shape = (0,)*DEFINES.MM_IMG_ID_NB_FIELDS
+		self.resultTable.reset(shape)
+
+	def get_centroid_results_length(self):
+		return self.resultTable.get_length()
 
 	def centroidQueueJoin(self):
 		self.centroidQueue.join()
 
+	def centroidQueuePutFrame(self, frameIndex, image, frameOffsetX, frameOffsetY, spots, block = True):
+		#spots is a list of (imgID, ROI, validityCenter, validityRadius) to compute in the frame. ROI and validityCenter are in camera coordinates, ROI can be None to use the whole frame.
+		#If the image is not in a shared memory frame (frameIndex is None), its pixels are sent along with the spots.
+		if len(spots) < 1:
+			self.release_frame(frameIndex)
+			return
+
+		if frameIndex is None:
+			pixels = image
+		else:
+			pixels = None
+		self.centroidQueue.put((DEFINES.PROCESSES_FRAME_JOB, frameIndex, image.shape, frameOffsetX, frameOffsetY, spots, pixels), block = block)
+
+	def release_frame(self, frameIndex):
+		#Gives back a grabbed frame which will not be sent to the centroid processes
+		if frameIndex is not None and self.frameBuffer is not None:
+			self.frameBuffer.release_frame(frameIndex)
+
+	def run_tasks(self, function, tasksArgs):
+		#Returns [function(*args) for args in tasksArgs], computed by the centroid processes if they are started.
+		#The results and the messages logged by the tasks come back in the order of the tasks. The first failed task raises its error
+		if not self.centroidProcessesStarted or len(tasksArgs) < 2:
+			return [function(*args) for args in tasksArgs]
+
+		#the results of a previous call which timed out are still coming back, they are told apart by their batch number
+		self.taskBatch += 1
+		for (taskIndex, args) in enumerate(tasksArgs):
+			self.centroidQueue.put((DEFINES.PROCESSES_TASK_JOB, self.taskBatch, taskIndex, function, args), block = True)
+
+		results = [None]*len(tasksArgs)
+		failures = [None]*len(tasksArgs)
+		logs = [None]*len(tasksArgs)
+		nextTaskToLog = 0
+		nbReceived = 0
+		while nbReceived < len(tasksArgs):
+			try:
+				(batch, taskIndex, success, result, messages) = self.taskResultQueue.get(block = True, timeout = DEFINES.PROC_TASK_TIMEOUT)
+			except Empty:
+				raise errors.Error('A computation task did not complete in time') from None
+			if batch != self.taskBatch:
+				continue
+			nbReceived += 1
+			if success:
+				results[taskIndex] = result
+			else:
+				failures[taskIndex] = result
+			logs[taskIndex] = messages
+
+			#log the tasks completed so far, in order
+			while nextTaskToLog < len(tasksArgs) and logs[nextTaskToLog] is not None:
+				log.replay(logs[nextTaskToLog])
+				nextTaskToLog += 1
+
+		for failure in failures:
+			if failure is not None:
+				raise failure
+
+		return results
+
 	def centroidQueueClear(self):		
 		try:
 			while 1:
-				self.centroidQueue.get_nowait()
+				args = self.centroidQueue.get_nowait()
+				if _is_frame_job(args) and args[1] is not None and self.frameBuffer is not None:
+					self.frameBuffer.release_frame(args[1])
 				self.centroidQueue.task_done()
 		except (Empty, ValueError):
 			pass
 		
-def centroids_calculation_process(inputQueue, outputList, logQueue, cameraXYparams, cameraTiltparams):
+def _is_frame_job(args):
+	return isinstance(args, tuple) and len(args) > 0 and isinstance(args[0], str) and args[0] == DEFINES.PROCESSES_FRAME_JOB
+
+def _is_task_job(args):
+	return isinstance(args, tuple) and len(args) > 0 and isinstance(args[0], str) and args[0] == DEFINES.PROCESSES_TASK_JOB
+
+def centroids_calculation_process(inputQueue, resultTable, logQueue, cameraXYparams, cameraTiltparams, frameBuffer = None, centroidMode = DEFINES.CC_CENTROID_DEFAULT_MODE, traceFile = None, taskResultQueue = None):
 	np.warnings.filterwarnings('ignore')
+	if traceFile is not None:
+		#A forked process inherits the spans of its parent
+		tracing.clear()
+		tracing.enable()
 	# cameraXYparams = copy.deepcopy(cameraXYparams)
+
+	#The fits of each slot are seeded with the last solution this process found for it
+	spotFitter = sf.SpotFitter(centroidMode = centroidMode)
 	
 	try:
 		while 1:
 			args = inputQueue.get(block = True)
 
 			if args == DEFINES.PROCESSES_POISON_PILL:
+				if frameBuffer is not None:
+					frameBuffer.close()
+				resultTable.close()
+				if traceFile is not None:
+					tracing.save_events(traceFile)
 				return
 
-			elif args != '':
-				image = copy.deepcopy(args[0])
-				offsetX = args[1]
-				offsetY = args[2]
-				imgID = args[3]
-				validityCenter = (args[4][0]-offsetX,args[4][1]-offsetY)
-				validityRadius = args[5]
-				argLen = len(args)
+			elif _is_task_job(args):
+				(_, batch, taskIndex, function, functionArgs) = args
+				del args
 
+				#the messages are sent with the result, for the process manager to log them in the order of the tasks
+				log.start_capture()
+				try:
+					(success, result) = (True, function(*functionArgs))
+				except Exception as e:
+					(success, result) = (False, e)
+				messages = log.stop_capture()
+				del functionArgs
+				taskResultQueue.put((batch, taskIndex, success, result, messages))
+				del result
+
+			elif _is_frame_job(args):
+				(_, frameIndex, frameShape, frameOffsetX, frameOffsetY, spots, pixels) = args
 				del args
 
-				(benchSlot, startingPoint, repetition, step, axis, direction, centroidType) =  mm.get_img_ID(np.int64(imgID))
-
-				# result = cc.compute_centroid(image, cameraProps, imageID)
-				if centroidType == DEFINES.MM_IMG_ID_XY_IDENTIFIER:
-					if argLen>4:
-						(image,addedOffsetX,addedOffsetY) = mm.computeValidSoftROI(image, cameraXYparams.maxX, cameraXYparams.maxY, validityCenter, validityRadius)
-						offsetX += addedOffsetX
-						offsetY += addedOffsetY
-					cameraXYparams.ROIoffsetX = offsetX
-					cameraXYparams.ROIoffsetY = offsetY
-					result = cc.compute_centroid(image,cameraXYparams,imgID)
-					# if logQueue is not None:
-					# 	logQueue.put((DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,f'Size in memory: xCorr: {cameraXYparams.xCorr.size*cameraXYparams.xCorr.itemsize} Bytes; yCorr: {cameraXYparams.yCorr.size*cameraXYparams.yCorr.itemsize} Bytes',False,False))
-					# else:
-					# 	log.message(DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,f'Size in memory: xCorr: {cameraXYparams.xCorr.size*cameraXYparams.xCorr.itemsize} Bytes; yCorr: {cameraXYparams.yCorr.size*cameraXYparams.yCorr.itemsize} Bytes',False,False)
-					
-				elif centroidType == DEFINES.MM_IMG_ID_TILT_IDENTIFIER:
-					cameraTiltparams.ROIoffsetX = offsetX
-					cameraTiltparams.ROIoffsetY = offsetX
-					result = cc.compute_centroid(image,cameraTiltparams,imgID)
-				else:
-					result = (np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,imgID)
-
-				if np.isnan(result[0]) and logQueue is not None:
-					logQueue.put((DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,'No centroid could be found',False,False))
-
-				outputList.append(result)
-				
+				try:
+					if frameIndex is None:
+						frame = pixels
+					else:
+						frame = frameBuffer.get_frame(frameIndex, frameShape)
+
+					#All the spots of a frame come from the same camera
+					centroidType = mm.get_img_ID(np.int64(spots[0][0]))[6]
+					if centroidType == DEFINES.MM_IMG_ID_XY_IDENTIFIER:
+						cameraParams = cameraXYparams
+					elif centroidType == DEFINES.MM_IMG_ID_TILT_IDENTIFIER:
+						cameraParams = cameraTiltparams
+					else:
+						cameraParams = None
+
+					#The spots without ROI are searched in the whole frame. If there are several, they are all extracted in one pass,
+					#unless their validity circles are small and far apart enough to be cheaper to process separately
+					frameSpots = [spot for spot in spots if spot[1] is None]
+					radii = [spot[3] for spot in frameSpots]
+					if DEFINES.PC_IMAGE_GET_ALL_ROI not in radii and len(frameSpots) > 0:
+						unionWidth = max([spot[2][0]+spot[3] for spot in frameSpots])-min([spot[2][0]-spot[3] for spot in frameSpots])
+						unionHeight = max([spot[2][1]+spot[3] for spot in frameSpots])-min([spot[2][1]-spot[3] for spot in frameSpots])
+						separateArea = sum([4*radius**2 for radius in radii])
+					else:
+						(unionWidth, unionHeight, separateArea) = (0, 0, 0)
+					if len(frameSpots) < 2 or not DEFINES.CC_MULTI_SPOT_EXTRACTION_ENABLE or unionWidth*unionHeight > separateArea:
+						frameSpots = []
+					else:
+						spots = [spot for spot in spots if spot[1] is not None]
+
+					#Cut the other spots out of the frame. Crops are copies, so the frame can be released once they are computed
+					images = []
+					offsetsX = []
+					offsetsY = []
+					imgIDs = []
+					predictions = []
+					for (imgID, ROI, validityCenter, validityRadius) in spots:
+						if ROI is None:
+							(image, offsetX, offsetY) = (frame, 0, 0)
+						else:
+							(image, offsetX, offsetY) = mm.cropImage(frame, (ROI[0]-frameOffsetX, ROI[1]-frameOffsetY, ROI[2], ROI[3]), frameShape[1], frameShape[0])
+						validityCenter = (validityCenter[0]-frameOffsetX-offsetX, validityCenter[1]-frameOffsetY-offsetY)
+						(image,addedOffsetX,addedOffsetY) = mm.computeValidSoftROI(image, image.shape[1], image.shape[0], validityCenter, validityRadius)
+						images.append(image)
+						offsetsX.append(frameOffsetX+offsetX+addedOffsetX)
+						offsetsY.append(frameOffsetY+offsetY+addedOffsetY)
+						imgIDs.append(imgID)
+						#the spot is expected at the center of its ROI
+						if ROI is None:
+							predictions.append(None)
+						else:
+							predictions.append((ROI[0]-offsetsX[-1], ROI[1]-offsetsY[-1]))
+
+					results = []
+					if cameraParams is None:
+						results = [(np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,np.nan,spot[0]) for spot in frameSpots+spots]
+					else:
+						if len(frameSpots) > 0:
+							results += cc.compute_centroids_frame(	frame, cameraParams, frameOffsetX, frameOffsetY,\
+																	[spot[0] for spot in frameSpots],\
+																	[(spot[2][0]-frameOffsetX, spot[2][1]-frameOffsetY) for spot in frameSpots],\
+																	[spot[3] for spot in frameSpots],\
+																	spotFitter)
+						if len(images) > 0:
+							results += cc.compute_centroids_batch(images, cameraParams, offsetsX, offsetsY, imgIDs, spotFitter, predictions)
+				finally:
+					if frameIndex is not None:
+						frameBuffer.release_frame(frameIndex)
+
+				for result in results:
+					if np.isnan(result[0]) and logQueue is not None:
+						logQueue.put((DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,'No centroid could be found',False,False))
+					if not resultTable.store(result, spotFitter.pop_fallback(int(result[7]))) and logQueue is not None:
+						logQueue.put((DEFINES.LOG_MESSAGE_PRIORITY_WARNING,0,'A centroid result does not fit in the result table',False,False))
+
 			inputQueue.task_done()
 
 	except KeyboardInterrupt:
@@ -204,7 +587,7 @@ def centroids_calculation_process(inputQueue, outputList, logQueue, cameraXYpara
 	except OSError:
 		return	
 
-def livePlot_process(plotQueue, centroidsResults, xMax, yMax, nbSlots):
+def livePlot_process(plotQueue, resultTable, xMax, yMax, nbSlots):
 	#create the live plot instance
 	np.warnings.filterwarnings('ignore')
 
@@ -238,6 +621,7 @@ def livePlot_process(plotQueue, centroidsResults, xMax, yMax, nbSlots):
 
 			tCurrent = time.perf_counter()
 			if order == DEFINES.PROCESSES_POISON_PILL:
+				resultTable.close()
 				return
 			elif order == DEFINES.PROCESSES_CLEAR_LIVEPLOT:
 				
@@ -257,11 +641,10 @@ def livePlot_process(plotQueue, centroidsResults, xMax, yMax, nbSlots):
 				t0 = time.perf_counter()
 
 				#get the n last centroids
-				try:
-					lastCentroid = len(centroidsResults)
-					allCentroids = centroidsResults[firstCentroid:lastCentroid]
-				except EOFError:
-					pass
+				lastCentroid = resultTable.get_length()
+				if lastCentroid < firstCentroid:
+					firstCentroid = 0 #the results were cleared for a new run
+				allCentroids = resultTable.get_results(firstCentroid, lastCentroid)
 
 				firstCentroid = lastCentroid
 				
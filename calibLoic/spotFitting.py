@@ -0,0 +1,337 @@
+#cython: language_level=3
+import numpy as np
+from scipy import optimize
+import miscmath as mm
+import DEFINES
+
+SF_NB_PARAMETERS	= 6 #(height, x, y, width_x, width_y, n)
+
+def super_gaussian(params, x, y):
+	"""Evaluates the super-gaussian height*exp(-(((x0-x)/wx)**2/2+((y0-y)/wy)**2/2)**n).
+	params is (...,6) as (height, x, y, width_x, width_y, n), its leading dimensions broadcast with x and y"""
+	(height, x0, y0, wx, wy, n) = _split_params(params, x.ndim)
+	quadratic = (((x0-x)/wx)**2+((y0-y)/wy)**2)/2
+	return height*np.exp(-quadratic**n)
+
+def super_gaussian_jacobian(params, x, y):
+	"""Returns the model and its analytic derivatives (...,rows,cols,6) with respect to
+	(height, x, y, width_x, width_y, n)"""
+	(height, x0, y0, wx, wy, n) = _split_params(params, x.ndim)
+	u = (x0-x)/wx
+	v = (y0-y)/wy
+	quadratic = (u**2+v**2)/2
+	with np.errstate(divide = 'ignore', invalid = 'ignore'):
+		power = quadratic**n
+		expTerm = np.exp(-power)
+		model = height*expTerm
+		#d(model)/d(quadratic), the center pixel has a null derivative for n >= 1
+		dQuadratic = np.where(quadratic > 0, -model*n*power/quadratic, 0)
+		dN = np.where(quadratic > 0, -model*power*np.log(quadratic), 0)
+
+	jacobian = np.stack((	np.broadcast_to(expTerm, model.shape),\
+							dQuadratic*u/wx,\
+							dQuadratic*v/wy,\
+							-dQuadratic*u**2/wx,\
+							-dQuadratic*v**2/wy,\
+							dN), axis = -1)
+	return model, jacobian
+
+def _split_params(params, nbImageDims):
+	params = np.asarray(params, dtype = np.float64)
+	return [params[...,k].reshape(params.shape[:-1]+(1,)*min(nbImageDims, 2)) for k in range(0,SF_NB_PARAMETERS)]
+
+def thresholded_jacobian(params, x, y, data_min, data_max):
+	"""Model clipped to [data_min, data_max] and its jacobian. The clipped pixels do not depend on the parameters"""
+	(model, jacobian) = super_gaussian_jacobian(params, x, y)
+	data_max = np.asarray(data_max, dtype = np.float64).reshape(np.shape(data_max)+(1,)*min(x.ndim, 2))
+	clipped = np.logical_or(model < data_min, model > data_max)
+	jacobian = np.where(clipped[...,np.newaxis], 0, jacobian)
+	return np.clip(model, data_min, data_max), jacobian
+
+def fit_spot(data, Xin, Yin, data_min, data_max, optimizerTolerance, estimate = None, fixedExponent = None):
+	"""Returns (height, x, y, width_x, width_y, n) the super-gaussian parameters of a 2D distribution
+	found by a fit with an analytic jacobian. estimate seeds the fit, the moments are used otherwise.
+	If fixedExponent is given, n is not fitted"""
+	Xin = Xin.astype(np.float64)
+	Yin = Yin.astype(np.float64)
+	data = data.astype(np.float64)
+
+	if estimate is None:
+		estimate = mm.moments(data,Xin,Yin)
+	estimate = np.array(estimate, dtype = np.float64)
+	if fixedExponent is not None:
+		estimate[5] = fixedExponent
+	fittedParams = slice(0, SF_NB_PARAMETERS-1) if fixedExponent is not None else slice(0, SF_NB_PARAMETERS)
+
+	def get_params(p):
+		params = estimate.copy()
+		params[fittedParams] = p
+		return params
+
+	def errorfunction(p):
+		return np.ravel(np.clip(super_gaussian(get_params(p),Xin,Yin), data_min, data_max) - data)
+
+	def jacobianfunction(p):
+		(_, jacobian) = thresholded_jacobian(get_params(p), Xin, Yin, data_min, data_max)
+		return jacobian.reshape(-1, SF_NB_PARAMETERS)[:,fittedParams]
+
+	if data.size >= SF_NB_PARAMETERS:
+		(p, success) = optimize.leastsq(errorfunction, estimate[fittedParams], Dfun = jacobianfunction, ftol = optimizerTolerance, maxfev = DEFINES.CC_SPOT_FIT_MAX_EVALUATIONS)
+		estimate = get_params(p)
+
+	return estimate
+
+def fit_spots(data, Xin, Yin, mask, data_min, data_max, optimizerTolerance, estimates = None, fixedExponent = None):
+	"""Returns a (N,6) array of (height, x, y, width_x, width_y, n) the super-gaussian parameters of a stack
+	of 2D distributions found by a batched Levenberg-Marquardt fit with an analytic jacobian.
+	data, Xin, Yin and mask are (N,rows,cols), data_max is (N,). The rows of estimates that are not finite
+	are seeded with the moments"""
+	data = data.astype(np.float64)
+	Xin = Xin.astype(np.float64)
+	Yin = Yin.astype(np.float64)
+	mask = mask.astype(bool)
+	data_max = np.broadcast_to(np.asarray(data_max, dtype = np.float64), (data.shape[0],))
+	nbSpots = data.shape[0]
+	fittedParams = slice(0, SF_NB_PARAMETERS-1) if fixedExponent is not None else slice(0, SF_NB_PARAMETERS)
+	nbParams = len(range(SF_NB_PARAMETERS)[fittedParams])
+
+	with np.errstate(all = 'ignore'):
+		estimate = mm.moments_batch(data,Xin,Yin,mask)
+		if estimates is not None:
+			seeded = np.all(np.isfinite(estimates), axis = 1)
+			estimate[seeded] = estimates[seeded]
+		if fixedExponent is not None:
+			estimate[:,5] = fixedExponent
+
+		#Only fit the spots that have enough pixels, as fit_spot does
+		active = np.logical_and(np.sum(mask, axis = (1,2)) >= SF_NB_PARAMETERS, np.all(np.isfinite(estimate), axis = 1))
+		damping = np.full(nbSpots, DEFINES.CC_BATCH_LM_INITIAL_DAMPING)
+		cost = np.full(nbSpots, np.inf)
+		spots = np.flatnonzero(active)
+		cost[spots] = _batch_cost(estimate[spots], data[spots], Xin[spots], Yin[spots], mask[spots], data_min, data_max[spots])
+
+		for iteration in range(0,DEFINES.CC_BATCH_LM_MAX_ITERATIONS):
+			spots = np.flatnonzero(active)
+			if spots.size < 1:
+				break
+
+			params = estimate[spots]
+			spotArgs = (data[spots], Xin[spots], Yin[spots], mask[spots], data_min, data_max[spots])
+			(model, jacobian) = thresholded_jacobian(params, spotArgs[1], spotArgs[2], data_min, spotArgs[5])
+			residuals = np.where(spotArgs[3], model-spotArgs[0], 0).reshape(spots.size,-1)
+			jacobian = np.where(spotArgs[3][...,np.newaxis], jacobian, 0)[...,fittedParams].reshape(spots.size,-1,nbParams)
+
+			#Solve the damped normal equations of all the spots at once
+			JtJ = np.einsum('npk,npl->nkl', jacobian, jacobian)
+			Jtr = np.einsum('npk,np->nk', jacobian, residuals)
+			diagonal = damping[spots,np.newaxis]*np.diagonal(JtJ, axis1 = 1, axis2 = 2)+DEFINES.CC_BATCH_LM_REGULARIZATION
+			try:
+				step = -np.linalg.solve(JtJ+diagonal[:,:,np.newaxis]*np.eye(nbParams), Jtr[:,:,np.newaxis])[:,:,0]
+			except np.linalg.LinAlgError:
+				step = -np.einsum('nkl,nl->nk', np.linalg.pinv(JtJ+diagonal[:,:,np.newaxis]*np.eye(nbParams)), Jtr)
+
+			newParams = params.copy()
+			newParams[:,fittedParams] += step
+			newCost = _batch_cost(newParams, *spotArgs)
+			oldCost = cost[spots]
+			improved = newCost < oldCost
+
+			estimate[spots[improved]] = newParams[improved]
+			cost[spots[improved]] = newCost[improved]
+			damping[spots] = np.where(improved, damping[spots]*DEFINES.CC_BATCH_LM_DAMPING_DECREASE, damping[spots]*DEFINES.CC_BATCH_LM_DAMPING_INCREASE)
+
+			#Stop the spots that converged or can not be improved anymore
+			converged = np.logical_and(improved, (oldCost-newCost) <= optimizerTolerance*oldCost)
+			converged = np.logical_or(converged, np.linalg.norm(step, axis = 1) <= DEFINES.CC_BATCH_LM_PARAMETER_TOLERANCE*np.linalg.norm(params[:,fittedParams], axis = 1))
+			stalled = damping[spots] > DEFINES.CC_BATCH_LM_MAX_DAMPING
+			active[spots[np.logical_or(converged, stalled)]] = False
+
+	return estimate
+
+def center_of_mass(data, Xin, Yin, data_min, data_max):
+	"""Returns (height, x, y, width_x, width_y, n) estimated by the center of mass of the pixels above data_min,
+	iterated in a window of CC_FAST_CENTROID_WINDOW_SIGMA widths around the spot. None if it can not be computed"""
+	weights = data-data_min
+	window = np.ones(data.shape, dtype = bool)
+	for iteration in range(0,DEFINES.CC_FAST_CENTROID_ITERATIONS):
+		windowWeights = np.where(window, weights, 0)
+		total = np.sum(windowWeights)
+		if not total > 0:
+			return None
+		x = np.sum(Xin*windowWeights)/total
+		y = np.sum(Yin*windowWeights)/total
+		width_x = np.sqrt(np.sum((Xin-x)**2*windowWeights)/total)
+		width_y = np.sqrt(np.sum((Yin-y)**2*windowWeights)/total)
+		if not (width_x > 0 and width_y > 0):
+			return None
+		window = ((Xin-x)/width_x)**2+((Yin-y)/width_y)**2 <= DEFINES.CC_FAST_CENTROID_WINDOW_SIGMA**2
+	return np.array([np.max(data), x, y, width_x, width_y, 1])
+
+def quadratic_peak(data, Xin, Yin, data_min, data_max):
+	"""Returns (height, x, y, width_x, width_y, n) estimated by the peak of a quadratic fitted on the logarithm
+	of the pixels that are neither under data_min nor saturated at data_max. None if it can not be computed"""
+	valid = np.logical_and(data > data_min, data < data_max)
+	if np.sum(valid) < SF_NB_PARAMETERS:
+		return None
+	peak = np.unravel_index(np.argmax(data), data.shape)
+	dx = Xin[valid]-Xin[peak]
+	dy = Yin[valid]-Yin[peak]
+	design = np.stack((np.ones(dx.shape), dx, dy, dx**2, dy**2, dx*dy), axis = 1)
+	(c, _, rank, _) = np.linalg.lstsq(design, np.log(data[valid]), rcond = None)
+	if rank < SF_NB_PARAMETERS:
+		return None
+
+	#The peak is where the gradient is null, the quadratic must be concave
+	hessian = np.array([[2*c[3], c[5]], [c[5], 2*c[4]]])
+	if not (c[3] < 0 and c[4] < 0 and np.linalg.det(hessian) > 0):
+		return None
+	(x, y) = np.linalg.solve(hessian, -c[1:3])
+	height = np.exp(c[0]+c[1]*x+c[2]*y+c[3]*x**2+c[4]*y**2+c[5]*x*y)
+	return np.array([height, Xin[peak]+x, Yin[peak]+y, np.sqrt(-1/(2*c[3])), np.sqrt(-1/(2*c[4])), 1])
+
+def _batch_cost(params, data, Xin, Yin, mask, data_min, data_max):
+	model = np.clip(super_gaussian(params, Xin, Yin), data_min, data_max[:,np.newaxis,np.newaxis])
+	return np.sum(np.where(mask, model-data, 0)**2, axis = (1,2))
+
+class SpotFitter:
+	"""Fits the spots of the successive images of a run. The solution of each (bench slot, centroid type)
+	is kept to seed its next fit, as consecutive steps only move the spot slightly.
+	In the fast centroid modes, the spot is first estimated by the center of mass or by the quadratic peak
+	with the shape of the last fit of its slot. The full fit is only done if the width or the residual
+	of this estimate are out of tolerance, these fallbacks are reported by pop_fallback"""
+	__slots__ = (	'fixedExponent',\
+					'warmStart',\
+					'centroidMode',\
+					'previousSolutions',\
+					'referenceWidths',\
+					'fallbackIDs')
+
+	def __init__(self, fixedExponent = DEFINES.CC_SPOT_FIT_FIXED_EXPONENT, warmStart = DEFINES.CC_SPOT_FIT_WARM_START, centroidMode = DEFINES.CC_CENTROID_MODE_FIT):
+		self.fixedExponent		= fixedExponent
+		self.warmStart			= warmStart
+		self.centroidMode		= centroidMode
+		self.previousSolutions	= {}
+		self.referenceWidths	= {}
+		self.fallbackIDs		= set()
+
+	def reset(self):
+		self.previousSolutions	= {}
+		self.referenceWidths	= {}
+		self.fallbackIDs		= set()
+
+	def get_key(self, result_ID):
+		(benchSlot, _, _, _, _, _, centroidType) = mm.get_img_ID(np.int64(result_ID))
+		return (int(benchSlot), int(centroidType))
+
+	def get_seed(self, result_ID, Xin, Yin, colOrigin, rowOrigin):
+		#Previous solution of this slot moved in the cut-out coordinates, None if unusable
+		if not self.warmStart:
+			return None
+		seed = self.previousSolutions.get(self.get_key(result_ID))
+		if seed is None:
+			return None
+		seed = seed.copy()
+		seed[1] -= colOrigin
+		seed[2] -= rowOrigin
+		if seed[1] < np.min(Xin) or seed[1] > np.max(Xin) or seed[2] < np.min(Yin) or seed[2] > np.max(Yin):
+			return None
+		return seed
+
+	def store(self, result_ID, params, colOrigin, rowOrigin):
+		if not self.warmStart:
+			return
+		params = np.array(params, dtype = np.float64)
+		if not np.all(np.isfinite(params)):
+			return
+		params[1] += colOrigin
+		params[2] += rowOrigin
+		self.previousSolutions[self.get_key(result_ID)] = params
+
+	def get_estimator(self):
+		if self.centroidMode == DEFINES.CC_CENTROID_MODE_CENTER_OF_MASS:
+			return center_of_mass
+		elif self.centroidMode == DEFINES.CC_CENTROID_MODE_QUADRATIC_PEAK:
+			return quadratic_peak
+		else:
+			return None
+
+	def estimate(self, data, Xin, Yin, data_min, data_max, result_ID, colOrigin, rowOrigin):
+		#Fast estimate of the spot, None if the full fit is required
+		estimator = self.get_estimator()
+		seed = self.get_seed(result_ID, Xin, Yin, colOrigin, rowOrigin)
+		referenceWidths = self.referenceWidths.get(self.get_key(result_ID))
+		if estimator is None or seed is None or referenceWidths is None:
+			return None
+
+		with np.errstate(all = 'ignore'):
+			estimate = estimator(data, Xin, Yin, data_min, data_max)
+			if estimate is None or not np.all(np.isfinite(estimate)):
+				return None
+			if np.any(np.abs(estimate[3:5]/referenceWidths-1) > DEFINES.CC_FAST_CENTROID_WIDTH_TOLERANCE):
+				return None
+
+			#Keep the spot shape of the last fit, adjust the height on the unsaturated pixels and check the residual
+			estimate[3:6] = seed[3:6]
+			shape = super_gaussian(np.concatenate(([1], estimate[1:])), Xin, Yin)
+			valid = np.logical_and(data > data_min, data < data_max)
+			estimate[0] = np.sum(shape[valid]*data[valid])/np.sum(shape[valid]**2)
+			residual = np.sqrt(np.mean((np.clip(estimate[0]*shape, data_min, data_max)-data)**2))/data_max
+			if not residual <= DEFINES.CC_FAST_CENTROID_MAX_RESIDUAL:
+				return None
+
+		return estimate
+
+	def store_reference(self, data, Xin, Yin, data_min, data_max, result_ID):
+		#Widths of the fast estimator on a fully fitted spot, to which the next estimates are compared
+		estimator = self.get_estimator()
+		if estimator is None:
+			return
+		with np.errstate(all = 'ignore'):
+			estimate = estimator(data, Xin, Yin, data_min, data_max)
+		if estimate is not None and np.all(np.isfinite(estimate[3:5])):
+			self.referenceWidths[self.get_key(result_ID)] = estimate[3:5]
+
+	def pop_fallback(self, result_ID):
+		#True if the centroid of result_ID required the full fit in a fast centroid mode
+		if result_ID in self.fallbackIDs:
+			self.fallbackIDs.discard(result_ID)
+			return True
+		return False
+
+	def fit(self, data, Xin, Yin, data_min, data_max, optimizerTolerance, result_ID, colOrigin, rowOrigin):
+		"""colOrigin and rowOrigin place the cut-out coordinates in the frame, so that the seed follows the spot"""
+		params = self.estimate(data, Xin, Yin, data_min, data_max, result_ID, colOrigin, rowOrigin)
+		if params is None:
+			seed = self.get_seed(result_ID, Xin, Yin, colOrigin, rowOrigin)
+			params = fit_spot(data, Xin, Yin, data_min, data_max, optimizerTolerance, estimate = seed, fixedExponent = self.fixedExponent)
+			self.store_reference(data, Xin, Yin, data_min, data_max, result_ID)
+			if self.get_estimator() is not None:
+				self.fallbackIDs.add(int(result_ID))
+		self.store(result_ID, params, colOrigin, rowOrigin)
+		return params
+
+	def fit_batch(self, data, Xin, Yin, mask, data_min, data_max, optimizerTolerance, result_IDs, colOrigins, rowOrigins):
+		"""Same as fit for a stack of cut-outs, see fit_spots. The spots that can not be estimated are fitted together"""
+		data_max = np.broadcast_to(np.asarray(data_max, dtype = np.float64), (data.shape[0],))
+		params = np.full((data.shape[0], SF_NB_PARAMETERS), np.nan)
+		seeds = np.full((data.shape[0], SF_NB_PARAMETERS), np.nan)
+		for i in range(0,data.shape[0]):
+			estimate = self.estimate(data[i][mask[i]], Xin[i][mask[i]], Yin[i][mask[i]], data_min, data_max[i], result_IDs[i], colOrigins[i], rowOrigins[i])
+			if estimate is not None:
+				params[i] = estimate
+				continue
+			seed = self.get_seed(result_IDs[i], Xin[i][mask[i]], Yin[i][mask[i]], colOrigins[i], rowOrigins[i])
+			if seed is not None:
+				seeds[i] = seed
+
+		toFit = np.flatnonzero(np.logical_not(np.all(np.isfinite(params), axis = 1)))
+		if toFit.size > 0:
+			params[toFit] = fit_spots(data[toFit], Xin[toFit], Yin[toFit], mask[toFit], data_min, data_max[toFit], optimizerTolerance, estimates = seeds[toFit], fixedExponent = self.fixedExponent)
+			for i in toFit:
+				self.store_reference(data[i][mask[i]], Xin[i][mask[i]], Yin[i][mask[i]], data_min, data_max[i], result_IDs[i])
+				if self.get_estimator() is not None:
+					self.fallbackIDs.add(int(result_IDs[i]))
+
+		for i in range(0,data.shape[0]):
+			self.store(result_IDs[i], params[i], colOrigins[i], rowOrigins[i])
+		return params
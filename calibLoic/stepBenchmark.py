@@ -0,0 +1,306 @@
+#cython: language_level=3
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from scipy import interpolate
+import classCalibration as calib
+import classTest as test
+import classTestBench as tb
+import classCamera as cam
+import classCanCom as com
+import classConfig
+import processManager as proc
+import DEFINES
+import errors
+import tracing
+
+#Stages of a bench step, in their order in the step
+STAGES = (	'encode',\
+			'bus',\
+			'motion',\
+			'grab',\
+			'enqueue',\
+			'centroid',\
+			'scatter')
+
+class StageTimer:
+	"""Accumulates the time spent in each stage of the benchmarked run. Stages can be nested, the time of a stage
+	excludes the stages it contains. A held stage has no explicit end: it lasts until the next stage starts."""
+	__slots__ = (	'durations',\
+					'stack',\
+					'heldStage',\
+					'heldStart',\
+					'tStart',\
+					'tEnd')
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.durations	= dict([(stage, []) for stage in STAGES])
+		self.stack		= []
+		self.heldStage	= None
+		self.heldStart	= 0
+		self.tStart		= time.perf_counter()
+		self.tEnd		= None
+
+	def start(self, stage):
+		tNow = time.perf_counter()
+		self.release(tNow)
+		self.stack.append([stage, tNow, 0]) #stage, start time, time of the nested stages
+
+	def stop(self):
+		tNow = time.perf_counter()
+		(stage, tStart, tNested) = self.stack.pop()
+		self.durations[stage].append(tNow-tStart-tNested)
+		if len(self.stack) > 0:
+			self.stack[-1][2] += tNow-tStart
+
+	def hold(self, stage):
+		tNow = time.perf_counter()
+		self.release(tNow)
+		self.heldStage = stage
+		self.heldStart = tNow
+
+	def release(self, tNow):
+		if self.heldStage is not None:
+			self.durations[self.heldStage].append(tNow-self.heldStart)
+			self.heldStage = None
+
+	def finish(self):
+		self.tEnd = time.perf_counter()
+		self.release(self.tEnd)
+
+	def get_results(self, nbSlots):
+		#Returns the machine-readable latency breakdown of the run. The steps are counted by their image grab
+		wallTime	= (time.perf_counter() if self.tEnd is None else self.tEnd)-self.tStart
+		nbSteps		= len(self.durations['grab'])
+		stages		= {}
+		for stage in STAGES:
+			durations = np.array(self.durations[stage])
+			stages[stage] = {	'total':	float(np.sum(durations)),\
+								'perStep':	float(np.sum(durations)/max(nbSteps, 1)),\
+								'calls':	int(len(durations)),\
+								'mean':		float(np.mean(durations)) if len(durations) > 0 else None,\
+								'median':	float(np.median(durations)) if len(durations) > 0 else None,\
+								'p95':		float(np.percentile(durations, 95)) if len(durations) > 0 else None,\
+								'max':		float(np.max(durations)) if len(durations) > 0 else None}
+
+		return {	'nbSlots':				int(nbSlots),\
+					'nbSteps':				int(nbSteps),\
+					'wallTime':				float(wallTime),\
+					'stepsPerSecond':		float(nbSteps/wallTime) if wallTime > 0 else None,\
+					'centroidsPerSecond':	float(nbSteps*nbSlots/wallTime) if wallTime > 0 else None,\
+					'otherTime':			float(wallTime-sum([stages[stage]['total'] for stage in STAGES])),\
+					'stages':				stages}
+
+def _timed(stage, method):
+	#Wraps a method so that its calls are timed as the stage, on the timer of the instance
+	def timedMethod(self, *args, **kwargs):
+		self.timer.start(stage)
+		try:
+			return method(self, *args, **kwargs)
+		finally:
+			self.timer.stop()
+	return timedMethod
+
+class TimedCOM_handle(com.COM_handle):
+	#The encode stage also holds the decoding of the replies, the bus stage is the exchange of the frames
+	__slots__ = ('timer',)
+
+	CAN_write		= _timed('encode', com.COM_handle.CAN_write)
+	CAN_write_many	= _timed('encode', com.COM_handle.CAN_write_many)
+	_transfer		= _timed('bus', com.COM_handle._transfer)
+
+class TimedTestBench(tb.TestBench):
+	__slots__ = ('timer',)
+
+	wait_all_positioners = _timed('motion', tb.TestBench.wait_all_positioners)
+
+class TimedCamera(cam.Camera):
+	__slots__ = ('timer',)
+
+	grabFrame	= _timed('grab', cam.Camera.grabFrame)
+	getImage	= _timed('grab', cam.Camera.getImage)
+
+class TimedProcessManager(proc.ProcessManager):
+	#The centroid stage is the wait for the centroid processes: the queue join of the test run, or the results polling
+	#of the calibration run. The scatter stage lasts from the read of the results table until the next stage
+	__slots__ = (	'timer',\
+					'draining')
+
+	centroidQueuePutFrame	= _timed('enqueue', proc.ProcessManager.centroidQueuePutFrame)
+	centroidQueueJoin		= _timed('centroid', proc.ProcessManager.centroidQueueJoin)
+
+	def get_centroid_results_length(self):
+		if not self.draining:
+			self.draining = True
+			self.timer.start('centroid')
+		return super().get_centroid_results_length()
+
+	def get_centroids_table(self):
+		if self.draining:
+			self.draining = False
+			self.timer.stop()
+		self.timer.hold('scatter')
+		return super().get_centroids_table()
+
+def get_bench_layout(nbSlots, physics, width = DEFINES.PC_CAMERA_SYNTHETIC_WIDTH, height = DEFINES.PC_CAMERA_SYNTHETIC_HEIGHT):
+	#Returns the slots centers [mm] on a grid of non-overlapping workspaces, and the camera scale factor [mm/px] fitting them in the sensor
+	pitch		= 2*(physics.lengthAlpha+physics.lengthBeta+DEFINES.PC_IMAGE_SOFT_ROI_MARGIN)
+	nbColumns	= int(np.ceil(np.sqrt(nbSlots*width/height)))
+	nbRows		= int(np.ceil(nbSlots/nbColumns))
+	centers		= [((slot%nbColumns+0.5)*pitch, (slot//nbColumns+0.5)*pitch) for slot in range(0, nbSlots)]
+	scaleFactor = max(nbColumns*pitch/width, nbRows*pitch/height)
+	return centers, scaleFactor
+
+def init_bench(nbSlots, timer, motionTimeScale = DEFINES.BENCHMARK_MOTION_TIME_SCALE, cameraOptions = {}):
+	#Returns the simulated testbench and the started process manager. The positioners are calibrated with their exact
+	#model, so that the synthetic spots are where the runs expect them
+	testBench					= TimedTestBench()
+	testBench.timer				= timer
+	testBench.benchName			= f'Benchmark {nbSlots} slots'
+	testBench.canUSB			= TimedCOM_handle()
+	testBench.canUSB.timer		= timer
+	testBench.canUSBSimulator	= {'nbPositioners': nbSlots, 'motionTimeScale': motionTimeScale}
+	testBench.nbSlots			= nbSlots
+	testBench.maxSlots			= nbSlots
+	testBench.clear_slots()
+
+	testBench.init_canUSB()
+	testBench.init_positioners()
+
+	(centers, scaleFactor)			= get_bench_layout(nbSlots, testBench.positioners[0].physics, **dict([(key, cameraOptions[key]) for key in ('width', 'height') if key in cameraOptions]))
+	testBench.slotsCenters			= np.array(centers)
+	testBench.originalSlotsCenters	= np.array(centers)
+	testBench.slotsExposures		= [DEFINES.PC_CAMERA_XY_DEFAULT_EXPOSURE]*nbSlots
+	for (slot, positioner) in enumerate(testBench.positioners):
+		positioner.benchSlot		= slot
+		positioner.model.centerX	= centers[slot][0]
+		positioner.model.centerY	= centers[slot][1]
+		positioner.model.getCorrectedAlpha	= interpolate.interp1d([-2*np.pi, 4*np.pi], [-2*np.pi, 4*np.pi], kind = 'linear', fill_value = 'extrapolate')
+		positioner.model.getCorrectedBeta	= interpolate.interp1d([-2*np.pi, 4*np.pi], [-2*np.pi, 4*np.pi], kind = 'linear', fill_value = 'extrapolate')
+		positioner.calibrated		= True
+
+	testBench.XYCameraID		= DEFINES.BENCHMARK_CAMERA_ID
+	testBench.cameraSimulator	= dict([('scaleFactor', scaleFactor)]+list(cameraOptions.items()))
+	testBench.cameraXY			= TimedCamera(DEFINES.PC_CAMERA_TYPE_XY, testBench.XYCameraID, testBench.get_camera_backend(testBench.XYCameraID))
+	testBench.cameraXY.timer	= timer
+	testBench.cameraXY.setDistortionCorrection(classConfig.Config())
+
+	processManager			= TimedProcessManager()
+	processManager.timer	= timer
+	processManager.draining	= False
+	processManager.start_centroid_processes(testBench.cameraXY.parameters)
+
+	return testBench, processManager
+
+def run_calibration(testBench, processManager, nbSteps):
+	#One starting point and one repetition on the alpha axis, in one direction
+	parameters							= calib.Parameters()
+	parameters.numberOfStartingPoints	= 1
+	parameters.numberOfRepetitions		= 1
+	parameters.numberOfStepsPerCircle	= nbSteps
+	parameters.axesToTest				= [DEFINES.PARAM_AXIS_ALPHA]
+	parameters.hysteresisEnable			= False
+
+	results = [calib.Results() for slot in range(0, testBench.nbSlots)]
+	calib.run(testBench, parameters, results, classConfig.Config(), processManager)
+	return results
+
+def run_test(testBench, processManager, nbSteps):
+	#nbSteps targets, reached with their correction moves
+	parameters						= test.Parameters()
+	parameters.nbTargets			= nbSteps
+	parameters.numberOfRepetitions	= 1
+
+	results = [test.Results() for slot in range(0, testBench.nbSlots)]
+	test.run(testBench, parameters, results, classConfig.Config(), processManager)
+	return results
+
+LOOPS = {	'calibration':	run_calibration,\
+			'test':			run_test}
+
+def benchmark(loop, nbSlots, nbSteps, motionTimeScale = DEFINES.BENCHMARK_MOTION_TIME_SCALE, cameraOptions = {}, traceFileName = None):
+	#Runs one loop on a simulated bench and returns its latency breakdown. The spans of the run are saved as a Chrome trace if traceFileName is given
+	if loop not in LOOPS:
+		raise errors.Error(f'Unknown benchmark loop {loop}') from None
+
+	if traceFileName is not None:
+		tracing.clear()
+		tracing.enable()
+
+	timer = StageTimer()
+	(testBench, processManager) = init_bench(nbSlots, timer, motionTimeScale, cameraOptions)
+	try:
+		timer.reset()
+		LOOPS[loop](testBench, processManager, nbSteps)
+		timer.finish()
+	finally:
+		processManager.stop_centroid_processes()
+		testBench.close_handles()
+		if traceFileName is not None:
+			processManager.export_trace(traceFileName)
+			tracing.disable()
+
+	results = timer.get_results(nbSlots)
+	results['loop'] = loop
+	results['nbRequestedSteps'] = int(nbSteps)
+	return results
+
+def get_environment():
+	#Identifies the code version and the machine the results were measured with
+	try:
+		gitCommit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, timeout = 5).stdout.strip() or None
+	except (OSError, subprocess.SubprocessError):
+		gitCommit = None
+
+	return {	'gitCommit':	gitCommit,\
+				'date':			time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(time.time())),\
+				'python':		platform.python_version(),\
+				'numpy':		np.__version__,\
+				'platform':		platform.platform(),\
+				'processor':	platform.processor(),\
+				'cpuCount':		os.cpu_count()}
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = 'Step latency and throughput of the calibration and test runs, on the simulated CAN-USB and cameras')
+	parser.add_argument('--loops', nargs = '+', choices = list(LOOPS.keys()), default = list(LOOPS.keys()))
+	parser.add_argument('--slots', nargs = '+', type = int, default = DEFINES.BENCHMARK_SLOT_COUNTS, help = 'numbers of bench slots')
+	parser.add_argument('--steps', nargs = '+', type = int, default = DEFINES.BENCHMARK_STEP_COUNTS, help = 'numbers of calibration steps or test targets')
+	parser.add_argument('--motion-time-scale', type = float, default = DEFINES.BENCHMARK_MOTION_TIME_SCALE, help = 'duration of the simulated moves relative to the real ones')
+	parser.add_argument('--camera', type = json.loads, default = {}, help = 'JSON options of the synthetic camera, e.g. \'{"readNoise": 0}\'')
+	parser.add_argument('--output', default = None, help = 'JSON results file. The results are printed if not given')
+	parser.add_argument('--trace', default = None, help = 'prefix of the Chrome trace files of the runs')
+	args = parser.parse_args(argv)
+
+	runs = []
+	for loop in args.loops:
+		for nbSlots in args.slots:
+			for nbSteps in args.steps:
+				traceFileName = None if args.trace is None else f'{args.trace}_{loop}_{nbSlots}slots_{nbSteps}steps.json'
+				results = benchmark(loop, nbSlots, nbSteps, args.motion_time_scale, args.camera, traceFileName)
+				runs.append(results)
+				print(f'{loop:<12} {nbSlots:>3} slots {results["nbSteps"]:>5} steps: {results["stepsPerSecond"]:8.2f} steps/s '+\
+						' '.join([f'{stage} {1000*results["stages"][stage]["perStep"]:.2f}' for stage in STAGES])+' [ms/step]', file = sys.stderr)
+
+	report = {	'benchmark':		'stepLatency',\
+				'formatVersion':	DEFINES.BENCHMARK_FORMAT_VERSION,\
+				'environment':		get_environment(),\
+				'options':			{'motionTimeScale': args.motion_time_scale, 'camera': args.camera},\
+				'runs':				runs}
+
+	if args.output is None:
+		json.dump(report, sys.stdout, indent = 4)
+		print()
+	else:
+		with open(args.output, 'w') as outFile:
+			json.dump(report, outFile, indent = 4)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,228 @@
+#cython: language_level=3
+import numpy as np
+import os
+import time
+import distortionMap as dm
+import spotFitting as sf
+import miscmath as mm
+import DEFINES
+
+#Returns the (x, y) position [mm] of the fiber of a positioner for commanded angles in degrees
+def get_spot_position(model, alphaAngle, betaAngle):
+	return mm.get_endpoint(	model.centerX, model.centerY, model.lengthAlpha, model.lengthBeta,\
+							alphaAngle*np.pi/180+model.offsetAlpha, betaAngle*np.pi/180+model.offsetBeta)
+
+class SyntheticNode:
+	"""Camera parameter, with the Value, Min and Max of the pypylon parameters"""
+	__slots__ = (	'Value',\
+					'Min',\
+					'Max')
+
+	def __init__(self, value, minimum = None, maximum = None):
+		self.Value	= value
+		self.Min	= minimum
+		self.Max	= maximum
+
+	def GetValue(self):
+		return self.Value
+
+	def SetValue(self, value):
+		self.Value = value
+
+class SyntheticDeviceInfo:
+	__slots__ = (	'serialNumber',\
+					'modelName')
+
+	def __init__(self, serialNumber, modelName):
+		self.serialNumber	= serialNumber
+		self.modelName		= modelName
+
+	def GetSerialNumber(self):
+		return str(self.serialNumber)
+
+	def GetModelName(self):
+		return self.modelName
+
+class SyntheticGrabResult:
+	__slots__ = ('Array',)
+
+	def __init__(self, array):
+		self.Array = array
+
+	def GrabSucceeded(self):
+		return True
+
+	def Release(self):
+		self.Array = None
+
+class SyntheticCameraHandle:
+	"""Stands for the pypylon InstantCamera. The frames are rendered by the backend from the ROI and exposure
+	set on the handle, at most at the backend frame rate."""
+	__slots__ = (	'backend',\
+					'deviceInfo',\
+					'isOpen',\
+					'nbFramesToGrab',\
+					'lastFrameTime',\
+					'Width',\
+					'Height',\
+					'OffsetX',\
+					'OffsetY',\
+					'ExposureTime',\
+					'Gain',\
+					'BlackLevel',\
+					'Gamma',\
+					'PixelFormat')
+
+	NODES_NAMES = ('Width', 'Height', 'OffsetX', 'OffsetY', 'ExposureTime', 'Gain', 'BlackLevel', 'Gamma', 'PixelFormat')
+
+	def __init__(self, backend, deviceInfo):
+		object.__setattr__(self, 'backend', backend)
+		object.__setattr__(self, 'deviceInfo', deviceInfo)
+		object.__setattr__(self, 'isOpen', False)
+		object.__setattr__(self, 'nbFramesToGrab', 0)
+		object.__setattr__(self, 'lastFrameTime', 0)
+		object.__setattr__(self, 'Width', SyntheticNode(backend.width, 1, backend.width))
+		object.__setattr__(self, 'Height', SyntheticNode(backend.height, 1, backend.height))
+		object.__setattr__(self, 'OffsetX', SyntheticNode(0, 0, backend.width-1))
+		object.__setattr__(self, 'OffsetY', SyntheticNode(0, 0, backend.height-1))
+		object.__setattr__(self, 'ExposureTime', SyntheticNode(backend.referenceExposure))
+		object.__setattr__(self, 'Gain', SyntheticNode(0.0))
+		object.__setattr__(self, 'BlackLevel', SyntheticNode(0.0))
+		object.__setattr__(self, 'Gamma', SyntheticNode(1.0))
+		object.__setattr__(self, 'PixelFormat', SyntheticNode(DEFINES.PC_CAMERA_PIXEL_FORMAT))
+
+	def __setattr__(self, name, value):
+		#As with pypylon, assigning a parameter sets its value
+		if name in self.NODES_NAMES and not isinstance(value, SyntheticNode):
+			getattr(self, name).Value = value
+		else:
+			object.__setattr__(self, name, value)
+
+	def Open(self):
+		self.isOpen = True
+
+	def Close(self):
+		self.isOpen = False
+		self.nbFramesToGrab = 0
+
+	def close(self):
+		self.Close()
+
+	def GetDeviceInfo(self):
+		return self.deviceInfo
+
+	def StartGrabbingMax(self, nbFrames):
+		self.nbFramesToGrab = nbFrames
+
+	def IsGrabbing(self):
+		return self.nbFramesToGrab > 0
+
+	def RetrieveResult(self, timeout, timeoutHandling = None):
+		self.nbFramesToGrab = max(self.nbFramesToGrab-1, 0)
+		return self.GrabOne(timeout)
+
+	def GrabOne(self, timeout):
+		#Wait for the next frame of the sensor
+		tFrame = self.lastFrameTime+1/self.backend.frameRate
+		tRemaining = tFrame-time.perf_counter()
+		if tRemaining > 0:
+			time.sleep(tRemaining)
+		self.lastFrameTime = time.perf_counter()
+
+		return SyntheticGrabResult(self.backend.render(	(int(self.OffsetY.Value), int(self.OffsetX.Value), int(self.Height.Value), int(self.Width.Value)),\
+														self.ExposureTime.Value, self.Gain.Value))
+
+class SyntheticBackend:
+	"""Camera backend rendering the fiber spots instead of grabbing them. spotsSource returns the (x, y) positions [mm]
+	of the spots when a frame is rendered. The spots are super-gaussians, distorted by the inverse of the camera
+	distortion map, over a bias with read and shot noise, saturated at the raw intensity limit."""
+	__slots__ = (	'serialNumber',\
+					'modelName',\
+					'width',\
+					'height',\
+					'frameRate',\
+					'scaleFactor',\
+					'spotsSource',\
+					'spotPeak',\
+					'spotWidth',\
+					'spotShape',\
+					'referenceExposure',\
+					'bias',\
+					'readNoise',\
+					'random',\
+					'distortionMap')
+
+	timeoutHandling = None
+
+	def __init__(	self, serialNumber = 0, spotsSource = None, modelName = 'Synthetic', width = DEFINES.PC_CAMERA_SYNTHETIC_WIDTH, height = DEFINES.PC_CAMERA_SYNTHETIC_HEIGHT,\
+					frameRate = DEFINES.PC_CAMERA_SYNTHETIC_FRAME_RATE, scaleFactor = DEFINES.PC_CAMERA_SYNTHETIC_SCALE_FACTOR, spotPeak = 0.8*DEFINES.PC_CAMERA_MAX_INTENSITY_RAW,\
+					spotWidth = DEFINES.PC_CAMERA_SYNTHETIC_SPOT_WIDTH, spotShape = 1, referenceExposure = DEFINES.PC_CAMERA_XY_DEFAULT_EXPOSURE,\
+					bias = DEFINES.PC_CAMERA_SYNTHETIC_BIAS, readNoise = DEFINES.PC_CAMERA_SYNTHETIC_READ_NOISE, seed = None):
+		self.serialNumber		= serialNumber
+		self.modelName			= modelName
+		self.width				= int(width)
+		self.height				= int(height)
+		self.frameRate			= frameRate			# [Hz]
+		self.scaleFactor		= scaleFactor		# [mm/px]
+		self.spotsSource		= spotsSource
+		self.spotPeak			= spotPeak			# raw intensity of the spots at the reference exposure
+		self.spotWidth			= spotWidth			# [px] standard deviation of the spots
+		self.spotShape			= spotShape			# super-gaussian exponent
+		self.referenceExposure	= referenceExposure	# [us]
+		self.bias				= bias
+		self.readNoise			= readNoise
+		self.random				= np.random.default_rng(seed)
+		self.distortionMap		= None
+
+	def enumerate_devices(self):
+		return [SyntheticDeviceInfo(self.serialNumber, self.modelName)]
+
+	def create_camera(self, deviceInfo):
+		return SyntheticCameraHandle(self, deviceInfo)
+
+	def load_distortion_map(self, fileName):
+		#The camera distortion file is used if it exists, otherwise the image is not distorted
+		if os.path.exists(fileName):
+			self.distortionMap = dm.DistortionMap(fileName)
+		else:
+			self.distortionMap = dm.DistortionMap(shape = (self.height, self.width))
+			self.distortionMap.scaleFactor = self.scaleFactor
+		return self.distortionMap
+
+	def get_raw_position(self, x, y):
+		#Returns the (row, col) pixel where the computed centroid of a spot at (x, y) [mm] is (y, x)/scaleFactor
+		scaleFactor = self.scaleFactor if self.distortionMap is None else self.distortionMap.scaleFactor
+		(row, col) = (y/scaleFactor, x/scaleFactor)
+		if self.distortionMap is not None and 0 <= row < self.distortionMap.shape[0] and 0 <= col < self.distortionMap.shape[1]:
+			(rowCorr, colCorr) = self.distortionMap.get_window(int(row), int(col), 1, 1, cache = False)
+			(row, col) = (row-float(rowCorr[0,0]), col-float(colCorr[0,0]))
+		return row, col
+
+	def render(self, ROI, exposure, gain):
+		(rowOffset, colOffset, nbRows, nbCols) = ROI
+		image = np.full((nbRows, nbCols), float(self.bias))
+
+		peak = self.spotPeak*exposure/self.referenceExposure*10**(gain/20)
+		halfWindow = int(np.ceil(DEFINES.PC_CAMERA_SYNTHETIC_SPOT_EXTENT*self.spotWidth))
+		spots = [] if self.spotsSource is None else self.spotsSource()
+		for (x, y) in spots:
+			(row, col) = self.get_raw_position(x, y)
+			row -= rowOffset
+			col -= colOffset
+
+			#Only render the spot neighbourhood
+			rowMin = max(int(row)-halfWindow, 0)
+			rowMax = min(int(row)+halfWindow+1, nbRows)
+			colMin = max(int(col)-halfWindow, 0)
+			colMax = min(int(col)+halfWindow+1, nbCols)
+			if rowMin >= rowMax or colMin >= colMax:
+				continue
+			(rowIn, colIn) = np.mgrid[rowMin:rowMax, colMin:colMax]
+			image[rowMin:rowMax, colMin:colMax] += sf.super_gaussian(np.array([peak, col, row, self.spotWidth, self.spotWidth, self.spotShape]), colIn, rowIn)
+
+		#Shot and read noise
+		if self.readNoise > 0:
+			image += self.random.standard_normal(image.shape)*np.sqrt(self.readNoise**2+np.maximum(image-self.bias, 0))
+
+		dtype = np.uint8 if DEFINES.PC_CAMERA_MAX_INTENSITY_RAW <= np.iinfo(np.uint8).max else np.uint16
+		return np.clip(np.rint(image), 0, DEFINES.PC_CAMERA_MAX_INTENSITY_RAW).astype(dtype)
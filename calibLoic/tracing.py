@@ -0,0 +1,121 @@
+#cython: language_level=3
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+import functools
+import DEFINES
+
+class _Tracer:
+	"""Spans of the current process. They are kept in a ring buffer, so a long run only keeps its latest events"""
+	__slots__ = (	'enabled',\
+					'events')
+
+	def __init__(self):
+		self.enabled	= False
+		self.events		= deque(maxlen = DEFINES.TRACE_BUFFER_CAPACITY)
+
+_tracer = _Tracer()
+
+def enable(capacity = DEFINES.TRACE_BUFFER_CAPACITY):
+	if _tracer.events.maxlen != capacity:
+		_tracer.events = deque(_tracer.events, maxlen = capacity)
+	_tracer.enabled = True
+
+def disable():
+	_tracer.enabled = False
+
+def is_enabled():
+	return _tracer.enabled
+
+def clear():
+	_tracer.events.clear()
+
+class span:
+	"""Times the enclosed block, as a context manager or with start and stop. The arguments are stored with the span.
+	Nothing is recorded while the tracing is disabled"""
+	__slots__ = (	'name',\
+					'category',\
+					'args',\
+					'tStart')
+
+	def __init__(self, name, category = '', **args):
+		self.name		= name
+		self.category	= category
+		self.args		= args
+		self.tStart		= None
+
+	def start(self):
+		if _tracer.enabled:
+			self.tStart = time.perf_counter_ns()
+		return self
+
+	def stop(self):
+		if self.tStart is not None:
+			_tracer.events.append((self.name, self.category, self.tStart, time.perf_counter_ns()-self.tStart, threading.get_ident(), self.args))
+			self.tStart = None
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, excType, excValue, traceback):
+		self.stop()
+		return False
+
+def traced(name = None, category = ''):
+	#Decorator timing each call of the function as a span, named after the function by default
+	def decorator(function):
+		spanName = function.__qualname__ if name is None else name
+
+		@functools.wraps(function)
+		def tracedFunction(*args, **kwargs):
+			if not _tracer.enabled:
+				return function(*args, **kwargs)
+			tStart = time.perf_counter_ns()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				_tracer.events.append((spanName, category, tStart, time.perf_counter_ns()-tStart, threading.get_ident(), None))
+		return tracedFunction
+	return decorator
+
+def get_events():
+	#Returns the recorded spans as Chrome trace complete events. The timestamps are in microseconds of the performance counter,
+	#which is shared by the processes of the machine
+	pid = os.getpid()
+	events = []
+	for (name, category, tStart, duration, tid, args) in list(_tracer.events):
+		event = {'name': name, 'cat': category, 'ph': 'X', 'ts': tStart/1000, 'dur': duration/1000, 'pid': pid, 'tid': tid}
+		if args:
+			event['args'] = dict([(key, value if isinstance(value, (int, float, str, bool)) or value is None else str(value)) for (key, value) in args.items()])
+		events.append(event)
+	return events
+
+def get_process_trace_fileName(processName):
+	#File in which a child process of this one saves its spans
+	return os.path.join(tempfile.gettempdir(), f'trace_{os.getpid()}_{processName}.json')
+
+def save_events(fileName):
+	with open(fileName, 'w') as outFile:
+		json.dump(get_events(), outFile)
+
+def export_chrome_trace(fileName, processesFileNames = ()):
+	#Writes the spans of this process and the ones saved by other processes as a Chrome trace (chrome://tracing, Perfetto)
+	events = get_events()
+	for processFileName in processesFileNames:
+		try:
+			with open(processFileName, 'r') as inFile:
+				events += json.load(inFile)
+		except (OSError, ValueError):
+			pass
+
+	filePath = os.path.dirname(fileName)
+	if filePath != '':
+		os.makedirs(filePath, exist_ok = True)
+	with open(fileName, 'w') as outFile:
+		json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, outFile)
+
+if DEFINES.TRACE_ENABLE:
+	enable()